@@ -1 +1,49 @@
-# Initialize app package 
\ No newline at end of file
+import os
+from flask import Flask
+from flask_cors import CORS
+from flask_jwt_extended import JWTManager
+from dotenv import load_dotenv
+from app.utils.pagination import NEXT_CURSOR_HEADER
+
+# Load environment variables
+load_dotenv()
+
+def create_app(start_job_worker=None):
+    """
+    Creates the Flask app.
+    
+    Args:
+        start_job_worker (bool, optional): Whether to process background jobs in this
+            process; defaults to the JOB_WORKER_EMBEDDED setting
+    """
+    # Initialize Flask app
+    app = Flask(__name__)
+    
+    # Configure app
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
+    
+    # Initialize extensions
+    # Browsers only let clients read the pagination cursor if it is exposed
+    CORS(app, expose_headers=[NEXT_CURSOR_HEADER])
+    JWTManager(app)
+    
+    # Register blueprints
+    from app.routes.exam_routes import exam_bp
+    from app.routes.study_plan_routes import study_plan_bp
+    from app.routes.quiz_routes import quiz_bp
+    from app.routes.job_routes import job_bp
+    
+    app.register_blueprint(exam_bp, url_prefix='/api')
+    app.register_blueprint(study_plan_bp, url_prefix='/api')
+    app.register_blueprint(quiz_bp, url_prefix='/api')
+    app.register_blueprint(job_bp, url_prefix='/api')
+    
+    # Process queued background jobs in this process unless dedicated workers are used
+    if start_job_worker is None:
+        start_job_worker = os.getenv('JOB_WORKER_EMBEDDED', '1') == '1'
+    if start_job_worker:
+        from app.services.job_worker import start_embedded_worker
+        start_embedded_worker()
+    
+    return app
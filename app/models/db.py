@@ -1,5 +1,10 @@
 import os
-from supabase import create_client, Client
+import threading
+from dataclasses import dataclass, field
+from typing import List, Dict, Any
+import httpx
+from postgrest import SyncPostgrestClient, AsyncPostgrestClient
+from postgrest.exceptions import APIError
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -9,9 +14,204 @@ load_dotenv()
 supabase_url = os.getenv('SUPABASE_URL')
 supabase_key = os.getenv('SUPABASE_KEY')
 
-# Create Supabase client
-supabase = create_client(supabase_url, supabase_key)
+# Maximum number of rows sent in a single multi-row insert
+BULK_INSERT_CHUNK_SIZE = int(os.getenv('BULK_INSERT_CHUNK_SIZE', '500'))
 
-def get_supabase_client() -> Client:
-    """Returns the Supabase client instance."""
-    return supabase 
\ No newline at end of file
+# HTTP settings of the shared Supabase connection pool
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '30'))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '5'))
+# Seconds a request waits for a free connection when the pool is exhausted
+SUPABASE_POOL_TIMEOUT = float(os.getenv('SUPABASE_POOL_TIMEOUT', '10'))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS', '20'))
+SUPABASE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('SUPABASE_MAX_KEEPALIVE_CONNECTIONS', '10'))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv('SUPABASE_KEEPALIVE_EXPIRY', '60'))
+
+_http_client = None
+_async_http_client = None
+_http_client_lock = threading.Lock()
+_local = threading.local()
+_async_postgrest = None
+
+def _http_settings() -> Dict[str, Any]:
+    return {
+        "base_url": f"{supabase_url}/rest/v1",
+        "headers": {
+            "apikey": supabase_key,
+            "Authorization": f"Bearer {supabase_key}",
+            "Accept-Profile": "public",
+            "Content-Profile": "public"
+        },
+        "timeout": httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT, pool=SUPABASE_POOL_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY
+        ),
+        "follow_redirects": True,
+        "http2": True
+    }
+
+def get_http_client() -> httpx.Client:
+    """
+    Returns the process-wide connection pool to the Supabase REST API.
+    
+    The pool is thread-safe; every thread's PostgREST client sends its requests through it.
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(**_http_settings())
+    return _http_client
+
+class _PooledPostgrestClient(SyncPostgrestClient):
+    """PostgREST client that uses the shared connection pool instead of opening its own."""
+
+    def create_session(self, *args, **kwargs):
+        return get_http_client()
+
+class _AsyncPooledPostgrestClient(AsyncPostgrestClient):
+    """Async PostgREST client that uses the shared async connection pool."""
+
+    def create_session(self, *args, **kwargs):
+        global _async_http_client
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(**_http_settings())
+        return _async_http_client
+
+def table(name: str):
+    """
+    Starts a query on a table, e.g. table('exams').select('*').eq('id', exam_id).execute().
+    
+    Each thread has its own PostgREST client, so the query state of concurrent
+    requests and background jobs is never shared; their connections come from
+    one pool with bounded size, keep-alive and timeouts.
+    
+    Args:
+        name (str): Name of the table
+        
+    Returns:
+        The PostgREST request builder of the table
+    """
+    client = getattr(_local, "postgrest", None)
+    if client is None:
+        client = _PooledPostgrestClient(f"{supabase_url}/rest/v1")
+        _local.postgrest = client
+    return client.from_(name)
+
+def atable(name: str):
+    """
+    Async version of table, for the ASGI endpoints; the query is run with await ....execute().
+    
+    The async client and its pool belong to the event loop of the ASGI server.
+    """
+    global _async_postgrest
+    if _async_postgrest is None:
+        _async_postgrest = _AsyncPooledPostgrestClient(f"{supabase_url}/rest/v1")
+    return _async_postgrest.from_(name)
+
+def _reset_clients():
+    # Connections and thread-local clients must not be shared with a forked child process
+    global _http_client, _async_http_client, _http_client_lock, _local, _async_postgrest
+    _http_client = None
+    _async_http_client = None
+    _http_client_lock = threading.Lock()
+    _local = threading.local()
+    _async_postgrest = None
+
+os.register_at_fork(after_in_child=_reset_clients)
+
+@dataclass
+class BulkWriteResult:
+    """Outcome of a bulk write: the rows returned by the database and the rows that failed."""
+    written: List[Dict[str, Any]] = field(default_factory=list)
+    failed: List[Dict[str, Any]] = field(default_factory=list)
+    written_count: int = 0
+    round_trips: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+def bulk_insert(table: str, rows: List[Dict[str, Any]], chunk_size: int = BULK_INSERT_CHUNK_SIZE, upsert: bool = False) -> BulkWriteResult:
+    """
+    Inserts rows with chunked multi-row inserts.
+    
+    A chunk the database rejects because of its data (a constraint or type error)
+    is split in halves and retried, so one bad row only costs a few extra
+    round-trips and every other row is still written. Any other error (timeout,
+    connection, server or auth) fails the whole chunk without retrying it, since
+    the rows may already have been written and would be duplicated.
+    
+    Args:
+        table (str): Name of the table
+        rows (list): Rows to insert
+        chunk_size (int): Maximum number of rows per request
+        upsert (bool): Whether to upsert on the primary key instead of inserting
+        
+    Returns:
+        BulkWriteResult: Written rows and failed rows with their errors
+    """
+    result = BulkWriteResult()
+    for start in range(0, len(rows), max(1, chunk_size)):
+        _write_chunk(table, rows[start:start + chunk_size], upsert, result)
+    
+    if result.failed:
+        print(f"Bulk insert into {table}: {len(result.failed)} of {len(rows)} rows failed")
+    return result
+
+def _is_data_error(error: Exception) -> bool:
+    # SQLSTATE classes 22 (data exception) and 23 (integrity constraint violation)
+    # are caused by the rows themselves; retrying a smaller chunk can succeed
+    return isinstance(error, APIError) and str(error.code or '')[:2] in ('22', '23')
+
+def _fail_chunk(rows: List[Dict[str, Any]], error: Exception, result: BulkWriteResult) -> None:
+    result.failed.extend({"row": row, "error": str(error)} for row in rows)
+
+def _write_chunk(table_name: str, rows: List[Dict[str, Any]], upsert: bool, result: BulkWriteResult) -> None:
+    if not rows:
+        return
+    
+    query = table(table_name)
+    try:
+        result.round_trips += 1
+        response = (query.upsert(rows) if upsert else query.insert(rows)).execute()
+        result.written.extend(response.data or [])
+        result.written_count += len(rows)
+    except Exception as e:
+        if len(rows) == 1 or not _is_data_error(e):
+            _fail_chunk(rows, e, result)
+            return
+        middle = len(rows) // 2
+        _write_chunk(table_name, rows[:middle], upsert, result)
+        _write_chunk(table_name, rows[middle:], upsert, result)
+
+async def abulk_insert(table: str, rows: List[Dict[str, Any]], chunk_size: int = BULK_INSERT_CHUNK_SIZE, upsert: bool = False) -> BulkWriteResult:
+    """
+    Async version of bulk_insert, using the async connection pool.
+    """
+    result = BulkWriteResult()
+    for start in range(0, len(rows), max(1, chunk_size)):
+        await _awrite_chunk(table, rows[start:start + chunk_size], upsert, result)
+    
+    if result.failed:
+        print(f"Bulk insert into {table}: {len(result.failed)} of {len(rows)} rows failed")
+    return result
+
+async def _awrite_chunk(table_name: str, rows: List[Dict[str, Any]], upsert: bool, result: BulkWriteResult) -> None:
+    if not rows:
+        return
+    
+    query = atable(table_name)
+    try:
+        result.round_trips += 1
+        response = await (query.upsert(rows) if upsert else query.insert(rows)).execute()
+        result.written.extend(response.data or [])
+        result.written_count += len(rows)
+    except Exception as e:
+        if len(rows) == 1 or not _is_data_error(e):
+            _fail_chunk(rows, e, result)
+            return
+        middle = len(rows) // 2
+        await _awrite_chunk(table_name, rows[:middle], upsert, result)
+        await _awrite_chunk(table_name, rows[middle:], upsert, result)
@@ -0,0 +1,314 @@
+"""
+Async versions of the LLM-bound endpoints, served by the ASGI app in asgi.py.
+
+They take the same requests and return the same responses as their Flask
+counterparts, but wait for Supabase, Perplexity and OpenAI on the event loop,
+so a request that waits minutes for the LLM does not hold a thread.
+"""
+import json
+import uuid
+import asyncio
+import datetime
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from app.models.db import atable, abulk_insert
+from app.services.search_service import asearch_exam_info
+from app.services.llm_service import agenerate_study_plan, astream_llm
+from app.services.llm_dispatcher import PRIORITY_DAY_ONE, PRIORITY_BACKGROUND
+from app.services.quiz_generation_service import agenerate_questions, enqueue_plan_quizzes, build_question_rows, index_stored_questions, public_questions, parse_num_questions
+from app.services.study_plan_service import build_plan_prompt, build_day_row, build_plan_response, format_sse
+from app.utils.ai_prompt_builder import DEFAULT_QUIZ_DISTRIBUTION
+from app.utils.pdf_processor import process_exam_materials
+from app.utils.json_stream import JsonArrayStream
+from app.utils.json_repair import loads_tolerant
+from app.utils.response_cache import invalidate, plan_cache_key, quiz_cache_key
+
+async def _fetch_exam(table_name, exam_id):
+    exam_result = await atable(table_name).select('*').eq('id', exam_id).execute()
+    return exam_result.data[0] if exam_result.data else None
+
+async def _aprepare_plan_prompt(exam_data, amount_of_days, include_internet_search):
+    """
+    Async version of study_plan_routes._prepare_plan_prompt.
+
+    Returns:
+        tuple: (system_prompt, user_prompt, fuzzy_key, search_results, materials_content)
+    """
+    # PDF parsing already runs in a process pool; only its coordination needs a thread
+    materials_content = await asyncio.to_thread(process_exam_materials, exam_data.get('exam_materials', []))
+
+    search_results = None
+    if include_internet_search:
+        search_results = await asearch_exam_info(
+            exam_data.get('title', ''),
+            exam_data.get('country', ''),
+            exam_data.get('exam_topics', []),
+            exam_data.get('educational_level', ''),
+            materials_content
+        )
+
+    system_prompt, user_prompt, fuzzy_key = build_plan_prompt(exam_data, search_results, materials_content, amount_of_days)
+    return system_prompt, user_prompt, fuzzy_key, search_results, materials_content
+
+async def generate_plan(request: Request):
+    """
+    Async version of POST /api/plan/generate.
+    """
+    try:
+        data = await request.json()
+        exam_id = data.get('exam_id')
+        amount_of_days = data.get('amount_of_days', 1)
+        include_internet_search = data.get('include_internet_search', True)
+
+        if not exam_id:
+            return JSONResponse({"error": "Missing exam_id parameter"}, status_code=400)
+
+        exam_data = await _fetch_exam('exams', exam_id)
+        if not exam_data:
+            return JSONResponse({"error": "Exam not found"}, status_code=404)
+        # LLM capacity is shared fairly between users
+        user_id = exam_data.get('user_id') or exam_id
+
+        system_prompt, user_prompt, fuzzy_key, search_results, materials_content = await _aprepare_plan_prompt(
+            exam_data, amount_of_days, include_internet_search
+        )
+
+        study_plan_data = await agenerate_study_plan(system_prompt, user_prompt, fuzzy_key=fuzzy_key, user_id=user_id)
+        if not study_plan_data:
+            return JSONResponse({"error": "Failed to generate study plan"}, status_code=500)
+
+        try:
+            study_plan_data = loads_tolerant(study_plan_data)
+        except json.JSONDecodeError as e:
+            print(f"JSON parsing error: {str(e)}")
+            return JSONResponse({"error": f"Invalid study plan data format: {str(e)}"}, status_code=500)
+
+        study_plan_id = str(uuid.uuid4())
+        current_timestamp = datetime.datetime.utcnow().isoformat()
+
+        plan_insert_result = await atable('study_plans').insert({
+            "id": study_plan_id,
+            "exam_id": exam_id,
+            "plan_text": json.dumps(study_plan_data),  # Store the entire JSON as text
+            "overview": study_plan_data.get('overview', ''),
+            "created_at": current_timestamp
+        }).execute()
+
+        if not plan_insert_result.data:
+            return JSONResponse({"error": "Failed to save study plan"}, status_code=500)
+
+        day_ids_map = {}
+        day_rows = []
+        for day in study_plan_data.get('day_topics', []):
+            day_id = str(uuid.uuid4())
+            day_ids_map[day.get('day_num', 0)] = day_id
+            day_rows.append(build_day_row(day, day_id, study_plan_id, current_timestamp))
+
+        days_insert_result = await abulk_insert('study_plan_days', day_rows)
+        for failure in days_insert_result.failed:
+            print(f"Failed to insert day {failure['row']['day_number']}: {failure['error']}")
+            day_ids_map.pop(failure['row']['day_number'], None)
+
+        # The response cache (SQLite or Redis) and the job queue (SQLite) block, so they run off the event loop
+        await asyncio.to_thread(invalidate, plan_cache_key(exam_id))
+        if day_rows and not day_ids_map:
+            return JSONResponse({"error": "Failed to save study plan days"}, status_code=500)
+
+        await asyncio.to_thread(
+            enqueue_plan_quizzes, study_plan_id, study_plan_data, day_ids_map, search_results, materials_content,
+            exam_data.get('country', ''), user_id=user_id
+        )
+
+        print(f"Successfully created study plan: {study_plan_id} - Quiz generation queued")
+        return JSONResponse(build_plan_response(study_plan_id, exam_id, study_plan_data, day_ids_map), status_code=201)
+
+    except Exception as e:
+        print(f"General error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def generate_plan_stream(request: Request):
+    """
+    Async version of POST /api/plan/generate/stream, with the same events.
+    """
+    try:
+        data = await request.json()
+        exam_id = data.get('exam_id')
+        amount_of_days = data.get('amount_of_days', 1)
+        include_internet_search = data.get('include_internet_search', True)
+
+        if not exam_id:
+            return JSONResponse({"error": "Missing exam_id parameter"}, status_code=400)
+
+        exam_data = await _fetch_exam('exams', exam_id)
+        if not exam_data:
+            return JSONResponse({"error": "Exam not found"}, status_code=404)
+        # LLM capacity is shared fairly between users
+        user_id = exam_data.get('user_id') or exam_id
+
+    except Exception as e:
+        print(f"General error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    async def generate_events():
+        try:
+            system_prompt, user_prompt, fuzzy_key, search_results, materials_content = await _aprepare_plan_prompt(
+                exam_data, amount_of_days, include_internet_search
+            )
+            country = exam_data.get('country', '')
+
+            # The plan row is created up front so days can reference it as they arrive
+            study_plan_id = str(uuid.uuid4())
+            current_timestamp = datetime.datetime.utcnow().isoformat()
+            plan_insert_result = await atable('study_plans').insert({
+                "id": study_plan_id,
+                "exam_id": exam_id,
+                "plan_text": "",
+                "overview": "",
+                "created_at": current_timestamp
+            }).execute()
+
+            if not plan_insert_result.data:
+                yield format_sse("error", {"error": "Failed to save study plan"})
+                return
+
+            yield format_sse("plan", {"id": study_plan_id, "exam_id": exam_id, "status_url": f"/api/plan/{study_plan_id}/status"})
+
+            day_ids_map = {}
+            stream = JsonArrayStream('day_topics')
+            async for chunk in astream_llm(system_prompt, user_prompt, fuzzy_key=fuzzy_key, user_id=user_id):
+                for day in stream.feed(chunk):
+                    day_num = day.get('day_num', 0)
+                    day_id = str(uuid.uuid4())
+                    try:
+                        await atable('study_plan_days').insert(
+                            build_day_row(day, day_id, study_plan_id, current_timestamp)
+                        ).execute()
+                    except Exception as e:
+                        print(f"Failed to insert day {day_num}: {str(e)}")
+                        yield format_sse("error", {"error": f"Failed to save day {day_num}: {str(e)}"})
+                        continue
+
+                    await asyncio.to_thread(
+                        enqueue_plan_quizzes,
+                        study_plan_id, {"day_topics": [day]}, {day_num: day_id}, search_results, materials_content, country,
+                        backfill_mode="sync", user_id=user_id,
+                        first_day_priority=PRIORITY_BACKGROUND if day_ids_map else PRIORITY_DAY_ONE
+                    )
+                    day_ids_map[day_num] = day_id
+                    await asyncio.to_thread(invalidate, plan_cache_key(exam_id))
+                    yield format_sse("day", {**day, "day_id": day_id})
+
+            try:
+                study_plan_data = loads_tolerant(stream.text)
+            except json.JSONDecodeError as e:
+                print(f"JSON parsing error: {str(e)}")
+                yield format_sse("error", {"error": f"Invalid study plan data format: {str(e)}"})
+                return
+
+            await atable('study_plans').update({
+                "plan_text": json.dumps(study_plan_data),
+                "overview": study_plan_data.get('overview', '')
+            }).eq('id', study_plan_id).execute()
+            await asyncio.to_thread(invalidate, plan_cache_key(exam_id))
+
+            print(f"Successfully streamed study plan: {study_plan_id} - {len(day_ids_map)} days saved")
+            yield format_sse("done", build_plan_response(study_plan_id, exam_id, study_plan_data, day_ids_map))
+
+        except Exception as e:
+            print(f"Streaming error: {str(e)}")
+            yield format_sse("error", {"error": str(e)})
+
+    return StreamingResponse(
+        generate_events(),
+        media_type='text/event-stream',
+        # Keep proxies from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def generate_quiz(request: Request):
+    """
+    Async version of POST /api/quiz/generate.
+    """
+    try:
+        data = await request.json()
+        exam_id = data.get('exam_id')
+        num_questions = data.get('num_questions', 10)
+        difficulty = data.get('difficulty', 'Medium')
+        topics_of_the_day = data.get('topics_of_the_day', [])
+
+        if not exam_id:
+            return JSONResponse({"error": "Missing exam_id parameter"}, status_code=400)
+        try:
+            num_questions = parse_num_questions(num_questions)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        exam_data = await _fetch_exam('Exams', exam_id)
+        if not exam_data:
+            return JSONResponse({"error": "Exam not found"}, status_code=404)
+
+        materials_result = await atable('exam_materials').select('*').eq('exam_id', exam_id).execute()
+        exam_materials = [item.get('file_path') for item in materials_result.data] if materials_result.data else []
+
+        materials_content = ""
+        if exam_materials:
+            materials_content = await asyncio.to_thread(process_exam_materials, exam_materials)
+
+        search_results = None
+        if topics_of_the_day:
+            search_results = await asearch_exam_info(
+                exam_data.get('title', ''),
+                exam_data.get('country', ''),
+                topics_of_the_day,
+                exam_data.get('educational_level', ''),
+                materials_content
+            )
+
+        subtopics = data.get('subtopics', '')
+        quiz_difficulty = difficulty.lower() if difficulty.lower() in DEFAULT_QUIZ_DISTRIBUTION else "medium"
+        questions = await agenerate_questions(
+            topics_of_the_day,
+            subtopics,
+            search_results,
+            materials_content,
+            exam_data.get('country', ''),
+            distribution={quiz_difficulty: num_questions},
+            user_id=exam_data.get('user_id') or exam_id
+        )
+
+        if not questions:
+            return JSONResponse({"error": "Failed to generate quiz"}, status_code=500)
+
+        quiz_insert_result = await atable('Quiz').insert({
+            "exam_id": exam_id,
+            "date": datetime.datetime.now().isoformat(),
+            "difficulty": difficulty,
+            "topics_of_the_day": topics_of_the_day,
+            "num_questions": num_questions
+        }).execute()
+
+        if not quiz_insert_result.data:
+            return JSONResponse({"error": "Failed to save quiz"}, status_code=500)
+
+        quiz_id = quiz_insert_result.data[0]['id']
+
+        valid_questions, question_rows = build_question_rows(questions, quiz_id, difficulty)
+        questions_result = await abulk_insert('Questions', question_rows)
+        await asyncio.to_thread(
+            index_stored_questions, valid_questions, question_rows, questions_result, quiz_id, topics_of_the_day, subtopics, exam_data.get('country', '')
+        )
+        # A read between the quiz and question inserts may have cached the quiz without questions
+        await asyncio.to_thread(invalidate, quiz_cache_key(quiz_id))
+
+        return JSONResponse({
+            "id": quiz_id,
+            "exam_id": exam_id,
+            "date": datetime.datetime.now().isoformat(),
+            "difficulty": difficulty,
+            "topics_of_the_day": topics_of_the_day,
+            "num_questions": num_questions,
+            "questions": public_questions(valid_questions)
+        }, status_code=201)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
@@ -2,11 +2,25 @@
 Routes for exam management.
 """
 from flask import Blueprint, request, jsonify
-from app.models.db import get_supabase_client
+from app.models.db import table, bulk_insert
 from app.models.models import exam
+from app.utils.pagination import PaginationError, NEXT_CURSOR_HEADER, parse_list_params, apply_filters, fetch_page
 
 exam_bp = Blueprint('exams', __name__)
 
+# Light columns returned by GET /exams; clients may select a subset with fields=
+EXAM_LIST_FIELDS = (
+    'id', 'user_id', 'title', 'country', 'exam_date', 'goal_score', 'topics',
+    'proficiency', 'study_schedule', 'hours_per_day'
+)
+# Query string filters of GET /exams: argument -> (column, operator)
+EXAM_LIST_FILTERS = {
+    'user_id': ('user_id', 'eq'),
+    'country': ('country', 'eq'),
+    'exam_date_from': ('exam_date', 'gte'),
+    'exam_date_to': ('exam_date', 'lte'),
+}
+
 @exam_bp.route('/exams', methods=['POST'])
 def create_exam():
     """
@@ -33,8 +47,7 @@ def create_exam():
             return jsonify({"error": "Missing required fields"}), 400
         
         # Insert exam data into Supabase
-        supabase = get_supabase_client()
-        result = supabase.table('exams').insert({
+        result = table('exams').insert({
             "title": exam.title,
             "country": exam.country,
             "exam_date": exam.exam_date,
@@ -50,15 +63,17 @@ def create_exam():
         if materials and result.data and len(result.data) > 0:
             exam_id = result.data[0]['id']
             
-            # Insert each material reference
-            for material in materials:
-                supabase.table('exam_materials').insert({
-                    "exam_id": exam_id,
-                    "file_path": material,
-                    "file_name": material.split('/')[-1] if '/' in material else material,
-                    "file_type": get_file_type(material),
-                    "file_size": 0  # Would need file size calculation
-                }).execute()
+            # Insert all material references in one request
+            materials_result = bulk_insert('exam_materials', [{
+                "exam_id": exam_id,
+                "file_path": material,
+                "file_name": material.split('/')[-1] if '/' in material else material,
+                "file_type": get_file_type(material),
+                "file_size": 0  # Would need file size calculation
+            } for material in materials])
+            
+            for failure in materials_result.failed:
+                print(f"Failed to insert material {failure['row']['file_path']}: {failure['error']}")
         
         return jsonify(result.data[0] if result.data else {}), 201
     
@@ -71,20 +86,14 @@ def get_exam(exam_id):
     Endpoint to get an exam by ID.
     """
     try:
-        supabase = get_supabase_client()
-        
-        # Fetch exam data
-        result = supabase.table('exams').select('*').eq('id', exam_id).execute()
+        # Fetch the exam with its materials embedded, in one round trip
+        result = table('exams').select('*, materials:exam_materials(*)').eq('id', exam_id).execute()
         
         if not result.data:
             return jsonify({"error": "Exam not found"}), 404
-            
-        # Fetch materials for this exam
-        materials = supabase.table('exam_materials').select('*').eq('exam_id', exam_id).execute()
         
-        # Combine the data
         exam_data = result.data[0]
-        exam_data['materials'] = materials.data if materials.data else []
+        exam_data['materials'] = exam_data.get('materials') or []
         
         return jsonify(exam_data), 200
     
@@ -94,14 +103,22 @@ def get_exam(exam_id):
 @exam_bp.route('/exams', methods=['GET'])
 def list_exams():
     """
-    Endpoint to list all exams.
+    Endpoint to list exams, one page at a time.
+    
+    Query parameters: limit, cursor (from the X-Next-Cursor header of the
+    previous page), fields (comma-separated columns) and the filters in
+    EXAM_LIST_FILTERS.
     """
     try:
-        supabase = get_supabase_client()
-        result = supabase.table('exams').select('*').execute()
+        params = parse_list_params(request.args, EXAM_LIST_FIELDS)
+        query = apply_filters(table('exams').select(params.columns), request.args, EXAM_LIST_FILTERS)
+        exams, next_cursor = fetch_page(query, params)
         
-        return jsonify(result.data if result.data else []), 200
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        return jsonify(exams), 200, headers
     
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
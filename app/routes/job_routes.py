@@ -0,0 +1,36 @@
+"""
+Routes for inspecting background jobs.
+"""
+from flask import Blueprint, jsonify
+from app.services.job_queue import get_job_queue
+
+job_bp = Blueprint('jobs', __name__)
+
+@job_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Endpoint to get the state of a background job.
+    """
+    try:
+        job = get_job_queue().get(job_id)
+        
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        
+        return jsonify(job.to_dict()), 200
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@job_bp.route('/jobs/group/<group_id>', methods=['GET'])
+def list_group_jobs(group_id):
+    """
+    Endpoint to list the background jobs of a group (e.g. a study plan).
+    """
+    try:
+        jobs = get_job_queue().list_group(group_id)
+        
+        return jsonify([job.to_dict() for job in jobs]), 200
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -2,15 +2,26 @@
 Routes for quiz generation and management.
 """
 from flask import Blueprint, request, jsonify
-from app.models.db import get_supabase_client
+from app.models.db import table, bulk_insert
 from app.services.search_service import search_exam_info
-from app.services.llm_service import generate_quiz
-from app.utils.ai_prompt_builder import build_quiz_prompt
+from app.services.quiz_generation_service import generate_questions, build_question_rows, index_stored_questions, public_questions, parse_num_questions
+from app.utils.ai_prompt_builder import DEFAULT_QUIZ_DISTRIBUTION
 from app.utils.pdf_processor import process_exam_materials
+from app.utils.response_cache import cached_json_response, invalidate, quiz_cache_key
+from app.utils.pagination import PaginationError, NEXT_CURSOR_HEADER, parse_list_params, apply_filters, fetch_page
 from typing import List, Dict, Any
 
 quiz_bp = Blueprint('quiz', __name__)
 
+# Light columns returned by GET /quiz/exam/<exam_id>; clients may select a subset with fields=
+QUIZ_LIST_FIELDS = ('id', 'exam_id', 'date', 'difficulty', 'topics_of_the_day', 'num_questions')
+# Query string filters of GET /quiz/exam/<exam_id>: argument -> (column, operator)
+QUIZ_LIST_FILTERS = {
+    'difficulty': ('difficulty', 'eq'),
+    'date_from': ('date', 'gte'),
+    'date_to': ('date', 'lte'),
+}
+
 @quiz_bp.route('/quiz/generate', methods=['POST'])
 def generate_quiz_endpoint():
     """
@@ -26,10 +37,13 @@ def generate_quiz_endpoint():
         
         if not exam_id:
             return jsonify({"error": "Missing exam_id parameter"}), 400
+        try:
+            num_questions = parse_num_questions(num_questions)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Fetch exam data from Supabase
-        supabase = get_supabase_client()
-        exam_result = supabase.table('Exams').select('*').eq('id', exam_id).execute()
+        exam_result = table('Exams').select('*').eq('id', exam_id).execute()
         
         if not exam_result.data:
             return jsonify({"error": "Exam not found"}), 404
@@ -37,7 +51,7 @@ def generate_quiz_endpoint():
         exam_data = exam_result.data[0]
         
         # Fetch materials for this exam
-        materials_result = supabase.table('exam_materials').select('*').eq('exam_id', exam_id).execute()
+        materials_result = table('exam_materials').select('*').eq('exam_id', exam_id).execute()
         exam_materials = [item.get('file_path') for item in materials_result.data] if materials_result.data else []
         
         # Process PDF materials, focusing on the current topics
@@ -56,32 +70,25 @@ def generate_quiz_endpoint():
                 materials_content
             )
         
-        # Build the prompt for the LLM
-        from app.models.models import exam
-        exam = exam(
-            id=exam_data.get('id'),
-            title=exam_data.get('title'),
-            country=exam_data.get('country'),
-            proficiency=exam_data.get('proficiency')
+        # Take questions from the question bank and generate only the missing ones
+        subtopics = data.get('subtopics', '')
+        quiz_difficulty = difficulty.lower() if difficulty.lower() in DEFAULT_QUIZ_DISTRIBUTION else "medium"
+        questions = generate_questions(
+            topics_of_the_day,
+            subtopics,
+            search_results,
+            materials_content,
+            exam_data.get('country', ''),
+            distribution={quiz_difficulty: num_questions},
+            user_id=exam_data.get('user_id') or exam_id
         )
         
-        quiz_request = {
-            "num_questions": num_questions,
-            "difficulty": difficulty,
-            "topics_of_the_day": topics_of_the_day
-        }
-        
-        system_prompt, prompt = build_quiz_prompt(quiz_request, exam, search_results, materials_content)
-        
-        # Call LLM to generate quiz
-        questions = generate_quiz(system_prompt, prompt)
-        
         if not questions:
             return jsonify({"error": "Failed to generate quiz"}), 500
         
         # Insert quiz into Supabase
         import datetime
-        quiz_insert_result = supabase.table('Quiz').insert({
+        quiz_insert_result = table('Quiz').insert({
             "exam_id": exam_id,
             "date": datetime.datetime.now().isoformat(),
             "difficulty": difficulty,
@@ -94,19 +101,12 @@ def generate_quiz_endpoint():
         
         quiz_id = quiz_insert_result.data[0]['id']
         
-        # Insert questions
-        for question in questions:
-            # Validate question format
-            if isinstance(question, dict) and 'question_text' in question and 'options' in question:
-                supabase.table('Questions').insert({
-                    "quiz_id": quiz_id,
-                    "question_text": question.get('question_text', ''),
-                    "options": question.get('options', []),
-                    "correct_answer": question.get('correct_answer', ''),
-                    "explanation": question.get('explanation', ''),
-                    "topic": question.get('topic', ''),
-                    "difficulty": question.get('difficulty', difficulty)
-                }).execute()
+        # Insert questions, skipping any with an invalid format
+        valid_questions, question_rows = build_question_rows(questions, quiz_id, difficulty)
+        questions_result = bulk_insert('Questions', question_rows)
+        index_stored_questions(valid_questions, question_rows, questions_result, quiz_id, topics_of_the_day, subtopics, exam_data.get('country', ''))
+        # A read between the quiz and question inserts may have cached the quiz without questions
+        invalidate(quiz_cache_key(quiz_id))
         
         # Return the quiz with its questions
         return jsonify({
@@ -116,41 +116,45 @@ def generate_quiz_endpoint():
             "difficulty": difficulty,
             "topics_of_the_day": topics_of_the_day,
             "num_questions": num_questions,
-            "questions": questions
+            "questions": public_questions(valid_questions)
         }), 201
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _load_quiz(quiz_id):
+    """
+    Reads a quiz with its questions.
+    
+    Returns:
+        tuple: (response data, status)
+    """
+    # Get the quiz with its questions embedded, in one round trip
+    quiz_result = table('Quiz').select('*, questions:Questions(*)').eq('id', quiz_id).execute()
+    
+    if not quiz_result.data:
+        return {"error": "Quiz not found"}, 404
+    
+    quiz = quiz_result.data[0]
+    
+    return {
+        **quiz,
+        "questions": quiz.get('questions') or []
+    }, 200
+
 @quiz_bp.route('/quiz/<quiz_id>', methods=['GET'])
 def get_quiz(quiz_id):
     """
     Endpoint to get a quiz by ID.
+    
+    Quizzes do not change once generated, so they are served from the
+    response cache; supports If-None-Match.
     """
     try:
         if not quiz_id:
             return jsonify({"error": "Missing quiz_id parameter"}), 400
         
-        supabase = get_supabase_client()
-        
-        # Get the quiz
-        quiz_result = supabase.table('Quiz').select('*').eq('id', quiz_id).execute()
-        
-        if not quiz_result.data:
-            return jsonify({"error": "Quiz not found"}), 404
-        
-        quiz = quiz_result.data[0]
-        
-        # Get the questions for this quiz
-        questions_result = supabase.table('Questions').select('*').eq('quiz_id', quiz_id).execute()
-        
-        # Combine the data
-        response = {
-            **quiz,
-            "questions": questions_result.data if questions_result.data else []
-        }
-        
-        return jsonify(response), 200
+        return cached_json_response(quiz_cache_key(quiz_id), lambda: _load_quiz(quiz_id))
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -158,18 +162,23 @@ def get_quiz(quiz_id):
 @quiz_bp.route('/quiz/exam/<exam_id>', methods=['GET'])
 def get_quizzes_for_exam(exam_id):
     """
-    Endpoint to get all quizzes for an exam.
+    Endpoint to list the quizzes of an exam, one page at a time.
+    
+    Takes the same limit, cursor and fields parameters as GET /exams, and
+    the filters in QUIZ_LIST_FILTERS.
     """
     try:
         if not exam_id:
             return jsonify({"error": "Missing exam_id parameter"}), 400
         
-        supabase = get_supabase_client()
-        
-        # Get all quizzes for this exam
-        quiz_result = supabase.table('Quiz').select('*').eq('exam_id', exam_id).execute()
+        params = parse_list_params(request.args, QUIZ_LIST_FIELDS)
+        query = table('Quiz').select(params.columns).eq('exam_id', exam_id)
+        quizzes, next_cursor = fetch_page(apply_filters(query, request.args, QUIZ_LIST_FILTERS), params)
         
-        return jsonify(quiz_result.data if quiz_result.data else []), 200
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        return jsonify(quizzes), 200, headers
         
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500 
\ No newline at end of file
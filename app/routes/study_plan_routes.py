@@ -1,110 +1,48 @@
 """
 Routes for study plan generation and management.
 """
-from flask import Blueprint, request, jsonify
-from app.models.db import get_supabase_client
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from app.models.db import table, bulk_insert
 from app.services.search_service import search_exam_info
-from app.services.llm_service import generate_study_plan
-from app.utils.ai_prompt_builder import build_study_plan_prompt, build_prompt_to_validate_json
+from app.services.llm_service import generate_study_plan, stream_llm
+from app.services.llm_dispatcher import PRIORITY_DAY_ONE, PRIORITY_BACKGROUND
 from app.utils.pdf_processor import process_exam_materials
+from app.utils.json_stream import JsonArrayStream
+from app.utils.json_repair import loads_tolerant
+from app.utils.response_cache import cached_json_response, invalidate, plan_cache_key
 import json
 import uuid
 from datetime import datetime
-from app.utils.ai_prompt_builder import build_quiz_prompt
-from app.services.llm_service import generate_quiz
-from app.services.llm_service import call_llm
-import threading
+from app.services.quiz_generation_service import enqueue_plan_quizzes, get_plan_quiz_status
+from app.services.study_plan_service import build_plan_prompt, build_day_row, build_plan_response, format_sse
 
 study_plan_bp = Blueprint('study_plan', __name__)
 
-# Function to generate quizzes in the background
-def generate_quizzes_background(study_plan_id, study_plan_data, day_ids_map, search_results, materials_content, country):
+def _prepare_plan_prompt(exam_data, amount_of_days, include_internet_search):
     """
-    Function to generate quizzes for a study plan in the background.
+    Gathers the exam materials and search results and builds the study plan prompt.
     
-    Args:
-        study_plan_id (str): The ID of the study plan
-        study_plan_data (dict): The study plan data
-        day_ids_map (dict): Mapping of day numbers to day IDs
-        search_results (str): Search results from Perplexity
-        materials_content (str): Content from PDF materials
+    Returns:
+        tuple: (system_prompt, user_prompt, fuzzy_key, search_results, materials_content)
     """
-    try:
-        print(f"Starting background quiz generation for study plan: {study_plan_id}")
-        supabase = get_supabase_client()
-        
-        # Create quizzes for each day of the study plan
-        for day in study_plan_data.get('day_topics', []):
-            # Create request data for the quiz generation
-            day_num = day.get('day_num', 0)
-            topics_for_the_day = [day.get('topics_for_the_day', '')]
-            subtopics = day.get('subtopics', '')
-            
-            print(f"Generating quiz for day {day_num} with topics: {topics_for_the_day}")
-            
-            try:                    
-                # Build prompt for quiz generation
-                system_prompt, prompt = build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_content, country)
-                
-                # Generate quiz
-                questions = generate_quiz(system_prompt, prompt)
-                
-                print(questions)
-
-                # Parse JSON if it's returned as a string
-                if isinstance(questions, str):
-                    try:
-                        print("entrou")
-                        questions = json.loads(questions)
-                    except json.JSONDecodeError as e:
-                        print(f"Failed to parse questions JSON: {str(e)}")
-                        print(f"Trying to fix JSON")
-                        system_prompt_json, user_prompt_json = build_prompt_to_validate_json(questions)
-                        
-                        questions = call_llm(system_prompt_json, user_prompt_json)
-                        questions = json.loads(questions)
-
-                print(type(questions))
-                
-                # Insert questions into database
-                for question in questions['questions'] if "questions" in questions else questions['output']:
-                    # Validate question format
-                    try:
-                        question_id = str(uuid.uuid4())
-                        topic_value = topics_for_the_day
-                        # If topic is a list, extract just the string
-                        if isinstance(topic_value, list):
-                            topic_value = topic_value[0] if topic_value else ""
-                        # If it's still a string with brackets and quotes, remove them
-                        if isinstance(topic_value, str) and topic_value.startswith('[') and topic_value.endswith(']'):
-                            # Strip the brackets and quotes
-                            topic_value = topic_value.strip('[]"\'')
-
-                        # Insert the question into the database
-                        question_result = supabase.table('questions').insert({
-                            "id": question_id,
-                            "study_plan_days_id": day_ids_map[day_num],  # Use the day_id we got when inserting the day
-                            "passage": question.get('passage', ''),
-                            "question_text": question.get('question_text', ''),
-                            "options": question.get('options', []),
-                            "correct_answer": question.get('correct_answer', ''),
-                            "explanation": question.get('explanation', ''),
-                            "topic": topic_value,  # Now it's just the string without brackets
-                            "difficulty": question.get('difficulty', 'medium')  # Default to medium if not specified
-                        }).execute()
-                        
-                        print(f"Inserted question: {question_id}")
-                    except Exception as q_e:
-                        print(f"Error inserting question: {str(q_e)}")
-                
-                print(f"Successfully generated questions for day {day_num}")
-                
-            except Exception as quiz_e:
-                print(f"Error generating quiz for day {day_num}: {str(quiz_e)}")
-                
-        print(f"Background quiz generation completed for study plan: {study_plan_id}")
-    except Exception as e:
-        print(f"Error in background task: {str(e)}")
+    print(f"Exam data: {exam_data.get('exam_materials', [])}")
+    # Process PDF materials
+    materials_content = process_exam_materials(exam_data.get('exam_materials', []))
+    
+    # Optional: Call Perplexity to get more info about the exam
+    print("Calling Perplexity")
+    search_results = None
+    if include_internet_search:
+        search_results = search_exam_info(
+            exam_data.get('title', ''),
+            exam_data.get('country', ''),
+            exam_data.get('exam_topics', []),
+            exam_data.get('educational_level', ''),
+            materials_content
+        )
+    
+    system_prompt, user_prompt, fuzzy_key = build_plan_prompt(exam_data, search_results, materials_content, amount_of_days)
+    return system_prompt, user_prompt, fuzzy_key, search_results, materials_content
 
 @study_plan_bp.route('/plan/generate', methods=['POST'])
 def generate_plan():
@@ -123,51 +61,21 @@ def generate_plan():
             return jsonify({"error": "Missing exam_id parameter"}), 400
         
         # Fetch exam data from Supabase
-        supabase = get_supabase_client()
-        exam_result = supabase.table('exams').select('*').eq('id', exam_id).execute()
+        exam_result = table('exams').select('*').eq('id', exam_id).execute()
         
         if not exam_result.data:
             return jsonify({"error": "Exam not found"}), 404
         
         exam_data = exam_result.data[0]
+        # LLM capacity is shared fairly between users
+        user_id = exam_data.get('user_id') or exam_id
         
-        print(f"Exam data: {exam_data.get('exam_materials', [])}")
-        # Process PDF materials
-        materials_content = process_exam_materials(exam_data.get('exam_materials', []))
-        
-        # Optional: Call Perplexity to get more info about the exam
-        print("Calling Perplexity")
-        search_results = None
-        if include_internet_search:
-            search_results = search_exam_info(
-                exam_data.get('title', ''),
-                exam_data.get('country', ''),
-                exam_data.get('exam_topics', []),
-                exam_data.get('educational_level', ''),
-                materials_content
-            )
-        
-        # Build the prompt for the LLM
-        from app.models.models import exam
-        exam = exam(
-            id=exam_data.get('id'),
-            title=exam_data.get('title'),
-            country=exam_data.get('country'),
-            exam_date=exam_data.get('exam_date'),
-            goal_score=exam_data.get('goal_score'),
-            topics=exam_data.get('exam_topics', []),
-            proficiency=exam_data.get('proficiency'),
-            study_schedule=exam_data.get('study_schedule', []),
-            hours_per_day=exam_data.get('hours_per_day', 0)
+        system_prompt, user_prompt, fuzzy_key, search_results, materials_content = _prepare_plan_prompt(
+            exam_data, amount_of_days, include_internet_search
         )
         
-        print("Creating plan prompt")
-        system_prompt, user_prompt = build_study_plan_prompt(exam, search_results, materials_content, amount_of_days)
-
-        print(f"Search results: /n/n{search_results}")
-        
         # Call LLM to generate study plan
-        study_plan_data = generate_study_plan(system_prompt, user_prompt)
+        study_plan_data = generate_study_plan(system_prompt, user_prompt, fuzzy_key=fuzzy_key, user_id=user_id)
 
         print(f"Study plan data: \n\n{study_plan_data}")
         
@@ -179,7 +87,8 @@ def generate_plan():
         if isinstance(study_plan_data, str):
             try:
                 print("Parsing study_plan_data from JSON string")
-                study_plan_data = json.loads(study_plan_data)
+                # Trailing commas, code fences or a truncated tail are repaired locally
+                study_plan_data = loads_tolerant(study_plan_data)
             except json.JSONDecodeError as e:
                 print(f"JSON parsing error: {str(e)}")
                 return jsonify({"error": f"Invalid study plan data format: {str(e)}"}), 500
@@ -202,13 +111,7 @@ def generate_plan():
                 "created_at": current_timestamp
             }
             print(f"Insert data: {insert_data}")
-            plan_insert_result = supabase.table('study_plans').insert({
-                "id": study_plan_id,
-                "exam_id": exam_id,
-                "plan_text": json.dumps(study_plan_data),  # Store the entire JSON as text
-                "overview": study_plan_data.get('overview', ''),
-                "created_at": current_timestamp
-            }).execute()
+            plan_insert_result = table('study_plans').insert(insert_data).execute()
             
             print(f"Plan insert result: {plan_insert_result}")
             
@@ -219,47 +122,29 @@ def generate_plan():
             # Insert study plan days
             print(f"Inserting study plan days into Supabase for plan: {study_plan_id}")
             day_ids_map = {}
+            day_rows = []
             for day in study_plan_data.get('day_topics', []):
                 day_id = str(uuid.uuid4())
                 day_ids_map[day.get('day_num', 0)] = day_id
-                day_insert_result = supabase.table('study_plan_days').insert({
-                    "id": day_id,
-                    "study_plan_id": study_plan_id,
-                    "day_number": day.get('day_num', 0),
-                    "planned_topics": day.get('topics_for_the_day', ''),
-                    "subtopics": day.get('subtopics', ''),
-                    "resources": day.get('resources', ''),
-                    "estimated_hours": day.get('estimated_hours_needed', 0),
-                    "completed": False,
-                    "description": day.get('description', ''),  # Empty description for now
-                    "created_at": current_timestamp
-                }).execute()
-                print(f"Inserted day {day.get('day_num', 0)} with ID: {day_id}")
+                day_rows.append(build_day_row(day, day_id, study_plan_id, current_timestamp))
             
-            # Return the response immediately while starting quiz generation in background
-            response_data = {
-                "id": study_plan_id,
-                "exam_id": exam_id,
-                "overview": study_plan_data.get('overview', ''),
-                "days": study_plan_data.get('day_topics', [])
-            }
+            days_insert_result = bulk_insert('study_plan_days', day_rows)
+            for failure in days_insert_result.failed:
+                print(f"Failed to insert day {failure['row']['day_number']}: {failure['error']}")
+                day_ids_map.pop(failure['row']['day_number'], None)
+            print(f"Inserted {days_insert_result.written_count} days in {days_insert_result.round_trips} requests")
+            invalidate(plan_cache_key(exam_id))
             
-            # Add the first day ID to the response if available
-            if day_ids_map and len(day_ids_map) > 0:
-                # Find the minimum day number (first day)
-                first_day_num = min(day_ids_map.keys())
-                first_day_id = day_ids_map[first_day_num]
-                response_data["first_day_id"] = first_day_id
+            if day_rows and not day_ids_map:
+                return jsonify({"error": "Failed to save study plan days"}), 500
             
-            # Start quiz generation in a background thread
-            quiz_thread = threading.Thread(
-                target=generate_quizzes_background,
-                args=(study_plan_id, study_plan_data, day_ids_map, search_results, materials_content, exam_data.get('country', ''))
-            )
-            quiz_thread.daemon = True  # This ensures the thread won't block app shutdown
-            quiz_thread.start()
+            # Return the response immediately while starting quiz generation in background
+            response_data = build_plan_response(study_plan_id, exam_id, study_plan_data, day_ids_map)
+            
+            # Queue quiz generation; the job workers pick it up and survive restarts
+            enqueue_plan_quizzes(study_plan_id, study_plan_data, day_ids_map, search_results, materials_content, exam_data.get('country', ''), user_id=user_id)
             
-            print(f"Successfully created study plan: {study_plan_id} - Background quiz generation started")
+            print(f"Successfully created study plan: {study_plan_id} - Quiz generation queued")
             return jsonify(response_data), 201
                 
         except Exception as e:
@@ -270,38 +155,172 @@ def generate_plan():
         print(f"General error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@study_plan_bp.route('/plan/<exam_id>', methods=['GET'])
-def get_study_plan(exam_id):
+@study_plan_bp.route('/plan/generate/stream', methods=['POST'])
+def generate_plan_stream():
     """
-    Endpoint to get a study plan for an exam.
+    Endpoint to generate a study plan for an exam, streaming the days as they are generated.
+    
+    Takes the same parameters as /plan/generate and responds with Server-Sent Events:
+        plan:  {"id", "exam_id", "status_url"} once the study plan is created
+        day:   a day of the plan with its "day_id", as soon as it is generated and saved;
+               its quiz generation is queued at the same time
+        done:  the same body /plan/generate responds with
+        error: {"error"}; days already sent stay saved
     """
     try:
+        data = request.get_json()
+        exam_id = data.get('exam_id')
+        amount_of_days = data.get('amount_of_days', 1)
+        include_internet_search = data.get('include_internet_search', True)
+        
         if not exam_id:
             return jsonify({"error": "Missing exam_id parameter"}), 400
         
-        supabase = get_supabase_client()
+        exam_result = table('exams').select('*').eq('id', exam_id).execute()
+        
+        if not exam_result.data:
+            return jsonify({"error": "Exam not found"}), 404
         
-        # Get the study plan for this exam
-        plan_result = supabase.table('StudyPlan').select('*').eq('exam_id', exam_id).execute()
+        exam_data = exam_result.data[0]
+        # LLM capacity is shared fairly between users
+        user_id = exam_data.get('user_id') or exam_id
         
-        if not plan_result.data:
-            return jsonify({"error": "Study plan not found"}), 404
+    except Exception as e:
+        print(f"General error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    
+    def generate_events():
+        try:
+            system_prompt, user_prompt, fuzzy_key, search_results, materials_content = _prepare_plan_prompt(
+                exam_data, amount_of_days, include_internet_search
+            )
+            country = exam_data.get('country', '')
+            
+            # The plan row is created up front so days can reference it as they arrive
+            study_plan_id = str(uuid.uuid4())
+            current_timestamp = datetime.utcnow().isoformat()
+            plan_insert_result = table('study_plans').insert({
+                "id": study_plan_id,
+                "exam_id": exam_id,
+                "plan_text": "",
+                "overview": "",
+                "created_at": current_timestamp
+            }).execute()
+            
+            if not plan_insert_result.data:
+                yield format_sse("error", {"error": "Failed to save study plan"})
+                return
+            
+            status_url = f"/api/plan/{study_plan_id}/status"
+            yield format_sse("plan", {"id": study_plan_id, "exam_id": exam_id, "status_url": status_url})
+            
+            day_ids_map = {}
+            stream = JsonArrayStream('day_topics')
+            for chunk in stream_llm(system_prompt, user_prompt, fuzzy_key=fuzzy_key, user_id=user_id):
+                for day in stream.feed(chunk):
+                    day_num = day.get('day_num', 0)
+                    day_id = str(uuid.uuid4())
+                    try:
+                        table('study_plan_days').insert(
+                            build_day_row(day, day_id, study_plan_id, current_timestamp)
+                        ).execute()
+                    except Exception as e:
+                        print(f"Failed to insert day {day_num}: {str(e)}")
+                        yield format_sse("error", {"error": f"Failed to save day {day_num}: {str(e)}"})
+                        continue
+                    
+                    # Days are queued one at a time as they arrive, so they cannot share a batch;
+                    # only the first one is generated ahead of the background days
+                    enqueue_plan_quizzes(
+                        study_plan_id, {"day_topics": [day]}, {day_num: day_id}, search_results, materials_content, country,
+                        backfill_mode="sync", user_id=user_id,
+                        first_day_priority=PRIORITY_BACKGROUND if day_ids_map else PRIORITY_DAY_ONE
+                    )
+                    day_ids_map[day_num] = day_id
+                    invalidate(plan_cache_key(exam_id))
+                    yield format_sse("day", {**day, "day_id": day_id})
+            
+            try:
+                study_plan_data = loads_tolerant(stream.text)
+            except json.JSONDecodeError as e:
+                print(f"JSON parsing error: {str(e)}")
+                yield format_sse("error", {"error": f"Invalid study plan data format: {str(e)}"})
+                return
+            
+            table('study_plans').update({
+                "plan_text": json.dumps(study_plan_data),  # Store the entire JSON as text
+                "overview": study_plan_data.get('overview', '')
+            }).eq('id', study_plan_id).execute()
+            invalidate(plan_cache_key(exam_id))
+            
+            response_data = build_plan_response(study_plan_id, exam_id, study_plan_data, day_ids_map)
+            
+            print(f"Successfully streamed study plan: {study_plan_id} - {len(day_ids_map)} days saved")
+            yield format_sse("done", response_data)
+            
+        except Exception as e:
+            print(f"Streaming error: {str(e)}")
+            yield format_sse("error", {"error": str(e)})
+    
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype='text/event-stream',
+        # Keep proxies from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _load_study_plan(exam_id):
+    """
+    Reads the study plan of an exam with its days.
+    
+    Returns:
+        tuple: (response data, status)
+    """
+    # Get the study plan for this exam with its days embedded, in one round trip
+    plan_result = table('StudyPlan').select('*, days:StudyPlanDays(*)').eq('exam_id', exam_id).execute()
+    
+    if not plan_result.data:
+        return {"error": "Study plan not found"}, 404
+    
+    study_plan = plan_result.data[0]
+    # Embedded rows come unordered; a plan has at most a few dozen days
+    days = sorted(study_plan.get('days') or [], key=lambda day: day.get('day_number') or 0)
+    
+    return {
+        "id": study_plan['id'],
+        "exam_id": exam_id,
+        "overview": study_plan.get('plan_text', ''),
+        "days": days
+    }, 200
+
+@study_plan_bp.route('/plan/<exam_id>', methods=['GET'])
+def get_study_plan(exam_id):
+    """
+    Endpoint to get a study plan for an exam.
+    
+    Served from the response cache until the plan changes; supports If-None-Match.
+    """
+    try:
+        if not exam_id:
+            return jsonify({"error": "Missing exam_id parameter"}), 400
         
-        study_plan = plan_result.data[0]
-        study_plan_id = study_plan['id']
+        return cached_json_response(plan_cache_key(exam_id), lambda: _load_study_plan(exam_id))
         
-        # Get the days for this study plan
-        days_result = supabase.table('StudyPlanDays').select('*').eq('study_plan_id', study_plan_id).order('day_number').execute()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@study_plan_bp.route('/plan/<study_plan_id>/status', methods=['GET'])
+def get_plan_status(study_plan_id):
+    """
+    Endpoint to get the quiz generation progress of a study plan.
+    """
+    try:
+        status = get_plan_quiz_status(study_plan_id)
         
-        # Combine the data
-        response = {
-            "id": study_plan_id,
-            "exam_id": exam_id,
-            "overview": study_plan.get('plan_text', ''),
-            "days": days_result.data if days_result.data else []
-        }
+        if not status:
+            return jsonify({"error": "No quiz generation found for this study plan"}), 404
         
-        return jsonify(response), 200
+        return jsonify(status), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -315,14 +334,17 @@ def complete_day(day_id):
         if not day_id:
             return jsonify({"error": "Missing day_id parameter"}), 400
         
-        supabase = get_supabase_client()
-        
         # Update the day's completed status
-        result = supabase.table('StudyPlanDays').update({"completed": True}).eq('id', day_id).execute()
+        result = table('StudyPlanDays').update({"completed": True}).eq('id', day_id).execute()
         
         if not result.data:
             return jsonify({"error": "Day not found or update failed"}), 404
         
+        # The cached plan is keyed by exam, so find the exam the day belongs to
+        plan_result = table('StudyPlan').select('exam_id').eq('id', result.data[0].get('study_plan_id')).execute()
+        if plan_result.data:
+            invalidate(plan_cache_key(plan_result.data[0]['exam_id']))
+        
         return jsonify({"success": True, "data": result.data[0]}), 200
         
     except Exception as e:
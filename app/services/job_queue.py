@@ -0,0 +1,332 @@
+"""
+Persistent job queue backed by a local SQLite database.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List
+
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', './data/jobs.db')
+# Seconds a claimed job stays invisible to other workers before it is considered abandoned
+JOB_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', '900'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Base delay in seconds before a failed job is retried, doubled on every attempt
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', '30'))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    group_id TEXT,
+    day_num INTEGER,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_expires_at REAL,
+    worker_id TEXT,
+    result TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready_idx ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_group_idx ON jobs (group_id);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    capacity INTEGER NOT NULL,
+    seen_at REAL NOT NULL
+);
+"""
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    group_id: Optional[str] = None
+    day_num: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    last_error: Optional[str] = None
+    created_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the public view of the job, without its (potentially large) payload.
+        """
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "group_id": self.group_id,
+            "day_num": self.day_num,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "result": self.result,
+            "error": self.last_error,
+            "created_at": format_timestamp(self.created_at),
+            "started_at": format_timestamp(self.started_at),
+            "finished_at": format_timestamp(self.finished_at)
+        }
+
+def format_timestamp(timestamp: Optional[float]) -> Optional[str]:
+    """Formats a Unix timestamp like the created_at values stored in Supabase."""
+    return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp else None
+
+def _row_to_job(row: sqlite3.Row) -> Job:
+    return Job(
+        id=row["id"],
+        kind=row["kind"],
+        payload=json.loads(row["payload"]),
+        status=row["status"],
+        attempts=row["attempts"],
+        max_attempts=row["max_attempts"],
+        group_id=row["group_id"],
+        day_num=row["day_num"],
+        result=json.loads(row["result"]) if row["result"] else None,
+        last_error=row["last_error"],
+        created_at=row["created_at"],
+        started_at=row["started_at"],
+        finished_at=row["finished_at"]
+    )
+
+class DeferJob(Exception):
+    """
+    Raised by a job handler to run the job again later without using up an attempt,
+    e.g. while it waits for an external result.
+    """
+
+    def __init__(self, delay: float, reason: str = "Deferred"):
+        super().__init__(reason)
+        self.delay = delay
+
+class JobQueue:
+    """
+    A durable queue of jobs with leases, retries and resume-on-restart.
+
+    A claimed job is leased to a worker for the visibility timeout. If the worker
+    dies without completing it, the lease expires and another worker picks it up.
+    Several processes can share the same database file.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        group_id: Optional[str] = None,
+        day_num: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        delay: float = 0
+    ) -> str:
+        """
+        Adds a job to the queue.
+
+        Args:
+            kind (str): Name of the handler that processes the job
+            payload (dict): JSON-serializable job arguments
+            group_id (str, optional): ID used to group related jobs (e.g. a study plan)
+            day_num (int, optional): Day of the study plan the job belongs to
+            max_attempts (int, optional): Attempts before the job is marked as failed
+            delay (float): Seconds before the job becomes available
+
+        Returns:
+            str: The ID of the new job
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO jobs (id, kind, group_id, day_num, payload, status, max_attempts, available_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, group_id, day_num, json.dumps(payload), STATUS_QUEUED,
+             max_attempts or JOB_MAX_ATTEMPTS, now + delay, now)
+        )
+        return job_id
+
+    def claim(self, worker_id: str, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT) -> Optional[Job]:
+        """
+        Leases the oldest available job to a worker.
+
+        Jobs whose lease expired (their worker crashed or was restarted) are available again.
+
+        Args:
+            worker_id (str): Identifier of the claiming worker
+            visibility_timeout (int): Seconds the lease lasts unless extended
+
+        Returns:
+            Job: The claimed job or None if the queue is empty
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Abandoned jobs that already used all their attempts are not retried again
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, last_error = COALESCE(last_error, 'Lease expired') "
+                "WHERE status = ? AND lease_expires_at <= ? AND attempts >= max_attempts",
+                (STATUS_FAILED, now, STATUS_RUNNING, now)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at <= ?) "
+                "ORDER BY available_at LIMIT 1",
+                (STATUS_QUEUED, now, STATUS_RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, worker_id = ?, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (STATUS_RUNNING, now + visibility_timeout, worker_id, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return self.get(row["id"])
+
+    def extend_lease(self, job_id: str, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT) -> None:
+        """
+        Keeps a long-running job leased to its current worker.
+        """
+        self._connect().execute(
+            "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ?",
+            (time.time() + visibility_timeout, job_id, STATUS_RUNNING)
+        )
+
+    def update_payload(self, job_id: str, payload: Dict[str, Any]) -> None:
+        """
+        Stores intermediate progress so a retried job can resume where it stopped.
+        """
+        self._connect().execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), job_id))
+
+    def complete(self, job_id: str, result: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Marks a job as done.
+        """
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+            (STATUS_DONE, json.dumps(result) if result is not None else None, time.time(), job_id)
+        )
+
+    def fail(self, job_id: str, error: str) -> None:
+        """
+        Records a failed attempt, scheduling a retry with exponential backoff
+        or marking the job as failed once it ran out of attempts.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return
+
+        now = time.time()
+        conn = self._connect()
+        if job.attempts >= job.max_attempts:
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+                (STATUS_FAILED, error, now, job_id)
+            )
+        else:
+            delay = JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, available_at = ?, lease_expires_at = NULL WHERE id = ?",
+                (STATUS_QUEUED, error, now + delay, job_id)
+            )
+
+    def defer(self, job_id: str, delay: float) -> None:
+        """
+        Makes a running job available again after a delay; the attempt it was claimed with is given back.
+        """
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), available_at = ?, lease_expires_at = NULL "
+            "WHERE id = ? AND status = ?",
+            (STATUS_QUEUED, time.time() + delay, job_id, STATUS_RUNNING)
+        )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Returns a job by ID or None if it does not exist.
+        """
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def register_worker(self, worker_id: str, capacity: int) -> None:
+        """
+        Records a running worker and how many jobs it processes at the same time;
+        called again periodically to show the worker is still alive.
+        """
+        self._connect().execute(
+            "INSERT INTO workers (id, capacity, seen_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET capacity = excluded.capacity, seen_at = excluded.seen_at",
+            (worker_id, capacity, time.time())
+        )
+
+    def unregister_worker(self, worker_id: str) -> None:
+        """Removes a stopped worker."""
+        self._connect().execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def worker_capacity(self, max_age: float = JOB_VISIBILITY_TIMEOUT) -> int:
+        """
+        Returns the total capacity of the workers seen within max_age seconds, in every process.
+        """
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(capacity), 0) FROM workers WHERE seen_at >= ?", (time.time() - max_age,)
+        ).fetchone()
+        return row[0]
+
+    def list_group(self, group_id: str) -> List[Job]:
+        """
+        Returns all jobs of a group ordered by day number.
+        """
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE group_id = ? ORDER BY day_num, created_at", (group_id,)
+        ).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue instance."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -0,0 +1,190 @@
+"""
+Workers that process jobs from the persistent job queue.
+"""
+import os
+import time
+import signal
+import socket
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Callable, Optional
+
+from app.services.job_queue import Job, JobQueue, DeferJob, get_job_queue, JOB_VISIBILITY_TIMEOUT
+from app.services.quiz_generation_service import QUIZ_DAY_JOB, QUIZ_BATCH_JOB, run_quiz_day_job, run_quiz_batch_job, parallel_days
+
+# Number of jobs processed at the same time by one worker
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', os.getenv('QUIZ_GENERATION_WORKERS', '8')))
+JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', '2'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+
+JOB_HANDLERS: Dict[str, Callable[[Job, JobQueue], Optional[dict]]] = {
+    QUIZ_DAY_JOB: run_quiz_day_job,
+    QUIZ_BATCH_JOB: run_quiz_batch_job,
+}
+
+class JobWorker:
+    """
+    Claims jobs from the queue and runs them on a bounded thread pool.
+
+    While a job runs its lease is extended periodically, so only jobs whose
+    worker died become visible to other workers again. The worker also records
+    its capacity in the queue database, where progress estimates read it.
+    """
+
+    def __init__(self, queue: Optional[JobQueue] = None, concurrency: int = JOB_WORKER_CONCURRENCY):
+        self.queue = queue or get_job_queue()
+        self.concurrency = max(1, concurrency)
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{id(self):x}"
+        self._stop = threading.Event()
+        self._stopped = threading.Event()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+
+    def _run_job(self, job: Job) -> None:
+        handler = JOB_HANDLERS.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind: {job.kind}")
+            print(f"Worker {self.worker_id} running job {job.id} ({job.kind}, attempt {job.attempts})")
+            result = handler(job, self.queue)
+            self.queue.complete(job.id, result)
+        except DeferJob as e:
+            self.queue.defer(job.id, e.delay)
+        except Exception as e:
+            print(f"Job {job.id} failed: {str(e)}")
+            self.queue.fail(job.id, str(e))
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(job.id)
+            self._slots.release()
+
+    def _register(self) -> None:
+        try:
+            self.queue.register_worker(self.worker_id, parallel_days(self.concurrency))
+        except Exception as e:
+            print(f"Error registering worker {self.worker_id}: {str(e)}")
+
+    def _heartbeat(self) -> None:
+        interval = max(1, JOB_VISIBILITY_TIMEOUT // 3)
+        # Keeps running after stop() so jobs that are still draining keep their lease
+        while True:
+            time.sleep(interval)
+            if not self._stop.is_set():
+                self._register()
+            with self._in_flight_lock:
+                job_ids = list(self._in_flight)
+            for job_id in job_ids:
+                try:
+                    self.queue.extend_lease(job_id)
+                except Exception as e:
+                    print(f"Error extending lease of job {job_id}: {str(e)}")
+
+    def run(self) -> None:
+        """
+        Processes jobs until stop() is called, then waits for in-flight jobs to finish.
+        """
+        print(f"Starting job worker {self.worker_id} with concurrency {self.concurrency}")
+        self._register()
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job") as executor:
+            while not self._stop.is_set():
+                if not self._slots.acquire(timeout=JOB_POLL_INTERVAL):
+                    continue
+                try:
+                    job = self.queue.claim(self.worker_id)
+                except Exception as e:
+                    print(f"Error claiming job: {str(e)}")
+                    job = None
+
+                if job is None:
+                    self._slots.release()
+                    self._stop.wait(JOB_POLL_INTERVAL)
+                    continue
+
+                with self._in_flight_lock:
+                    self._in_flight.add(job.id)
+                executor.submit(self._run_job, job)
+
+        try:
+            self.queue.unregister_worker(self.worker_id)
+        except Exception as e:
+            print(f"Error unregistering worker {self.worker_id}: {str(e)}")
+        print(f"Job worker {self.worker_id} stopped")
+        self._stopped.set()
+
+    def stop(self) -> None:
+        """Stops claiming new jobs; jobs already running are allowed to finish."""
+        self._stop.set()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stops claiming new jobs and waits for the running ones to finish.
+
+        Jobs still running after the timeout keep their lease until it expires
+        and are then retried by another worker.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait
+
+        Returns:
+            bool: Whether every running job finished
+        """
+        self.stop()
+        return self._stopped.wait(timeout)
+
+def start_embedded_worker(concurrency: int = JOB_WORKER_CONCURRENCY) -> JobWorker:
+    """
+    Starts a job worker on a background thread of the current process.
+
+    Args:
+        concurrency (int): Number of jobs processed at the same time
+
+    Returns:
+        JobWorker: The running worker
+    """
+    worker = JobWorker(concurrency=concurrency)
+    threading.Thread(target=worker.run, name="job-worker", daemon=True).start()
+    return worker
+
+def _worker_process_main(concurrency: int) -> None:
+    worker = JobWorker(concurrency=concurrency)
+
+    def handle_signal(signum, frame):
+        print(f"Worker {worker.worker_id} received signal {signum}, draining")
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    worker.run()
+
+def run_worker_processes(processes: int = JOB_WORKER_PROCESSES, concurrency: int = JOB_WORKER_CONCURRENCY) -> None:
+    """
+    Runs job workers in separate processes until they are terminated.
+
+    Args:
+        processes (int): Number of worker processes
+        concurrency (int): Number of jobs processed at the same time by each process
+    """
+    # Spawn instead of fork so each process creates its own HTTP clients
+    context = multiprocessing.get_context("spawn")
+    children = [
+        context.Process(target=_worker_process_main, args=(concurrency,), name=f"job-worker-{i}")
+        for i in range(max(1, processes))
+    ]
+    for child in children:
+        child.start()
+
+    def forward_signal(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGINT, forward_signal)
+
+    for child in children:
+        child.join()
@@ -0,0 +1,171 @@
+"""
+Priority scheduling of LLM calls.
+"""
+import os
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+# Priorities of LLM calls; lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DAY_ONE = 1
+PRIORITY_BACKGROUND = 2
+
+# Maximum number of in-flight LLM calls per process
+LLM_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))
+# Slots background calls cannot take, so interactive calls never wait for a background call to finish
+LLM_INTERACTIVE_RESERVE = int(os.getenv('LLM_INTERACTIVE_RESERVE', '2'))
+
+class _Ticket:
+    __slots__ = ("granted", "future")
+
+    def __init__(self, future: Optional[asyncio.Future] = None):
+        self.granted = False
+        # Set for calls waiting on an event loop instead of a thread
+        self.future = future
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.future is not None:
+            self.future.get_loop().call_soon_threadsafe(_resolve, self.future)
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+class LLMDispatcher:
+    """
+    Hands out slots for LLM calls by priority, sharing each priority fairly between users.
+
+    Waiting calls are queued per priority and per user. A free slot goes to the
+    highest priority with waiting calls, and within a priority the users take
+    turns, so one user's 30-day plan does not hold back everyone else's
+    quizzes. Background calls never take the last reserved slots, which keeps
+    room for interactive requests even while a backfill saturates the provider.
+
+    Scheduling is per process: the reserve and the priorities only take effect
+    between calls of the same process, i.e. when background jobs run on the
+    embedded job worker (JOB_WORKER_EMBEDDED=1). With dedicated worker
+    processes each side has its own capacity, see OPENAI_MAX_CONCURRENCY.
+    """
+
+    def __init__(self, capacity: int = LLM_MAX_CONCURRENCY, interactive_reserve: int = LLM_INTERACTIVE_RESERVE):
+        self.capacity = max(1, capacity)
+        self.background_capacity = max(1, self.capacity - max(0, interactive_reserve))
+        self.in_flight = 0
+        self._background_in_flight = 0
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {}
+        self._condition = threading.Condition()
+
+    def _dispatch(self) -> None:
+        # Must be called with the condition held
+        granted = False
+        while self.in_flight < self.capacity:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.grant()
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        for priority in sorted(self._queues):
+            if priority >= PRIORITY_BACKGROUND and self._background_in_flight >= self.background_capacity:
+                continue
+            users = self._queues[priority]
+            if not users:
+                continue
+            # Round-robin between users: serve the first one, then move it to the back
+            user, tickets = next(iter(users.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            self.in_flight += 1
+            if priority >= PRIORITY_BACKGROUND:
+                self._background_in_flight += 1
+            return ticket
+        return None
+
+    def _enqueue(self, ticket: _Ticket, priority: int, user_id: Optional[str]) -> None:
+        # Must be called with the condition held
+        self._queues.setdefault(priority, OrderedDict()).setdefault(user_id or "", deque()).append(ticket)
+        self._dispatch()
+
+    def _release(self, priority: int) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            if priority >= PRIORITY_BACKGROUND:
+                self._background_in_flight -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE, user_id: Optional[str] = None):
+        """
+        Blocks until the call may run and holds its slot until the block exits.
+
+        Args:
+            priority (int): One of the PRIORITY_* constants
+            user_id (str, optional): User the call is made for, used for fair sharing
+        """
+        ticket = _Ticket()
+        with self._condition:
+            self._enqueue(ticket, priority, user_id)
+            while not ticket.granted:
+                self._condition.wait()
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = PRIORITY_INTERACTIVE, user_id: Optional[str] = None):
+        """
+        Async version of slot: waits for the slot without blocking the event loop.
+
+        Shares the queues and capacity with slot, so sync and async calls of
+        the same process are scheduled together.
+        """
+        ticket = _Ticket(asyncio.get_running_loop().create_future())
+        with self._condition:
+            self._enqueue(ticket, priority, user_id)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            with self._condition:
+                if not ticket.granted:
+                    tickets = self._queues[priority][user_id or ""]
+                    tickets.remove(ticket)
+                    if not tickets:
+                        del self._queues[priority][user_id or ""]
+                    raise
+            # The slot was granted while the call was being cancelled
+            self._release(priority)
+            raise
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_llm_dispatcher() -> LLMDispatcher:
+    """Returns the process-wide LLM dispatcher."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = LLMDispatcher()
+        return _dispatcher
+
+def _reset_dispatcher():
+    # Waiting threads and held slots of the parent do not exist in a forked child
+    global _dispatcher, _dispatcher_lock
+    _dispatcher = None
+    _dispatcher_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_dispatcher)
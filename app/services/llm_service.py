@@ -3,60 +3,477 @@ Service for interacting with OpenAI or other LLM APIs.
 """
 import os
 import json
+import asyncio
+import threading
+import httpx
 import requests
-from typing import Dict, Any, Optional, List, Union
-from openai import OpenAI
+from typing import Dict, Any, Optional, List, Union, Iterator, AsyncIterator
+from openai import OpenAI, AsyncOpenAI
 from pydantic import BaseModel
 from typing import Literal, List
+from app.utils.cache import create_cache, make_cache_key, normalize_text
+from app.services.rate_limiter import call_with_retry, acall_with_retry
+from app.services.llm_dispatcher import get_llm_dispatcher, PRIORITY_INTERACTIVE
 
 # Load API key from environment variables
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_API_URL = "https://api.openai.com/v1"
+# Alternative API endpoint, e.g. a local stand-in for testing the batch mode
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+OPENAI_BATCH_COMPLETION_WINDOW = os.getenv('OPENAI_BATCH_COMPLETION_WINDOW', '24h')
 
-def call_llm(system_prompt: str, user_prompt: str, ret_format: str, temperature: float = 0.7, model: str = "o3-mini") -> Optional[str]:
+# Batch states after which no more results will arrive
+BATCH_FINISHED_STATES = ("completed", "expired", "failed", "cancelled")
+
+# HTTP settings of the shared OpenAI client
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '600'))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '10'))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60'))
+
+# Cache of LLM responses. Set LLM_CACHE_PATH to a SQLite file to share it between worker processes.
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH')
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '500'))
+
+llm_cache = create_cache(LLM_CACHE_PATH, "llm_cache", LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+
+_openai_client = None
+_openai_client_lock = threading.Lock()
+_async_openai_client = None
+
+def get_openai_client() -> OpenAI:
+    """
+    Returns the process-wide OpenAI client, creating it on first use.
+    
+    The client is thread-safe and keeps a pool of keep-alive connections,
+    so concurrent calls reuse TLS sessions instead of reconnecting every time.
+    """
+    global _openai_client
+    if _openai_client is None:
+        with _openai_client_lock:
+            if _openai_client is None:
+                timeout = httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+                http_client = httpx.Client(
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+                    )
+                )
+                # Retries are made by call_with_retry, which also respects the rate limits
+                _openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, http_client=http_client, timeout=timeout, max_retries=0)
+    return _openai_client
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """
+    Returns the process-wide async OpenAI client, creating it on first use.
+    
+    Its connections belong to the event loop of the ASGI server, so it must
+    only be used from that loop.
+    """
+    global _async_openai_client
+    if _async_openai_client is None:
+        timeout = httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+        http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+            )
+        )
+        _async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, http_client=http_client, timeout=timeout, max_retries=0)
+    return _async_openai_client
+
+def _reset_openai_client():
+    # Connections must not be shared with a forked child process
+    global _openai_client, _openai_client_lock, _async_openai_client
+    _openai_client = None
+    _openai_client_lock = threading.Lock()
+    _async_openai_client = None
+
+os.register_at_fork(after_in_child=_reset_openai_client)
+
+def build_fuzzy_cache_key(kind: str, exam_title: str, country: str, topics, *extra) -> str:
+    """
+    Builds a cache key from the normalized exam details instead of the full prompt.
+    
+    Requests for the same exam, country and topics share the key even when other
+    parts of the prompt (e.g. search results) differ slightly.
+    
+    Args:
+        kind (str): What is generated (e.g. "study_plan", "quiz")
+        exam_title (str): Title of the exam
+        country (str): Country of the exam
+        topics: Topic or list of topics
+        *extra: Other values that change the expected output (e.g. number of days)
+        
+    Returns:
+        str: The cache key
+    """
+    if not isinstance(topics, (list, tuple)):
+        topics = [topics]
+    normalized_topics = sorted(normalize_text(str(topic)) for topic in topics if topic)
+    return make_cache_key("fuzzy", kind, normalize_text(exam_title), normalize_text(country), normalized_topics,
+                          [normalize_text(str(value)) for value in extra])
+
+def call_llm(system_prompt: str, user_prompt: str, ret_format: str, temperature: float = 0.7, model: str = "o3-mini", usage: Optional[Dict[str, int]] = None, reasoning_effort: str = "low", fuzzy_key: Optional[str] = None, use_cache: bool = True, priority: int = PRIORITY_INTERACTIVE, user_id: Optional[str] = None) -> Optional[str]:
     """
     Makes a call to the OpenAI API.
     
+    Responses are cached by a hash of the model, prompts and reasoning effort, and
+    additionally under fuzzy_key when given. Only valid JSON responses are cached.
+    
     Args:
         prompt (str): The prompt to send to the model
         temperature (float): Controls randomness (0-1)
         model (str): The model to use
+        usage (dict, optional): Token counts of the call are added to this dict
+        reasoning_effort (str): Reasoning effort of the model
+        fuzzy_key (str, optional): Extra cache key, see build_fuzzy_cache_key
+        use_cache (bool): Whether to read and write the response cache
+        priority (int): Scheduling priority of the call, see llm_dispatcher
+        user_id (str, optional): User the call is made for, used for fair sharing
         
     Returns:
         str: The model's response or None if the call failed
     """
+    exact_key = make_cache_key("openai", model, system_prompt, user_prompt, reasoning_effort)
+    if use_cache:
+        cached = _read_llm_cache(exact_key, fuzzy_key)
+        if cached is not None:
+            print(f"Using cached LLM response for model: {model}")
+            return cached
+    
     try:
         print(f"Calling LLM with model: {model}")
 
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client = get_openai_client()
     
-        response = client.chat.completions.create(
-            model="o3-mini",
+        with get_llm_dispatcher().slot(priority, user_id):
+            response = call_with_retry("openai", model, lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                reasoning_effort=reasoning_effort,
+                response_format={ "type": "json_object" }
+            ))
+        
+        if usage is not None and response.usage:
+            add_usage(usage, response.usage)
+        
+        content = response.choices[0].message.content
+        if use_cache:
+            _write_llm_cache(content, exact_key, fuzzy_key)
+        
+        return content
+
+    except Exception as e:
+        print(f"Error in call_llm: {str(e)}")
+        return None
+
+def stream_llm(system_prompt: str, user_prompt: str, model: str = "o3-mini", usage: Optional[Dict[str, int]] = None, reasoning_effort: str = "low", fuzzy_key: Optional[str] = None, use_cache: bool = True, user_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Makes a streaming call to the OpenAI API, yielding the response as it is generated.
+    
+    Shares the response cache with call_llm: a cached response is yielded in one
+    piece, and a complete streamed response is cached once it is valid JSON.
+    
+    Args:
+        system_prompt (str): The system prompt
+        user_prompt (str): The user prompt
+        model (str): The model to use
+        usage (dict, optional): Token counts of the call are added to this dict
+        reasoning_effort (str): Reasoning effort of the model
+        fuzzy_key (str, optional): Extra cache key, see build_fuzzy_cache_key
+        use_cache (bool): Whether to read and write the response cache
+        user_id (str, optional): User the call is made for; streams always run at interactive priority
+        
+    Yields:
+        str: Chunks of the model's response
+        
+    Raises:
+        Exception: If the API call fails; chunks already yielded are not retracted
+    """
+    exact_key = make_cache_key("openai", model, system_prompt, user_prompt, reasoning_effort)
+    if use_cache:
+        cached = _read_llm_cache(exact_key, fuzzy_key)
+        if cached is not None:
+            print(f"Using cached LLM response for model: {model}")
+            yield cached
+            return
+    
+    print(f"Streaming LLM with model: {model}")
+    client = get_openai_client()
+    
+    parts = []
+    # The slot is held until the stream ends
+    with get_llm_dispatcher().slot(PRIORITY_INTERACTIVE, user_id):
+        # Only opening the stream is retried; chunks already yielded cannot be taken back
+        stream = call_with_retry("openai", model, lambda: client.chat.completions.create(
+            model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            reasoning_effort="low",
-            response_format={ "type": "json_object" }
-        )
+            reasoning_effort=reasoning_effort,
+            response_format={ "type": "json_object" },
+            stream=True,
+            stream_options={"include_usage": True}
+        ))
         
-        return response.choices[0].message.content
+        try:
+            for chunk in stream:
+                # The last chunk carries the usage and no choices
+                if usage is not None and chunk.usage:
+                    add_usage(usage, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            # Release the connection even if the consumer stops early
+            stream.close()
+    
+    if use_cache:
+        _write_llm_cache("".join(parts), exact_key, fuzzy_key)
 
+async def acall_llm(system_prompt: str, user_prompt: str, ret_format: str, model: str = "o3-mini", usage: Optional[Dict[str, int]] = None, reasoning_effort: str = "low", fuzzy_key: Optional[str] = None, use_cache: bool = True, priority: int = PRIORITY_INTERACTIVE, user_id: Optional[str] = None) -> Optional[str]:
+    """
+    Async version of call_llm, used by the ASGI endpoints.
+    
+    Shares the response cache, rate limiters and LLM slots with call_llm.
+    
+    Returns:
+        str: The model's response or None if the call failed
+    """
+    exact_key = make_cache_key("openai", model, system_prompt, user_prompt, reasoning_effort)
+    if use_cache:
+        # The cache may be a SQLite file, so it is read and written off the event loop
+        cached = await asyncio.to_thread(_read_llm_cache, exact_key, fuzzy_key)
+        if cached is not None:
+            print(f"Using cached LLM response for model: {model}")
+            return cached
+    
+    try:
+        print(f"Calling LLM with model: {model}")
+        client = get_async_openai_client()
+        
+        async with get_llm_dispatcher().aslot(priority, user_id):
+            response = await acall_with_retry("openai", model, lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                reasoning_effort=reasoning_effort,
+                response_format={ "type": "json_object" }
+            ))
+        
+        if usage is not None and response.usage:
+            add_usage(usage, response.usage)
+        
+        content = response.choices[0].message.content
+        if use_cache:
+            await asyncio.to_thread(_write_llm_cache, content, exact_key, fuzzy_key)
+        
+        return content
+    
     except Exception as e:
-        print(f"Error in call_llm: {str(e)}")
+        print(f"Error in acall_llm: {str(e)}")
         return None
 
-def generate_study_plan(system_prompt: str, user_prompt: str):
+async def astream_llm(system_prompt: str, user_prompt: str, model: str = "o3-mini", usage: Optional[Dict[str, int]] = None, reasoning_effort: str = "low", fuzzy_key: Optional[str] = None, use_cache: bool = True, user_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Async version of stream_llm, used by the ASGI endpoints.
+    
+    Yields:
+        str: Chunks of the model's response
+        
+    Raises:
+        Exception: If the API call fails; chunks already yielded are not retracted
+    """
+    exact_key = make_cache_key("openai", model, system_prompt, user_prompt, reasoning_effort)
+    if use_cache:
+        cached = await asyncio.to_thread(_read_llm_cache, exact_key, fuzzy_key)
+        if cached is not None:
+            print(f"Using cached LLM response for model: {model}")
+            yield cached
+            return
+    
+    print(f"Streaming LLM with model: {model}")
+    client = get_async_openai_client()
+    
+    parts = []
+    async with get_llm_dispatcher().aslot(PRIORITY_INTERACTIVE, user_id):
+        stream = await acall_with_retry("openai", model, lambda: client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            reasoning_effort=reasoning_effort,
+            response_format={ "type": "json_object" },
+            stream=True,
+            stream_options={"include_usage": True}
+        ))
+        
+        try:
+            async for chunk in stream:
+                if usage is not None and chunk.usage:
+                    add_usage(usage, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            await stream.close()
+    
+    if use_cache:
+        await asyncio.to_thread(_write_llm_cache, "".join(parts), exact_key, fuzzy_key)
+
+def submit_batch(batch_requests: List[Dict[str, Any]], model: str = "o3-mini", reasoning_effort: str = "low") -> str:
+    """
+    Submits chat completions to the OpenAI Batch API as one batch job.
+    
+    Batches cost half as much as synchronous calls and do not count against the
+    synchronous rate limits, but results may take up to the completion window.
+    
+    Args:
+        batch_requests (list): Dicts with "custom_id", "system_prompt" and "user_prompt"
+        model (str): The model to use
+        reasoning_effort (str): Reasoning effort of the model
+        
+    Returns:
+        str: The ID of the batch, see get_batch_results
+    """
+    lines = [json.dumps({
+        "custom_id": request["custom_id"],
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": request["system_prompt"]},
+                {"role": "user", "content": request["user_prompt"]}
+            ],
+            "reasoning_effort": reasoning_effort,
+            "response_format": { "type": "json_object" }
+        }
+    }) for request in batch_requests]
+    
+    client = get_openai_client()
+    input_file = call_with_retry("openai", "batch", lambda: client.files.create(
+        file=("batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    ))
+    batch = call_with_retry("openai", "batch", lambda: client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window=OPENAI_BATCH_COMPLETION_WINDOW
+    ))
+    print(f"Submitted batch {batch.id} with {len(batch_requests)} requests")
+    return batch.id
+
+def get_batch_results(batch_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Returns the results of a batch once it has finished.
+    
+    Args:
+        batch_id (str): The ID returned by submit_batch
+        
+    Returns:
+        dict: Per custom_id, the response "content" and its "usage", or an "error";
+              requests of an expired batch that were not processed are missing.
+              None while the batch is still running.
+        
+    Raises:
+        ValueError: If the batch failed or was cancelled
+    """
+    client = get_openai_client()
+    batch = call_with_retry("openai", "batch", lambda: client.batches.retrieve(batch_id))
+    if batch.status not in BATCH_FINISHED_STATES:
+        return None
+    if batch.status in ("failed", "cancelled"):
+        raise ValueError(f"Batch {batch_id} {batch.status}")
+    
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = call_with_retry("openai", "batch", lambda: client.files.content(file_id).text)
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                results[item["custom_id"]] = {"error": item.get("error") or body.get("error") or "Request failed"}
+                continue
+            results[item["custom_id"]] = {
+                "content": body["choices"][0]["message"]["content"],
+                "usage": body.get("usage") or {}
+            }
+    return results
+
+def _read_llm_cache(exact_key: str, fuzzy_key: Optional[str]) -> Optional[str]:
+    try:
+        for key in (exact_key, fuzzy_key):
+            if key:
+                cached = llm_cache.get(key)
+                if cached is not None:
+                    return cached
+    except Exception as e:
+        print(f"Error reading LLM cache: {str(e)}")
+    return None
+
+def _write_llm_cache(content: Optional[str], exact_key: str, fuzzy_key: Optional[str]) -> None:
+    # Never cache malformed output, it would be served again on every retry
+    try:
+        json.loads(content)
+    except (TypeError, ValueError):
+        return
+    try:
+        for key in (exact_key, fuzzy_key):
+            if key:
+                llm_cache.set(key, content)
+    except Exception as e:
+        print(f"Error writing LLM cache: {str(e)}")
+
+def add_usage(usage: Dict[str, int], response_usage) -> None:
+    """
+    Adds the token counts of an API response to a usage dict.
+    
+    Args:
+        usage (dict): Accumulated token counts
+        response_usage: The usage object of an OpenAI response
+    """
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        usage[key] = usage.get(key, 0) + (getattr(response_usage, key, 0) or 0)
+
+def generate_study_plan(system_prompt: str, user_prompt: str, fuzzy_key: Optional[str] = None, user_id: Optional[str] = None):
     """
     Generates a study plan using the LLM and parses the response.
     
     Args:
         prompt (str): The prompt for generating the study plan
+        fuzzy_key (str, optional): Cache key shared by equivalent requests
+        user_id (str, optional): User the plan is generated for
         
     Returns:
         dict: Parsed study plan data or None if generation failed
     """
-    response = call_llm(system_prompt, user_prompt, "StudyPlan")
+    response = call_llm(system_prompt, user_prompt, "StudyPlan", fuzzy_key=fuzzy_key, user_id=user_id)
     if not response:
         return None
     
@@ -71,6 +488,15 @@ def generate_study_plan(system_prompt: str, user_prompt: str):
         print(f"Error parsing study plan: {str(e)}")
         return None
 
+async def agenerate_study_plan(system_prompt: str, user_prompt: str, fuzzy_key: Optional[str] = None, user_id: Optional[str] = None):
+    """
+    Async version of generate_study_plan.
+    
+    Returns:
+        str: The study plan JSON or None if generation failed
+    """
+    return await acall_llm(system_prompt, user_prompt, "StudyPlan", fuzzy_key=fuzzy_key, user_id=user_id)
+
 def parse_day_section(section_lines: List[str]) -> Optional[Dict[str, Any]]:
     """
     Parses a section of text for a single day of the study plan.
@@ -168,21 +594,35 @@ def extract_day_number(day_title: str) -> int:
     except:
         return 0
 
-def generate_quiz(system_prompt: str, prompt: str) -> Optional[List[Dict[str, Any]]]:
+def generate_quiz(system_prompt: str, prompt: str, usage: Optional[Dict[str, int]] = None, fuzzy_key: Optional[str] = None, use_cache: bool = True, priority: int = PRIORITY_INTERACTIVE, user_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
     """
     Generates a quiz using the LLM and parses the response.
     
     Args:
         prompt (str): The prompt for generating the quiz
+        usage (dict, optional): Token counts of the call are added to this dict
+        fuzzy_key (str, optional): Cache key shared by equivalent requests
+        use_cache (bool): Whether to read and write the response cache
+        priority (int): Scheduling priority of the call, see llm_dispatcher
+        user_id (str, optional): User the quiz is generated for
         
     Returns:
         list: List of question objects or None if generation failed
     """
-    response = call_llm(system_prompt, prompt, "Question")
+    response = call_llm(system_prompt, prompt, "Question", usage=usage, fuzzy_key=fuzzy_key, use_cache=use_cache, priority=priority, user_id=user_id)
     
     return response
     
 
+async def agenerate_quiz(system_prompt: str, prompt: str, usage: Optional[Dict[str, int]] = None, fuzzy_key: Optional[str] = None, use_cache: bool = True, priority: int = PRIORITY_INTERACTIVE, user_id: Optional[str] = None) -> Optional[str]:
+    """
+    Async version of generate_quiz.
+    
+    Returns:
+        str: The quiz JSON or None if generation failed
+    """
+    return await acall_llm(system_prompt, prompt, "Question", usage=usage, fuzzy_key=fuzzy_key, use_cache=use_cache, priority=priority, user_id=user_id)
+
 def parse_quiz_text(text: str) -> List[Dict[str, Any]]:
     """
     Fallback parser for quiz text when JSON parsing fails.
@@ -0,0 +1,187 @@
+"""
+Service for reusing generated questions across study plans and quizzes.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, List
+
+from app.models.db import table
+from app.utils.cache import normalize_text
+
+QUESTION_BANK_PATH = os.getenv('QUESTION_BANK_PATH', './data/question_bank.db')
+QUESTION_BANK_ENABLED = os.getenv('QUESTION_BANK_ENABLED', '1') == '1'
+
+# Question fields copied when a banked question is reused
+QUESTION_FIELDS = ("passage", "question_text", "options", "correct_answer", "explanation", "difficulty")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS question_bank (
+    question_id TEXT PRIMARY KEY,
+    topic_key TEXT NOT NULL,
+    subtopic_key TEXT NOT NULL,
+    country_key TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    question TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS question_bank_lookup_idx
+    ON question_bank (topic_key, subtopic_key, country_key, difficulty);
+"""
+
+def _subtopic_key(subtopics) -> str:
+    if isinstance(subtopics, (list, tuple)):
+        return " | ".join(sorted(normalize_text(str(subtopic)) for subtopic in subtopics if subtopic))
+    return normalize_text(str(subtopics or ""))
+
+class QuestionBank:
+    """
+    Index of stored questions by normalized (topic, subtopic, country, difficulty).
+
+    The index lives in a local SQLite file next to the job queue; the questions
+    themselves stay in Supabase and the index keeps a copy of their content so
+    drawing from the bank needs no database round-trip.
+    """
+
+    def __init__(self, path: str = QUESTION_BANK_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, questions: List[Dict[str, Any]], topic: str, subtopics, country: str) -> int:
+        """
+        Adds stored questions to the index.
+
+        Args:
+            questions (list): Question rows, each with its database "id"
+            topic (str): Topic of the questions
+            subtopics: Subtopics of the questions, as a string or list
+            country (str): Country of the exam
+
+        Returns:
+            int: Number of questions indexed
+        """
+        now = time.time()
+        rows = [(
+            question["id"],
+            normalize_text(topic),
+            _subtopic_key(subtopics),
+            normalize_text(country),
+            normalize_text(question.get("difficulty") or "medium"),
+            json.dumps({field: question.get(field) for field in QUESTION_FIELDS}),
+            now
+        ) for question in questions if question.get("id") and question.get("question_text")]
+
+        self._connect().executemany(
+            "INSERT OR REPLACE INTO question_bank "
+            "(question_id, topic_key, subtopic_key, country_key, difficulty, question, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        return len(rows)
+
+    def draw(self, topic: str, subtopics, country: str, counts: Dict[str, int]) -> List[Dict[str, Any]]:
+        """
+        Picks random banked questions matching the topic, subtopics and country.
+
+        Args:
+            topic (str): Topic of the quiz
+            subtopics: Subtopics of the quiz, as a string or list
+            country (str): Country of the exam
+            counts (dict): Number of questions wanted per difficulty
+
+        Returns:
+            list: Question objects; each carries the ID of the question it was copied from
+                  in "source_question_id". May hold fewer questions than requested.
+        """
+        conn = self._connect()
+        drawn = []
+        for difficulty, count in counts.items():
+            if count <= 0:
+                continue
+            rows = conn.execute(
+                "SELECT question_id, question FROM question_bank "
+                "WHERE topic_key = ? AND subtopic_key = ? AND country_key = ? AND difficulty = ? "
+                "ORDER BY RANDOM() LIMIT ?",
+                (normalize_text(topic), _subtopic_key(subtopics), normalize_text(country), normalize_text(difficulty), count)
+            ).fetchall()
+            for question_id, question in rows:
+                drawn.append({**json.loads(question), "source_question_id": question_id})
+        return drawn
+
+    def backfill(self, page_size: int = 1000) -> int:
+        """
+        Indexes the questions already stored for study plan days.
+
+        The subtopics come from the question's day and the country from the exam
+        of the day's study plan, read in one query through resource embedding.
+
+        Args:
+            page_size (int): Number of questions read per request
+
+        Returns:
+            int: Number of questions indexed
+        """
+        indexed = 0
+        start = 0
+        while True:
+            result = table('questions').select(
+                '*, study_plan_days(subtopics, study_plans(exams(country)))'
+            ).order('id').range(start, start + page_size - 1).execute()
+            rows = result.data or []
+
+            for row in rows:
+                day = row.pop('study_plan_days', None) or {}
+                plan = day.get('study_plans') or {}
+                exam = plan.get('exams') or {}
+                indexed += self.add([row], row.get('topic', ''), day.get('subtopics', ''), exam.get('country', ''))
+
+            if len(rows) < page_size:
+                break
+            start += page_size
+
+        print(f"Indexed {indexed} questions into the question bank")
+        return indexed
+
+_bank = None
+_bank_lock = threading.Lock()
+
+def get_question_bank() -> QuestionBank:
+    """Returns the process-wide question bank."""
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            _bank = QuestionBank()
+        return _bank
+
+def shortfall(counts: Dict[str, int], questions: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Returns how many questions per difficulty are still missing.
+
+    Args:
+        counts (dict): Number of questions wanted per difficulty
+        questions (list): Questions already available
+
+    Returns:
+        dict: Missing questions per difficulty
+    """
+    available = {}
+    for question in questions:
+        difficulty = normalize_text(question.get("difficulty"))
+        available[difficulty] = available.get(difficulty, 0) + 1
+    return {difficulty: max(0, count - available.get(difficulty, 0)) for difficulty, count in counts.items()}
+
+if __name__ == '__main__':
+    get_question_bank().backfill()
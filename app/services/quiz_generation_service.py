@@ -0,0 +1,1007 @@
+"""
+Service for generating the daily quizzes of a study plan.
+"""
+import os
+import re
+import json
+import asyncio
+import math
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+
+from app.models.db import bulk_insert
+from app.services.job_queue import Job, JobQueue, DeferJob, get_job_queue, format_timestamp, STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED
+from app.services.llm_service import generate_quiz, agenerate_quiz, call_llm, acall_llm, build_fuzzy_cache_key, submit_batch, get_batch_results
+from app.services.llm_dispatcher import PRIORITY_INTERACTIVE, PRIORITY_DAY_ONE, PRIORITY_BACKGROUND, LLM_MAX_CONCURRENCY, LLM_INTERACTIVE_RESERVE
+from app.services.question_bank_service import get_question_bank, shortfall, QUESTION_BANK_ENABLED
+from app.utils.cache import normalize_text
+from app.utils.json_repair import loads_tolerant, record_failure
+from app.utils.ai_prompt_builder import build_quiz_prompt, build_prompt_to_validate_json, DEFAULT_QUIZ_DISTRIBUTION
+
+QUIZ_DAY_JOB = "quiz_day"
+QUIZ_BATCH_JOB = "quiz_batch"
+
+# "batch" generates the quizzes of every day but the first through the OpenAI Batch API
+QUIZ_BACKFILL_MODE = os.getenv('QUIZ_BACKFILL_MODE', 'sync')
+QUIZ_BATCH_POLL_INTERVAL = int(os.getenv('QUIZ_BATCH_POLL_INTERVAL', '60'))
+# Days still waiting for batch results after this many seconds are generated synchronously
+QUIZ_BATCH_DEADLINE = int(os.getenv('QUIZ_BATCH_DEADLINE', str(26 * 3600)))
+
+# Quizzes are generated by concurrent LLM calls of at most QUIZ_SHARD_SIZE questions each
+QUIZ_SHARD_SIZE = int(os.getenv('QUIZ_SHARD_SIZE', '20'))
+QUIZ_MAX_SHARDS = int(os.getenv('QUIZ_MAX_SHARDS', '8'))
+# Rounds of calls; later rounds only generate the questions still missing
+QUIZ_SHARD_ROUNDS = int(os.getenv('QUIZ_SHARD_ROUNDS', '2'))
+
+# Largest quiz a client may request from /api/quiz/generate
+QUIZ_MAX_QUESTIONS = int(os.getenv('QUIZ_MAX_QUESTIONS', '100'))
+
+ANSWER_LETTERS = ("A", "B", "C", "D")
+# Explanations naming an option by its letter, e.g. "B is correct", "(C)" or "alternativa D"
+_LETTER_REFERENCE = re.compile(
+    r"(?i:\b(?:option|alternative|answer|choice|letter|alternativa|opção|opcao|letra|resposta|item)[\s:]*(?:is\s+|é\s+)?)\(?[A-D]\b"
+    r"|\([A-D]\)|\b[A-D]\)|\b[A-D]\s+(?i:is|was|está|es)\b"
+)
+
+def normalize_topic(topics_for_the_day) -> str:
+    """
+    Reduces the topics of a day to the plain string stored in the questions table.
+
+    Args:
+        topics_for_the_day: Topic as a list or a string
+
+    Returns:
+        str: The topic without list brackets or quotes
+    """
+    topic_value = topics_for_the_day
+    # If topic is a list, extract just the string
+    if isinstance(topic_value, list):
+        topic_value = topic_value[0] if topic_value else ""
+    # If it's still a string with brackets and quotes, remove them
+    if isinstance(topic_value, str) and topic_value.startswith('[') and topic_value.endswith(']'):
+        topic_value = topic_value.strip('[]"\'')
+    return topic_value
+
+def generate_questions(
+    topics_for_the_day,
+    subtopics,
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    distribution: Optional[Dict[str, int]] = None,
+    usage: Optional[Dict[str, int]] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Builds a quiz from the question bank, generating only the missing questions with the LLM.
+
+    Args:
+        topics_for_the_day: Topic of the quiz
+        subtopics: Subtopics of the quiz
+        search_results (str): Search results from Perplexity
+        materials_content (str): Content from PDF materials
+        country (str): Country of the exam, used for the quiz language
+        distribution (dict, optional): Number of questions per difficulty
+        usage (dict, optional): Token counts of the LLM calls are added to this dict
+        priority (int): Scheduling priority of the LLM calls, see llm_dispatcher
+        user_id (str, optional): User the quiz is generated for, used for fair sharing
+
+    Returns:
+        list: The question objects; questions taken from the bank carry "source_question_id"
+
+    Raises:
+        Exception: If the quiz could not be generated or parsed
+    """
+    distribution = distribution or DEFAULT_QUIZ_DISTRIBUTION
+    topic_value = normalize_topic(topics_for_the_day)
+
+    banked = draw_banked_questions(topic_value, subtopics, country, distribution)
+    missing = shortfall(distribution, banked)
+    print(f"Quiz for {topic_value}: {len(banked)} questions from the bank, generating {sum(missing.values())}")
+    if sum(missing.values()) == 0:
+        return banked
+
+    generated = generate_sharded_questions(topics_for_the_day, subtopics, search_results, materials_content, country, missing, usage, priority, user_id)
+    return merge_questions(banked + generated, distribution)
+
+async def agenerate_questions(
+    topics_for_the_day,
+    subtopics,
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    distribution: Optional[Dict[str, int]] = None,
+    usage: Optional[Dict[str, int]] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Async version of generate_questions, used by the ASGI endpoints.
+    """
+    distribution = distribution or DEFAULT_QUIZ_DISTRIBUTION
+    topic_value = normalize_topic(topics_for_the_day)
+
+    # The question bank is a SQLite file whose locks may wait, so it is read off the event loop
+    banked = await asyncio.to_thread(draw_banked_questions, topic_value, subtopics, country, distribution)
+    missing = shortfall(distribution, banked)
+    print(f"Quiz for {topic_value}: {len(banked)} questions from the bank, generating {sum(missing.values())}")
+    if sum(missing.values()) == 0:
+        return banked
+
+    generated = await agenerate_sharded_questions(topics_for_the_day, subtopics, search_results, materials_content, country, missing, usage, priority, user_id)
+    return merge_questions(banked + generated, distribution)
+
+def draw_banked_questions(topic_value: str, subtopics, country: str, distribution: Dict[str, int]) -> List[Dict[str, Any]]:
+    """
+    Returns questions from the question bank for a quiz, or none if the bank is disabled or unavailable.
+    """
+    if not QUESTION_BANK_ENABLED:
+        return []
+    try:
+        return get_question_bank().draw(topic_value, subtopics, country, distribution)
+    except Exception as e:
+        print(f"Error reading question bank: {str(e)}")
+        return []
+
+def plan_shards(distribution: Dict[str, int], shard_size: int = QUIZ_SHARD_SIZE, max_shards: int = QUIZ_MAX_SHARDS) -> List[Dict[str, Dict[str, int]]]:
+    """
+    Splits a quiz into parts of similar size that are generated by separate LLM calls.
+
+    Args:
+        distribution (dict): Number of questions per difficulty
+        shard_size (int): Maximum number of questions per part, unless max_shards is reached
+        max_shards (int): Maximum number of parts
+
+    Returns:
+        list: Per part, its "distribution" of difficulties and the number of
+              correct answers wanted per option letter in "answer_letters"
+    """
+    total = sum(count for count in distribution.values() if count > 0)
+    if total == 0:
+        return []
+    shard_count = min(max_shards, math.ceil(total / shard_size))
+    size = math.ceil(total / shard_count)
+
+    shards = [{}]
+    filled = 0
+    for difficulty, count in distribution.items():
+        while count > 0:
+            if filled == size:
+                shards.append({})
+                filled = 0
+            take = min(count, size - filled)
+            shards[-1][difficulty] = shards[-1].get(difficulty, 0) + take
+            count -= take
+            filled += take
+
+    # Hand out the correct answer letters round-robin across all parts
+    plan = []
+    letter_index = 0
+    for shard in shards:
+        answer_letters = {}
+        for _ in range(sum(shard.values())):
+            letter = ANSWER_LETTERS[letter_index % len(ANSWER_LETTERS)]
+            answer_letters[letter] = answer_letters.get(letter, 0) + 1
+            letter_index += 1
+        plan.append({"distribution": shard, "answer_letters": answer_letters})
+    return plan
+
+def generate_sharded_questions(
+    topics_for_the_day,
+    subtopics,
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    distribution: Dict[str, int],
+    usage: Optional[Dict[str, int]] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Generates questions with concurrent LLM calls, each for a part of the distribution.
+
+    A failed or short part only costs its own questions: the next round generates
+    what is still missing, up to QUIZ_SHARD_ROUNDS rounds.
+
+    Args:
+        topics_for_the_day: Topic of the quiz
+        subtopics: Subtopics of the quiz
+        search_results (str): Search results from Perplexity
+        materials_content (str): Content from PDF materials
+        country (str): Country of the exam, used for the quiz language
+        distribution (dict): Number of questions per difficulty
+        usage (dict, optional): Token counts of the LLM calls are added to this dict
+        priority (int): Scheduling priority of the LLM calls, see llm_dispatcher
+        user_id (str, optional): User the quiz is generated for, used for fair sharing
+
+    Returns:
+        list: The generated question objects, possibly fewer than requested
+
+    Raises:
+        Exception: If no question could be generated
+    """
+    topic_value = normalize_topic(topics_for_the_day)
+    generated = []
+    error = None
+
+    for round_num in range(QUIZ_SHARD_ROUNDS):
+        missing = shortfall(distribution, select_questions(generated, distribution))
+        if sum(missing.values()) == 0:
+            break
+        shards = plan_shards(missing)
+        print(f"Quiz for {topic_value}: round {round_num + 1}, {len(shards)} parallel calls for {sum(missing.values())} questions")
+
+        shard_usages = [{} for _ in shards]
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [pool.submit(
+                _generate_shard,
+                topics_for_the_day, subtopics, search_results, materials_content, country,
+                shard, (index, len(shards)), round_num, shard_usages[index], priority, user_id
+            ) for index, shard in enumerate(shards)]
+
+            for index, future in enumerate(futures):
+                try:
+                    generated.extend(future.result())
+                except Exception as e:
+                    error = e
+                    print(f"Quiz part {index + 1}/{len(shards)} for {topic_value} failed: {str(e)}")
+
+        if usage is not None:
+            for shard_usage in shard_usages:
+                for key, value in shard_usage.items():
+                    usage[key] = usage.get(key, 0) + value
+
+    if not generated:
+        raise error or ValueError("LLM returned no questions")
+    return generated
+
+async def agenerate_sharded_questions(
+    topics_for_the_day,
+    subtopics,
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    distribution: Dict[str, int],
+    usage: Optional[Dict[str, int]] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Async version of generate_sharded_questions: the parts run as concurrent tasks instead of threads.
+    """
+    topic_value = normalize_topic(topics_for_the_day)
+    generated = []
+    error = None
+
+    for round_num in range(QUIZ_SHARD_ROUNDS):
+        missing = shortfall(distribution, select_questions(generated, distribution))
+        if sum(missing.values()) == 0:
+            break
+        shards = plan_shards(missing)
+        print(f"Quiz for {topic_value}: round {round_num + 1}, {len(shards)} parallel calls for {sum(missing.values())} questions")
+
+        results = await asyncio.gather(*(
+            _agenerate_shard(
+                topics_for_the_day, subtopics, search_results, materials_content, country,
+                shard, (index, len(shards)), round_num, usage if usage is not None else {}, priority, user_id
+            ) for index, shard in enumerate(shards)
+        ), return_exceptions=True)
+
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                error = result
+                print(f"Quiz part {index + 1}/{len(shards)} for {topic_value} failed: {str(result)}")
+            else:
+                generated.extend(result)
+
+    if not generated:
+        raise error or ValueError("LLM returned no questions")
+    return generated
+
+def _shard_prompt(
+    topics_for_the_day,
+    subtopics,
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    shard: Dict[str, Dict[str, int]],
+    part: tuple
+):
+    """
+    Builds the prompts and cache key of one part of a quiz.
+
+    Returns:
+        tuple: (system_prompt, prompt, fuzzy_key)
+    """
+    system_prompt, prompt = build_quiz_prompt(
+        topics_for_the_day, subtopics, search_results, materials_content, country,
+        shard["distribution"], shard["answer_letters"], part
+    )
+
+    # Quizzes with the same topics for the same country share generated questions
+    fuzzy_key = build_fuzzy_cache_key(
+        "quiz", "", country, topics_for_the_day, subtopics,
+        sorted(shard["distribution"].items()), sorted(shard["answer_letters"].items()), part
+    )
+    return system_prompt, prompt, fuzzy_key
+
+def _generate_shard(
+    topics_for_the_day,
+    subtopics,
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    shard: Dict[str, Dict[str, int]],
+    part: tuple,
+    round_num: int,
+    usage: Dict[str, int],
+    priority: int = PRIORITY_INTERACTIVE,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    topic_value = normalize_topic(topics_for_the_day)
+    system_prompt, prompt, fuzzy_key = _shard_prompt(topics_for_the_day, subtopics, search_results, materials_content, country, shard, part)
+    # Retry rounds must not be answered with the cached response of an earlier round
+    questions = generate_quiz(system_prompt, prompt, usage=usage, fuzzy_key=fuzzy_key, use_cache=round_num == 0, priority=priority, user_id=user_id)
+
+    if not questions:
+        raise ValueError("LLM returned no questions")
+
+    # Parse JSON if it's returned as a string
+    if isinstance(questions, str):
+        try:
+            # Common defects are repaired locally
+            questions = loads_tolerant(questions)
+        except json.JSONDecodeError as e:
+            print(f"Failed to parse questions JSON for {topic_value}: {str(e)}")
+            record_failure(questions)
+            # Last resort: ask the LLM to fix the JSON
+            print("Trying to fix JSON")
+            system_prompt_json, user_prompt_json = build_prompt_to_validate_json(questions)
+            questions = call_llm(system_prompt_json, user_prompt_json, "JSON", usage=usage, priority=priority, user_id=user_id)
+            questions = loads_tolerant(questions)
+
+    return fill_difficulty(unwrap_questions(questions), shard["distribution"])
+
+async def _agenerate_shard(
+    topics_for_the_day,
+    subtopics,
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    shard: Dict[str, Dict[str, int]],
+    part: tuple,
+    round_num: int,
+    usage: Dict[str, int],
+    priority: int = PRIORITY_INTERACTIVE,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    topic_value = normalize_topic(topics_for_the_day)
+    system_prompt, prompt, fuzzy_key = _shard_prompt(topics_for_the_day, subtopics, search_results, materials_content, country, shard, part)
+    questions = await agenerate_quiz(system_prompt, prompt, usage=usage, fuzzy_key=fuzzy_key, use_cache=round_num == 0, priority=priority, user_id=user_id)
+
+    if not questions:
+        raise ValueError("LLM returned no questions")
+
+    try:
+        questions = loads_tolerant(questions)
+    except json.JSONDecodeError as e:
+        print(f"Failed to parse questions JSON for {topic_value}: {str(e)}")
+        record_failure(questions)
+        system_prompt_json, user_prompt_json = build_prompt_to_validate_json(questions)
+        questions = await acall_llm(system_prompt_json, user_prompt_json, "JSON", usage=usage, priority=priority, user_id=user_id)
+        questions = loads_tolerant(questions)
+
+    return fill_difficulty(unwrap_questions(questions), shard["distribution"])
+
+def unwrap_questions(parsed) -> List[Dict[str, Any]]:
+    """
+    Returns the question objects of a parsed LLM response, which may wrap them in an object.
+    """
+    if isinstance(parsed, dict):
+        parsed = parsed['questions'] if "questions" in parsed else parsed['output']
+    return [question for question in parsed if isinstance(question, dict)]
+
+def fill_difficulty(questions: List[Dict[str, Any]], distribution: Dict[str, int]) -> List[Dict[str, Any]]:
+    """
+    Sets the difficulty of questions that have none, or one not asked for, in place.
+
+    select_questions drops questions whose difficulty is not in the distribution,
+    so each such question gets the requested difficulty that is still furthest
+    from its count, which for a single-difficulty request is that difficulty.
+
+    Args:
+        questions (list): The question objects of one LLM call
+        distribution (dict): Number of questions per difficulty the call asked for
+
+    Returns:
+        list: The same question objects
+    """
+    requested = {normalize_text(difficulty): count for difficulty, count in distribution.items() if count > 0}
+    if not requested:
+        return questions
+    counts = {difficulty: 0 for difficulty in requested}
+    unknown = []
+    for question in questions:
+        difficulty = normalize_text(question.get('difficulty'))
+        if difficulty in counts:
+            counts[difficulty] += 1
+        else:
+            unknown.append(question)
+    for question in unknown:
+        difficulty = max(requested, key=lambda name: requested[name] - counts[name])
+        question['difficulty'] = difficulty
+        counts[difficulty] += 1
+    return questions
+
+def _question_key(question: Dict[str, Any]) -> tuple:
+    return normalize_text(str(question.get('passage') or '')), normalize_text(str(question.get('question_text') or ''))
+
+def merge_questions(questions: List[Dict[str, Any]], distribution: Dict[str, int]) -> List[Dict[str, Any]]:
+    """
+    Merges questions from several sources into one quiz.
+
+    Selects the questions with select_questions, then permutes their options so
+    the correct answers are spread evenly over A-D.
+
+    Args:
+        questions (list): The question objects
+        distribution (dict): Number of questions per difficulty
+
+    Returns:
+        list: The merged question objects
+    """
+    merged = select_questions(questions, distribution)
+    balance_answers(merged)
+    return merged
+
+def select_questions(questions: List[Dict[str, Any]], distribution: Dict[str, int]) -> List[Dict[str, Any]]:
+    """
+    Drops duplicate questions (same passage and question text) and caps each
+    difficulty at its count in the distribution. Earlier questions win, so
+    questions from the bank should come first.
+
+    Args:
+        questions (list): The question objects
+        distribution (dict): Number of questions per difficulty
+
+    Returns:
+        list: The selected question objects
+    """
+    seen = set()
+    counts = {}
+    selected = []
+    for question in questions:
+        key = _question_key(question)
+        difficulty = normalize_text(question.get('difficulty'))
+        if not key[1] or key in seen or counts.get(difficulty, 0) >= distribution.get(difficulty, 0):
+            continue
+        seen.add(key)
+        counts[difficulty] = counts.get(difficulty, 0) + 1
+        selected.append(question)
+    return selected
+
+def _options_by_letter(question: Dict[str, Any]) -> Optional[Dict[str, Dict[str, Any]]]:
+    options = question.get('options')
+    if not isinstance(options, list):
+        return None
+    by_letter = {
+        str(option.get('option', '')).strip().upper(): option
+        for option in options if isinstance(option, dict)
+    }
+    if set(ANSWER_LETTERS) - set(by_letter):
+        return None
+    if str(question.get('correct_answer', '')).strip().upper() not in by_letter:
+        return None
+    return by_letter
+
+def balance_answers(questions: List[Dict[str, Any]]) -> None:
+    """
+    Permutes the options of questions in place so each letter is the correct answer equally often.
+
+    Questions whose options are not labelled A-D are left as they are, and so
+    are questions whose explanation names an option by its letter, which a
+    permutation would make wrong.
+
+    Args:
+        questions (list): The question objects
+    """
+    labelled = [(question, options) for question, options in
+                ((question, _options_by_letter(question)) for question in questions) if options]
+    if not labelled:
+        return
+
+    counts = {letter: 0 for letter in ANSWER_LETTERS}
+    for question, _ in labelled:
+        counts[str(question['correct_answer']).strip().upper()] += 1
+
+    # The letters used most get the remainder, so as few questions as possible change
+    base, remainder = divmod(len(labelled), len(ANSWER_LETTERS))
+    by_usage = sorted(ANSWER_LETTERS, key=lambda letter: -counts[letter])
+    targets = {letter: base + (1 if index < remainder else 0) for index, letter in enumerate(by_usage)}
+
+    for question, options in labelled:
+        letter = str(question['correct_answer']).strip().upper()
+        if counts[letter] <= targets[letter] or _LETTER_REFERENCE.search(str(question.get('explanation') or '')):
+            continue
+        target = next(other for other in ANSWER_LETTERS if counts[other] < targets[other])
+        options[letter]['text'], options[target]['text'] = options[target].get('text'), options[letter].get('text')
+        question['correct_answer'] = target
+        counts[letter] -= 1
+        counts[target] += 1
+
+def generate_day_questions(
+    day: Dict[str, Any],
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    usage: Optional[Dict[str, int]] = None,
+    priority: int = PRIORITY_BACKGROUND,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Generates the questions for a single study plan day.
+
+    Args:
+        day (dict): The day entry from the study plan's day_topics
+        search_results (str): Search results from Perplexity
+        materials_content (str): Content from PDF materials
+        country (str): Country of the exam, used for the quiz language
+        usage (dict, optional): Token counts of the LLM calls are added to this dict
+        priority (int): Scheduling priority of the LLM calls, see llm_dispatcher
+        user_id (str, optional): User the plan belongs to, used for fair sharing
+
+    Returns:
+        list: The question objects
+
+    Raises:
+        Exception: If the quiz could not be generated or parsed
+    """
+    topics_for_the_day = [day.get('topics_for_the_day', '')]
+    print(f"Generating quiz for day {day.get('day_num', 0)} with topics: {topics_for_the_day}")
+
+    return generate_questions(topics_for_the_day, day.get('subtopics', ''), search_results, materials_content, country, usage=usage, priority=priority, user_id=user_id)
+
+def index_new_questions(questions: List[Dict[str, Any]], rows: List[Dict[str, Any]], topic: str, subtopics, country: str) -> None:
+    """
+    Adds freshly generated questions to the question bank.
+
+    Args:
+        questions (list): The question objects, in the same order as rows
+        rows (list): The stored rows, or None where storing failed
+        topic (str): Topic of the questions
+        subtopics: Subtopics of the questions
+        country (str): Country of the exam
+    """
+    if not QUESTION_BANK_ENABLED:
+        return
+    # Questions copied from the bank are already indexed under their original ID
+    new_rows = [row for question, row in zip(questions, rows) if row and not question.get('source_question_id')]
+    try:
+        get_question_bank().add(new_rows, topic, subtopics, country)
+    except Exception as e:
+        print(f"Error indexing questions into the question bank: {str(e)}")
+
+def build_question_rows(questions: List[Dict[str, Any]], quiz_id: str, difficulty: str):
+    """
+    Builds the Questions rows of a generated quiz, skipping questions with an invalid format.
+
+    Returns:
+        tuple: (valid_questions, question_rows)
+    """
+    valid_questions = [
+        question for question in questions
+        if isinstance(question, dict) and 'question_text' in question and 'options' in question
+    ]
+    question_rows = [{
+        "id": str(uuid.uuid4()),
+        "quiz_id": quiz_id,
+        "question_text": question.get('question_text', ''),
+        "options": question.get('options', []),
+        "correct_answer": question.get('correct_answer', ''),
+        "explanation": question.get('explanation', ''),
+        "topic": question.get('topic', ''),
+        "difficulty": question.get('difficulty', difficulty)
+    } for question in valid_questions]
+    return valid_questions, question_rows
+
+def parse_num_questions(value) -> int:
+    """
+    Reads the number of questions a client asked for, as an int or a numeric string.
+
+    Raises:
+        ValueError: If it is not an integer between 1 and QUIZ_MAX_QUESTIONS; the
+            message is safe to return to the client
+    """
+    if isinstance(value, bool):
+        raise ValueError("num_questions must be an integer")
+    try:
+        num_questions = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("num_questions must be an integer")
+    if isinstance(value, float) and value != num_questions:
+        raise ValueError("num_questions must be an integer")
+    if not 1 <= num_questions <= QUIZ_MAX_QUESTIONS:
+        raise ValueError(f"num_questions must be between 1 and {QUIZ_MAX_QUESTIONS}")
+    return num_questions
+
+def public_questions(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Returns the questions without fields only used internally, such as "source_question_id", for API responses.
+    """
+    return [{key: value for key, value in question.items() if key != 'source_question_id'} for question in questions]
+
+def index_stored_questions(valid_questions: List[Dict[str, Any]], question_rows: List[Dict[str, Any]], insert_result, quiz_id: str, topics_of_the_day, subtopics, country: str) -> None:
+    """
+    Adds the stored questions of a quiz to the question bank, skipping the rows whose insert failed.
+    """
+    failed_ids = set()
+    for failure in insert_result.failed:
+        failed_ids.add(failure['row']['id'])
+        print(f"Failed to insert question for quiz {quiz_id}: {failure['error']}")
+
+    index_new_questions(
+        valid_questions,
+        [row if row['id'] not in failed_ids else None for row in question_rows],
+        normalize_topic(topics_of_the_day),
+        subtopics,
+        country
+    )
+
+def store_day_questions(questions: List[Dict[str, Any]], day_id: str, topics_for_the_day, subtopics="", country: str = "") -> int:
+    """
+    Stores the questions of a study plan day and indexes the new ones in the question bank.
+
+    Question IDs are derived from the day ID and the question position, so storing
+    the same questions again (e.g. when a job is retried) overwrites instead of duplicating.
+
+    Args:
+        questions (list): The question objects
+        day_id (str): The ID of the study plan day
+        topics_for_the_day: Topic of the day
+        subtopics: Subtopics of the day
+        country (str): Country of the exam
+
+    Returns:
+        int: Number of questions stored
+    """
+    topic_value = normalize_topic(topics_for_the_day)
+    rows = [{
+        "id": str(uuid.uuid5(uuid.UUID(day_id), str(index))),
+        "study_plan_days_id": day_id,
+        "passage": question.get('passage', ''),
+        "question_text": question.get('question_text', ''),
+        "options": question.get('options', []),
+        "correct_answer": question.get('correct_answer', ''),
+        "explanation": question.get('explanation', ''),
+        "topic": topic_value,
+        "difficulty": question.get('difficulty', 'medium')  # Default to medium if not specified
+    } for index, question in enumerate(questions)]
+
+    result = bulk_insert('questions', rows, upsert=True)
+    failed_ids = set()
+    for failure in result.failed:
+        failed_ids.add(failure['row']['id'])
+        print(f"Error inserting question for day {day_id}: {failure['error']}")
+
+    index_new_questions(questions, [row if row['id'] not in failed_ids else None for row in rows], topic_value, subtopics, country)
+
+    return result.written_count
+
+def enqueue_plan_quizzes(
+    study_plan_id: str,
+    study_plan_data: Dict[str, Any],
+    day_ids_map: Dict[int, str],
+    search_results: Optional[str],
+    materials_content: Optional[str],
+    country: str,
+    backfill_mode: str = QUIZ_BACKFILL_MODE,
+    user_id: Optional[str] = None,
+    first_day_priority: int = PRIORITY_DAY_ONE
+) -> List[str]:
+    """
+    Queues one quiz generation job per day of a study plan.
+
+    The jobs are processed by the job workers, which bound how many days are
+    generated at the same time and retry failed days independently.
+
+    In "batch" backfill mode only the first day is generated right away; the
+    other days wait for a quiz_batch job that generates them through the OpenAI
+    Batch API, at half the cost and without competing with interactive requests.
+
+    The first day is generated at day-one priority, ahead of the background
+    days of every plan, since it is the quiz the user is about to open.
+
+    Args:
+        study_plan_id (str): The ID of the study plan
+        study_plan_data (dict): The study plan data
+        day_ids_map (dict): Mapping of day numbers to day IDs
+        search_results (str): Search results from Perplexity
+        materials_content (str): Content from PDF materials
+        country (str): Country of the exam
+        backfill_mode (str): "sync" or "batch"
+        user_id (str, optional): User the plan belongs to, used for fair sharing
+        first_day_priority (int): Priority of the first given day, e.g. PRIORITY_BACKGROUND
+                                  when the plan's actual first day was queued earlier
+
+    Returns:
+        list: The IDs of the queued jobs
+    """
+    queue = get_job_queue()
+    days = [day for day in study_plan_data.get('day_topics', []) if day.get('day_num', 0) in day_ids_map]
+    first_day_num = min((day.get('day_num', 0) for day in days), default=None)
+    use_batch = backfill_mode == "batch" and len(days) > 1
+
+    job_ids = []
+    batch_days = []
+    for day in days:
+        day_num = day.get('day_num', 0)
+        payload = {
+            "day": day,
+            "day_id": day_ids_map[day_num],
+            "search_results": search_results,
+            "materials_content": materials_content,
+            "country": country,
+            "user_id": user_id,
+            "priority": first_day_priority if day_num == first_day_num else PRIORITY_BACKGROUND
+        }
+        in_batch = use_batch and day_num != first_day_num
+        if in_batch:
+            payload["mode"] = "batch"
+            payload["batch_deadline"] = time.time() + QUIZ_BATCH_DEADLINE
+        job_id = queue.enqueue(QUIZ_DAY_JOB, payload, group_id=study_plan_id, day_num=day_num)
+        job_ids.append(job_id)
+        if in_batch:
+            batch_days.append({"job_id": job_id, "day": day})
+
+    if batch_days:
+        job_ids.append(queue.enqueue(
+            QUIZ_BATCH_JOB,
+            {
+                "days": batch_days,
+                "search_results": search_results,
+                "materials_content": materials_content,
+                "country": country
+            },
+            group_id=study_plan_id
+        ))
+    return job_ids
+
+def run_quiz_day_job(job: Job, queue: JobQueue) -> Dict[str, Any]:
+    """
+    Job handler that generates and stores the quiz of one study plan day.
+
+    The generated questions are saved in the job payload before they are stored,
+    so a retry after a crash or a failed insert does not pay for the LLM call again.
+    Days in batch mode wait for their quiz_batch job to put the questions in
+    the payload, and are generated here if that does not happen by their deadline.
+
+    Args:
+        job (Job): The claimed quiz_day job
+        queue (JobQueue): The queue the job was claimed from
+
+    Returns:
+        dict: The job result
+    """
+    payload = job.payload
+    day = payload["day"]
+
+    questions = payload.get("questions")
+    if questions is None and payload.get("mode") == "batch":
+        if time.time() < payload.get("batch_deadline", 0):
+            raise DeferJob(QUIZ_BATCH_POLL_INTERVAL, "Waiting for batch results")
+        print(f"Day {day.get('day_num', 0)}: no batch results before the deadline, generating synchronously")
+
+    if questions is None:
+        usage = {}
+        questions = generate_day_questions(
+            day, payload.get("search_results"), payload.get("materials_content"), payload.get("country", ""), usage=usage,
+            priority=payload.get("priority", PRIORITY_BACKGROUND), user_id=payload.get("user_id")
+        )
+        payload["questions"] = questions
+        payload["usage"] = usage
+        queue.update_payload(job.id, payload)
+
+    inserted = store_day_questions(questions, payload["day_id"], [day.get('topics_for_the_day', '')], day.get('subtopics', ''), payload.get("country", ""))
+    if inserted == 0:
+        raise ValueError("No questions could be stored")
+
+    print(f"Day {day.get('day_num', 0)}: stored {inserted} questions")
+    return {"questions": inserted, "usage": payload.get("usage", {})}
+
+def run_quiz_batch_job(job: Job, queue: JobQueue) -> Dict[str, Any]:
+    """
+    Job handler that generates the quizzes of several study plan days with one batch.
+
+    The first run draws what it can from the question bank, submits the missing
+    questions of every day as one OpenAI batch and defers itself. Later runs poll
+    the batch; once it has finished, each day's questions are merged and handed
+    to the day's quiz_day job through its payload. Days without usable results
+    are switched back to synchronous generation.
+
+    Args:
+        job (Job): The claimed quiz_batch job
+        queue (JobQueue): The queue the job was claimed from
+
+    Returns:
+        dict: The job result
+    """
+    payload = job.payload
+    country = payload.get("country", "")
+
+    if not payload.get("batch_id"):
+        requests = []
+        pending = {}
+        for entry in payload["days"]:
+            day = entry["day"]
+            topics_for_the_day = [day.get('topics_for_the_day', '')]
+            subtopics = day.get('subtopics', '')
+            banked = draw_banked_questions(normalize_topic(topics_for_the_day), subtopics, country, DEFAULT_QUIZ_DISTRIBUTION)
+            missing = shortfall(DEFAULT_QUIZ_DISTRIBUTION, banked)
+            if sum(missing.values()) == 0:
+                _hand_over_day(queue, entry["job_id"], banked, {})
+                continue
+
+            shards = plan_shards(missing)
+            custom_ids = []
+            for index, shard in enumerate(shards):
+                system_prompt, prompt = build_quiz_prompt(
+                    topics_for_the_day, subtopics, payload.get("search_results"), payload.get("materials_content"), country,
+                    shard["distribution"], shard["answer_letters"], (index, len(shards))
+                )
+                custom_id = f"{entry['job_id']}:{index}"
+                requests.append({"custom_id": custom_id, "system_prompt": system_prompt, "user_prompt": prompt})
+                custom_ids.append(custom_id)
+            pending[entry["job_id"]] = {
+                "banked": banked, "custom_ids": custom_ids,
+                "distributions": [shard["distribution"] for shard in shards]
+            }
+
+        if not requests:
+            return {"days": len(payload["days"]), "requests": 0}
+
+        payload["batch_id"] = submit_batch(requests)
+        payload["pending"] = pending
+        queue.update_payload(job.id, payload)
+        raise DeferJob(QUIZ_BATCH_POLL_INTERVAL, "Waiting for batch results")
+
+    pending = payload.get("pending", {})
+    try:
+        results = get_batch_results(payload["batch_id"])
+    except ValueError as e:
+        print(f"Batch {payload['batch_id']} did not complete: {str(e)}")
+        for job_id in pending:
+            _hand_over_day(queue, job_id, None, None)
+        return {"days": len(pending), "delivered": 0, "error": str(e)}
+
+    if results is None:
+        raise DeferJob(QUIZ_BATCH_POLL_INTERVAL, "Waiting for batch results")
+
+    delivered = 0
+    for job_id, entry in pending.items():
+        usage = {}
+        generated = []
+        distributions = entry.get("distributions") or [{}] * len(entry["custom_ids"])
+        for custom_id, distribution in zip(entry["custom_ids"], distributions):
+            result = results.get(custom_id) or {}
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                usage[key] = usage.get(key, 0) + ((result.get("usage") or {}).get(key) or 0)
+            if not result.get("content"):
+                print(f"Batch request {custom_id} returned no result: {result.get('error')}")
+                continue
+            try:
+                generated.extend(fill_difficulty(unwrap_questions(loads_tolerant(result["content"])), distribution))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Failed to parse batch result {custom_id}: {str(e)}")
+                record_failure(result["content"])
+
+        if generated:
+            _hand_over_day(queue, job_id, merge_questions(entry["banked"] + generated, DEFAULT_QUIZ_DISTRIBUTION), usage)
+            delivered += 1
+        else:
+            _hand_over_day(queue, job_id, None, None)
+
+    print(f"Batch {payload['batch_id']}: delivered questions for {delivered} of {len(pending)} days")
+    return {"days": len(pending), "delivered": delivered, "batch_id": payload["batch_id"]}
+
+def _hand_over_day(queue: JobQueue, job_id: str, questions: Optional[List[Dict[str, Any]]], usage: Optional[Dict[str, int]]) -> None:
+    # Gives a waiting quiz_day job its questions, or lets it generate them itself when questions is None
+    day_job = queue.get(job_id)
+    if day_job is None or day_job.status in (STATUS_DONE, STATUS_FAILED):
+        return
+    day_payload = day_job.payload
+    if day_payload.get("questions") is not None:
+        return
+    day_payload.pop("mode", None)
+    if questions is not None:
+        day_payload["questions"] = questions
+        day_payload["usage"] = usage
+    queue.update_payload(job_id, day_payload)
+
+def parallel_days(job_concurrency: int) -> int:
+    """
+    Returns how many quiz days a job worker of this process generates at the same time.
+
+    Each day fans out into several LLM calls that share the process' cap on
+    background calls, so fewer days than job slots may actually progress.
+
+    Args:
+        job_concurrency (int): Jobs the worker runs at the same time
+    """
+    shards_per_day = len(plan_shards(DEFAULT_QUIZ_DISTRIBUTION))
+    background_capacity = max(1, LLM_MAX_CONCURRENCY - max(0, LLM_INTERACTIVE_RESERVE))
+    return max(1, min(job_concurrency, background_capacity // shards_per_day))
+
+def get_plan_quiz_status(study_plan_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Summarizes the quiz generation progress of a study plan from its jobs.
+
+    Args:
+        study_plan_id (str): The ID of the study plan
+
+    Returns:
+        dict: Per-day state, timings, token usage and ETA, or None if the plan has no jobs
+    """
+    jobs = [job for job in get_job_queue().list_group(study_plan_id) if job.kind == QUIZ_DAY_JOB]
+    if not jobs:
+        return None
+
+    now = time.time()
+    days = []
+    counts = {STATUS_QUEUED: 0, STATUS_RUNNING: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+    tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    done_durations = []
+
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+        usage = (job.result or {}).get("usage") or job.payload.get("usage") or {}
+        for key in tokens:
+            tokens[key] += usage.get(key, 0)
+
+        duration = None
+        if job.started_at:
+            duration = (job.finished_at or now) - job.started_at
+            if job.status == STATUS_DONE:
+                done_durations.append(duration)
+
+        days.append({
+            "day_num": job.day_num,
+            "day_id": job.payload.get("day_id"),
+            "job_id": job.id,
+            "state": job.status,
+            "attempts": job.attempts,
+            "queued_at": format_timestamp(job.created_at),
+            "started_at": format_timestamp(job.started_at),
+            "finished_at": format_timestamp(job.finished_at),
+            "duration_seconds": round(duration, 1) if duration is not None else None,
+            "questions": (job.result or {}).get("questions", 0),
+            "tokens": usage,
+            "error": job.last_error if job.status != STATUS_DONE else None
+        })
+
+    remaining = counts[STATUS_QUEUED] + counts[STATUS_RUNNING]
+    eta_seconds = None
+    if remaining == 0:
+        eta_seconds = 0
+    elif done_durations:
+        # Days run in parallel on the live job workers, whichever process they run in
+        parallelism = get_job_queue().worker_capacity()
+        if parallelism:
+            average = sum(done_durations) / len(done_durations)
+            eta_seconds = round(average * math.ceil(remaining / parallelism), 1)
+
+    if remaining:
+        state = STATUS_RUNNING if counts[STATUS_RUNNING] or counts[STATUS_DONE] else STATUS_QUEUED
+    else:
+        state = STATUS_FAILED if counts[STATUS_FAILED] == len(jobs) else STATUS_DONE
+
+    return {
+        "study_plan_id": study_plan_id,
+        "state": state,
+        "summary": {"total": len(jobs), **counts},
+        "tokens": tokens,
+        "eta_seconds": eta_seconds,
+        "days": days
+    }
@@ -0,0 +1,331 @@
+"""
+Rate limiting, retries and circuit breaking for calls to external APIs.
+"""
+import os
+import time
+import asyncio
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+# Requests per minute allowed per provider and model, per process
+PROVIDER_RATE_LIMITS = {
+    "openai": float(os.getenv('OPENAI_REQUESTS_PER_MINUTE', '500')),
+    "perplexity": float(os.getenv('PERPLEXITY_REQUESTS_PER_MINUTE', '50')),
+}
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '10'))
+
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '1'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '60'))
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+
+# Status codes worth retrying; other client errors fail immediately
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider that keeps failing."""
+
+class TokenBucket:
+    """
+    Token bucket that adapts its rate to the provider.
+
+    Each call takes a token; tokens refill at the current rate up to the burst
+    size. A 429 response halves the rate and honors Retry-After by pausing the
+    bucket; every success raises the rate again towards the configured limit.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = RATE_LIMIT_BURST):
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = self.max_rate / 16
+        self.rate = self.max_rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.paused_until = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _take(self) -> float:
+        """
+        Takes a token if one is available; otherwise returns how long to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self.paused_until and self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return max(self.paused_until - now, (1 - self.tokens) / self.rate)
+
+    def acquire(self) -> None:
+        """
+        Blocks until a call is allowed.
+        """
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """
+        Waits until a call is allowed without blocking the event loop.
+        """
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops handing out tokens for the given time, e.g. as asked by Retry-After.
+        """
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def throttle(self) -> None:
+        """
+        Halves the rate after the provider reported a rate limit.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 1.0)
+
+    def recover(self) -> None:
+        """
+        Raises the rate a little after a successful call.
+        """
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class CircuitBreaker:
+    """
+    Stops calls to a provider after consecutive failures.
+
+    After failure_threshold failures in a row the circuit opens and calls fail
+    immediately. Once reset_timeout has passed, one trial call is let through;
+    its success (or a rate limit response) closes the circuit again, its
+    failure reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        Raises CircuitOpenError if the call must not be made.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError("Circuit open after repeated failures")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Opening circuit after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+def get_bucket(provider: str, model: str) -> TokenBucket:
+    """Returns the token bucket of a provider and model."""
+    with _registry_lock:
+        bucket = _buckets.get((provider, model))
+        if bucket is None:
+            bucket = TokenBucket(PROVIDER_RATE_LIMITS.get(provider, 60))
+            _buckets[(provider, model)] = bucket
+        return bucket
+
+def get_breaker(provider: str, model: str) -> CircuitBreaker:
+    """Returns the circuit breaker of a provider and model."""
+    with _registry_lock:
+        breaker = _breakers.get((provider, model))
+        if breaker is None:
+            breaker = CircuitBreaker()
+            _breakers[(provider, model)] = breaker
+        return breaker
+
+def _reset_state():
+    # Locks held by other threads at fork time would never be released in the child
+    global _registry_lock
+    _buckets.clear()
+    _breakers.clear()
+    _registry_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_state)
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Returns the delay asked for by the Retry-After headers of an error response, in seconds.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Returns whether a failed call may succeed when repeated: rate limits,
+    server errors, timeouts and connection errors.
+    """
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # Timeout and connection errors of requests, httpx and the OpenAI SDK
+    return any("Timeout" in cls.__name__ or "Connect" in cls.__name__ for cls in type(error).__mro__)
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Returns the delay before the next attempt: exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1))))
+
+def _handle_failure(provider: str, model: str, error: Exception, attempt: int, max_attempts: int) -> float:
+    """
+    Records a failed attempt and returns the delay before the next one.
+
+    Raises the error again if it is not retryable or no attempts are left.
+    """
+    bucket = get_bucket(provider, model)
+    breaker = get_breaker(provider, model)
+    if not is_retryable(error):
+        # The provider answered, only this request is wrong
+        breaker.record_success()
+        raise error
+
+    status = _status_code(error)
+    retry_after = _retry_after(error)
+    if status == 429:
+        # A rate limit proves the provider is up; this also resolves a half-open trial
+        breaker.record_success()
+        bucket.throttle()
+        if retry_after:
+            bucket.pause(retry_after)
+    else:
+        breaker.record_failure()
+
+    if attempt == max_attempts:
+        raise error
+    delay = retry_after if retry_after is not None else backoff_delay(attempt)
+    print(f"{provider}/{model} call failed ({status or type(error).__name__}), retrying in {delay:.1f}s (attempt {attempt}/{max_attempts})")
+    return delay
+
+def call_with_retry(provider: str, model: str, func: Callable[[], T], max_attempts: int = RETRY_MAX_ATTEMPTS) -> T:
+    """
+    Makes a call to an external API through its rate limiter, retrying transient failures.
+
+    Args:
+        provider (str): Name of the provider, e.g. "openai"
+        model (str): Model or endpoint; each has its own limiter and circuit breaker
+        func (callable): Makes the call and returns its result, raising on failure
+        max_attempts (int): Maximum number of attempts
+
+    Returns:
+        The result of func
+
+    Raises:
+        CircuitOpenError: If the provider is failing and calls are suspended
+        Exception: The error of the last attempt, or of the first non-retryable one
+    """
+    bucket = get_bucket(provider, model)
+    breaker = get_breaker(provider, model)
+
+    for attempt in range(1, max_attempts + 1):
+        breaker.before_call()
+        bucket.acquire()
+        try:
+            result = func()
+        except Exception as e:
+            time.sleep(_handle_failure(provider, model, e, attempt, max_attempts))
+            continue
+
+        breaker.record_success()
+        bucket.recover()
+        return result
+
+async def acall_with_retry(provider: str, model: str, func: Callable[[], Awaitable[T]], max_attempts: int = RETRY_MAX_ATTEMPTS) -> T:
+    """
+    Async version of call_with_retry, sharing its rate limiters and circuit breakers.
+
+    Args:
+        provider (str): Name of the provider, e.g. "openai"
+        model (str): Model or endpoint; each has its own limiter and circuit breaker
+        func (callable): Returns a new awaitable making the call on every attempt
+        max_attempts (int): Maximum number of attempts
+
+    Returns:
+        The result of the awaited call
+    """
+    bucket = get_bucket(provider, model)
+    breaker = get_breaker(provider, model)
+
+    for attempt in range(1, max_attempts + 1):
+        breaker.before_call()
+        await bucket.acquire_async()
+        try:
+            result = await func()
+        except Exception as e:
+            await asyncio.sleep(_handle_failure(provider, model, e, attempt, max_attempts))
+            continue
+
+        breaker.record_success()
+        bucket.recover()
+        return result
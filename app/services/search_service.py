@@ -2,50 +2,61 @@
 Service for interacting with Perplexity or other search APIs.
 """
 import os
+import asyncio
+import httpx
 import requests
 import json
 from typing import Dict, Any, Optional, List, Union
+from app.utils.cache import create_cache, make_cache_key, normalize_text
+from app.services.rate_limiter import call_with_retry, acall_with_retry
 
 # Load API key from environment variables
 PERPLEXITY_API_KEY = os.getenv('PERPLEXITY_API_KEY')
 PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
 
-# Simple cache to avoid repeated searches
-search_cache = {}
+PERPLEXITY_MODEL = "sonar"
+PERPLEXITY_TIMEOUT = float(os.getenv('PERPLEXITY_TIMEOUT', '120'))
 
-def search_exam_info(
-    exam_title: str, 
-    exam_country: str, 
-    topics: List[str],
-    educational_level: str = "",
-    materials_content: str = ""
-) -> Optional[str]:
+# Cache of search results keyed by the normalized search prompt. Set SEARCH_CACHE_PATH
+# to a SQLite file to share it between worker processes.
+SEARCH_CACHE_PATH = os.getenv('SEARCH_CACHE_PATH')
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', str(7 * 24 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '1000'))
+
+search_cache = create_cache(SEARCH_CACHE_PATH, "search_cache", SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL)
+
+_async_http_client = None
+
+def get_async_http_client() -> httpx.AsyncClient:
     """
-    Searches for information about an exam using Perplexity API.
+    Returns the process-wide async HTTP client of the ASGI endpoints, creating it on first use.
+    """
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(timeout=PERPLEXITY_TIMEOUT)
+    return _async_http_client
+
+def _reset_async_http_client():
+    # Connections must not be shared with a forked child process
+    global _async_http_client
+    _async_http_client = None
+
+os.register_at_fork(after_in_child=_reset_async_http_client)
+
+def _build_search_request(query: str):
+    """
+    Builds the headers and body of a Perplexity search request.
     
-    Args:
-        exam_title (str): The title of the exam
-        exam_country (str): The country where the exam is held
-        topics (List[str]): List of topics covered in the exam
-        educational_level (str, optional): Educational level of the exam
-        materials_content (str, optional): Text extracted from exam materials
-        
     Returns:
-        str: Search results or None if the search failed
+        tuple: (headers, payload)
     """
+    headers = {
+        "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
+        "Content-Type": "application/json"
+    }
     
-    # Prepare search query
-    from app.utils.ai_prompt_builder import build_exam_search_prompt
-    query = build_exam_search_prompt(exam_title, exam_country, topics, educational_level, materials_content)
-    
-    try:
-        headers = {
-            "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        # Include materials content in the system prompt if available
-        system_content = """You are a knowledgeable assistant specializing in standardized exams. Your primary task is to provide accurate and up-to-date information about the specified exam. This includes:
+    # Include materials content in the system prompt if available
+    system_content = """You are a knowledgeable assistant specializing in standardized exams. Your primary task is to provide accurate and up-to-date information about the specified exam. This includes:
 
         1. **Overview & Purpose of the Exam**:
         - Summarize what the exam is for, who typically takes it, and what skills or knowledge it evaluates.
@@ -81,36 +92,133 @@ def search_exam_info(
         - If uncertain, provide a disclaimer or guide the user to official channels for final confirmation.
 
         Your goal is to create a thorough, easy-to-understand guide about the exam, including a selection of sample questions (with short passages or scenarios if required by the exam’s nature). Avoid extraneous commentary and ensure the user can rely on your responses to prepare effectively."""
+    
+    payload = {
+        "model": PERPLEXITY_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": system_content
+            },
+            {
+                "role": "user", 
+                "content": query
+            }
+        ]
+    }
+    return headers, payload
+
+def _search_cache_key(exam_title: str, exam_country: str, topics: List[str], educational_level: str, materials_content: str):
+    """
+    Builds the search query and its cache key, returning the cached results if there are any.
+    
+    Returns:
+        tuple: (query, cache_key, cached results or None)
+    """
+    from app.utils.ai_prompt_builder import build_exam_search_prompt
+    query = build_exam_search_prompt(exam_title, exam_country, topics, educational_level, materials_content)
+    
+    cache_key = make_cache_key("perplexity", PERPLEXITY_MODEL, normalize_text(query))
+    try:
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            print("Using cached Perplexity search results")
+            return query, cache_key, cached
+    except Exception as e:
+        print(f"Error reading search cache: {str(e)}")
+    return query, cache_key, None
+
+def _store_search(cache_key: str, content: str) -> None:
+    try:
+        search_cache.set(cache_key, content)
+    except Exception as e:
+        print(f"Error writing search cache: {str(e)}")
+
+def search_exam_info(
+    exam_title: str, 
+    exam_country: str, 
+    topics: List[str],
+    educational_level: str = "",
+    materials_content: str = ""
+) -> Optional[str]:
+    """
+    Searches for information about an exam using Perplexity API.
+    
+    Args:
+        exam_title (str): The title of the exam
+        exam_country (str): The country where the exam is held
+        topics (List[str]): List of topics covered in the exam
+        educational_level (str, optional): Educational level of the exam
+        materials_content (str, optional): Text extracted from exam materials
+        
+    Returns:
+        str: Search results or None if the search failed
+    """
+    query, cache_key, cached = _search_cache_key(exam_title, exam_country, topics, educational_level, materials_content)
+    if cached is not None:
+        return cached
+    
+    try:
+        headers, payload = _build_search_request(query)
         
-        payload = {
-            "model": "sonar",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": system_content
-                },
-                {
-                    "role": "user", 
-                    "content": query
-                }
-            ]
-        }
+        def post_search():
+            response = requests.post(
+                PERPLEXITY_API_URL,
+                headers=headers,
+                json=payload,
+                timeout=PERPLEXITY_TIMEOUT
+            )
+            if response.status_code != 200:
+                print(f"Perplexity API error: {response.status_code}, {response.text}")
+            response.raise_for_status()
+            return response
         
-        response = requests.post(
-            PERPLEXITY_API_URL,
-            headers=headers,
-            json=payload
-        )
+        response = call_with_retry("perplexity", PERPLEXITY_MODEL, post_search)
+        result = response.json()
+        content = result["choices"][0]["message"]["content"]
+        _store_search(cache_key, content)
         
-        if response.status_code == 200:
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            
-            return content
-        else:
-            print(f"Perplexity API error: {response.status_code}, {response.text}")
-            return None
+        return content
     
     except Exception as e:
         print(f"Error in search_exam_info: {str(e)}")
-        return None 
\ No newline at end of file
+        return None
+
+async def asearch_exam_info(
+    exam_title: str, 
+    exam_country: str, 
+    topics: List[str],
+    educational_level: str = "",
+    materials_content: str = ""
+) -> Optional[str]:
+    """
+    Async version of search_exam_info, sharing its cache and rate limiter.
+    
+    Returns:
+        str: Search results or None if the search failed
+    """
+    # The cache may be a SQLite file, so it is read and written off the event loop
+    query, cache_key, cached = await asyncio.to_thread(_search_cache_key, exam_title, exam_country, topics, educational_level, materials_content)
+    if cached is not None:
+        return cached
+    
+    try:
+        headers, payload = _build_search_request(query)
+        client = get_async_http_client()
+        
+        async def post_search():
+            response = await client.post(PERPLEXITY_API_URL, headers=headers, json=payload, timeout=PERPLEXITY_TIMEOUT)
+            if response.status_code != 200:
+                print(f"Perplexity API error: {response.status_code}, {response.text}")
+            response.raise_for_status()
+            return response
+        
+        response = await acall_with_retry("perplexity", PERPLEXITY_MODEL, post_search)
+        content = response.json()["choices"][0]["message"]["content"]
+        await asyncio.to_thread(_store_search, cache_key, content)
+        
+        return content
+    
+    except Exception as e:
+        print(f"Error in asearch_exam_info: {str(e)}")
+        return None
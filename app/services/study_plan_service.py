@@ -0,0 +1,86 @@
+"""
+Builders shared by the Flask and ASGI study plan endpoints.
+"""
+import json
+from typing import Any, Dict, Tuple
+
+from app.services.llm_service import build_fuzzy_cache_key
+from app.utils.ai_prompt_builder import build_study_plan_prompt
+
+def build_plan_prompt(exam_data: Dict[str, Any], search_results, materials_content, amount_of_days) -> Tuple[str, str, str]:
+    """
+    Builds the study plan prompt from the gathered materials and search results.
+
+    Returns:
+        tuple: (system_prompt, user_prompt, fuzzy_key)
+    """
+    from app.models.models import exam
+    exam = exam(
+        id=exam_data.get('id'),
+        title=exam_data.get('title'),
+        country=exam_data.get('country'),
+        exam_date=exam_data.get('exam_date'),
+        goal_score=exam_data.get('goal_score'),
+        topics=exam_data.get('exam_topics', []),
+        proficiency=exam_data.get('proficiency'),
+        study_schedule=exam_data.get('study_schedule', []),
+        hours_per_day=exam_data.get('hours_per_day', 0)
+    )
+
+    print("Creating plan prompt")
+    system_prompt, user_prompt = build_study_plan_prompt(exam, search_results, materials_content, amount_of_days)
+
+    print(f"Search results: /n/n{search_results}")
+
+    # Plans for the same exam, country and topics are shared through the LLM cache
+    fuzzy_key = build_fuzzy_cache_key(
+        "study_plan",
+        exam.title,
+        exam.country,
+        exam.topics,
+        amount_of_days,
+        exam.proficiency,
+        exam.hours_per_day
+    )
+    return system_prompt, user_prompt, fuzzy_key
+
+def build_day_row(day: Dict[str, Any], day_id: str, study_plan_id: str, current_timestamp: str) -> Dict[str, Any]:
+    """
+    Builds the study_plan_days row of a day of the generated plan.
+    """
+    return {
+        "id": day_id,
+        "study_plan_id": study_plan_id,
+        "day_number": day.get('day_num', 0),
+        "planned_topics": day.get('topics_for_the_day', ''),
+        "subtopics": day.get('subtopics', ''),
+        "resources": day.get('resources', ''),
+        "estimated_hours": day.get('estimated_hours_needed', 0),
+        "completed": False,
+        "description": day.get('description', ''),
+        "created_at": current_timestamp
+    }
+
+def build_plan_response(study_plan_id: str, exam_id: str, study_plan_data: Dict[str, Any], day_ids_map: Dict[int, str]) -> Dict[str, Any]:
+    """
+    Builds the response body of a generated study plan.
+    """
+    response_data = {
+        "id": study_plan_id,
+        "exam_id": exam_id,
+        "overview": study_plan_data.get('overview', ''),
+        "days": study_plan_data.get('day_topics', [])
+    }
+
+    # Add the first day ID to the response if available
+    if day_ids_map:
+        response_data["first_day_id"] = day_ids_map[min(day_ids_map.keys())]
+
+    response_data["status_url"] = f"/api/plan/{study_plan_id}/status"
+    return response_data
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Formats a Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -282,17 +282,38 @@ def build_study_plan_prompt(exam, search_results=None, materials_content=None, a
     
     return system_prompt, user_prompt
 
-def build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_content, country):
+# Number of questions per difficulty in a daily quiz
+DEFAULT_QUIZ_DISTRIBUTION = {"easy": 20, "medium": 20, "hard": 40}
+
+def build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_content, country, distribution=None, answer_letters=None, part=None):
     """
     Builds a quiz generation prompt for the LLM.
+    
+    Args:
+        distribution (dict, optional): Number of questions per difficulty; defaults to 20 easy, 20 medium and 40 hard
+        answer_letters (dict, optional): Number of correct answers wanted per option letter; evenly spread if not given
+        part (tuple, optional): (index, count) when the quiz is generated in several parts
     """
+    distribution = {**{key: 0 for key in DEFAULT_QUIZ_DISTRIBUTION}, **(distribution or DEFAULT_QUIZ_DISTRIBUTION)}
+    easy, medium, hard = distribution["easy"], distribution["medium"], distribution["hard"]
+    total = easy + medium + hard
 
-    system_prompt = """
+    if answer_letters:
+        letter_counts = ", ".join(f'"{letter}" for {count}' for letter, count in sorted(answer_letters.items()) if count)
+        answer_rule = f"use each option as the correct answer this many times: {letter_counts}."
+    else:
+        answer_rule = 'ensure the correct answer is evenly distributed among options "A", "B", "C", and "D".'
+
+    part_note = ""
+    if part and part[1] > 1:
+        part_note = f"This is part {part[0] + 1} of {part[1]} of a larger quiz generated in parallel; cover different aspects of the subtopics in each part so questions are not repeated.\n"
+
+    system_prompt = f"""
     You are an advanced exam-question generator tasked with creating high-quality, realistic multiple-choice questions for any standardized or professional exam. Follow these guidelines:
 
     1. **Quantity & Difficulty Distribution**:
-    - Produce exactly 80 multiple-choice questions.
-    - Label 20 questions as "easy," 20 as "medium," and 40 as "hard."
+    - Produce exactly {total} multiple-choice questions.
+    - Label {easy} questions as "easy," {medium} as "medium," and {hard} as "hard."
 
     2. **Passage or Scenario (If Needed)**:
     - For exams that benefit from reading or scenario-based contexts (e.g., TOEFL Reading, scenario-based certifications), include a medium size passage or scenario (3-5 paragraphs). 
@@ -302,19 +323,19 @@ def build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_c
 
     3. **Question Structure**:
     - Each question must be a JSON object with the following fields:
-        {
+        {{
         "passage": "string",
         "question_text": "string",
         "options": [
-            { "option": "A", "text": "string" },
-            { "option": "B", "text": "string" },
-            { "option": "C", "text": "string" },
-            { "option": "D", "text": "string" }
+            {{ "option": "A", "text": "string" }},
+            {{ "option": "B", "text": "string" }},
+            {{ "option": "C", "text": "string" }},
+            {{ "option": "D", "text": "string" }}
         ],
         "correct_answer": "A" | "B" | "C" | "D",
         "explanation": "string",
         "difficulty": "easy" | "medium" | "hard"
-        }
+        }}
 
     4. **Alignment with Feedback**:
     - **Relevance to Passage/Scenario**: Ensure each question directly tests comprehension or application of the passage/scenario. 
@@ -326,7 +347,7 @@ def build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_c
     - **Clear, Concise Language**: Use precise phrasing for both questions and answer choices, avoiding ambiguous wording.
 
     5. **Even Distribution of Correct Answers**:
-    - Across all 80 questions, ensure that each option (A, B, C, D) appears as the correct answer in roughly equal proportions.
+    - Across all {total} questions, {answer_rule}
     - Avoid patterns where one letter (e.g., "B") is disproportionately used as the correct answer.
 
     6. **Difficulty Calibration**:
@@ -338,7 +359,7 @@ def build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_c
     - The language of the quiz and respective questions/passages must be based on the {country} language. If the exam country is Brazil, the language must be Portuguese. If the exam country is USA, the language must be English. If is a language exam, the language must be the language of the exam.
 
     8. **Final Output**:
-    - Return a single JSON array of 80 objects (no additional text, commentary, or formatting).
+    - Return a single JSON array of {total} objects (no additional text, commentary, or formatting).
     - The JSON must be valid (no trailing commas, properly quoted strings, etc.).
     - Each question must follow the above structure exactly.
     """
@@ -350,7 +371,7 @@ def build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_c
     Web information about the exam: {search_results}
     Exam materials: {materials_content}
 
-    Please generate 80 multiple-choice questions (20 easy, 20 medium, 40 hard) based on the context provided. Follow these requirements:
+    {part_note}Please generate {total} multiple-choice questions ({easy} easy, {medium} medium, {hard} hard) based on the context provided. Follow these requirements:
 
     1. **Passage or Scenario**:
     - If the exam requires reading comprehension or scenario-based reasoning, include a short passage or scenario (2-4 paragraphs) to provide context. Make the passage:
@@ -364,7 +385,7 @@ def build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_c
     - **Plausible Distractors**: Create incorrect answers that reflect common misconceptions or partial truths so they are not easily eliminated. Especially for medium/hard questions, distractors should be sophisticated enough to challenge test-takers.
 
     3. **Even Distribution of Correct Answers**:
-    - Across all 80 questions, ensure the correct answer is evenly distributed among options "A", "B", "C", and "D". 
+    - Across all {total} questions, {answer_rule}
     - Avoid patterns where one letter is correct disproportionately.
 
     3. **Question Format**:
@@ -384,8 +405,8 @@ def build_quiz_prompt(topics_for_the_day, subtopics, search_results, materials_c
         }}
 
     4. **Output Format**:
-    - Return exactly 80 questions in a valid JSON array (no additional commentary).
-    - Maintain the 20/20/40 distribution of easy, medium, and hard questions.
+    - Return exactly {total} questions in a valid JSON array (no additional commentary).
+    - Maintain the {easy}/{medium}/{hard} distribution of easy, medium, and hard questions.
 
     Focus on producing rich, realistic questions that challenge understanding and application of the given topics.
     """
@@ -0,0 +1,226 @@
+"""
+Key-value caches with expiry and size-bounded eviction.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Optional
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Builds a stable cache key from JSON-serializable parts.
+
+    Args:
+        *parts: Values identifying the cached item
+
+    Returns:
+        str: SHA-256 hex digest of the canonical JSON encoding of the parts
+    """
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Normalizes text for use in a cache key: lowercase with collapsed whitespace.
+    """
+    return " ".join((text or "").lower().split())
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after a TTL.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value or None if it is missing or expired.
+        """
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Stores a value, evicting the least recently used entries beyond max_entries.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Removes a value from the cache."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+# SQLite caches of this process, whose connections are reset after a fork
+_sqlite_caches = weakref.WeakSet()
+
+class SQLiteCache:
+    """
+    LRU cache with TTL stored in a SQLite file, shared by every process that opens it.
+
+    Values must be JSON-serializable. Several caches can share a file by using
+    different table names. Connections are opened per thread and again in a
+    forked child, so preloaded server workers never share one.
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_entries: int = 1000, ttl: Optional[float] = None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            f"expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._connect().execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_idx ON {table} (accessed_at)")
+        _sqlite_caches.add(self)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value or None if it is missing or expired.
+        """
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            f"SELECT value FROM {self.table} WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Stores a value, removing expired entries and the least recently used ones beyond max_entries.
+        """
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        conn = self._connect()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl if ttl else None, now)
+        )
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def delete(self, key: str) -> None:
+        """Removes a value from the cache."""
+        self._connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+def _reset_sqlite_connections():
+    # A SQLite connection must not be used on both sides of a fork; the child opens its own
+    for cache in list(_sqlite_caches):
+        cache._local = threading.local()
+
+os.register_at_fork(after_in_child=_reset_sqlite_connections)
+
+class RedisCache:
+    """
+    Cache with TTL stored in Redis or a Redis-compatible server, shared by every process using it.
+
+    Values must be JSON-serializable. Keys are prefixed with the namespace so
+    several caches can share a server; eviction beyond the TTL is left to the
+    server's maxmemory policy. Needs the optional redis package.
+    """
+
+    def __init__(self, url: str, namespace: str = "cache", ttl: Optional[float] = None):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a Redis cache: pip install redis")
+        self.namespace = namespace
+        self.ttl = ttl
+        # redis-py pools connections per process and is safe to share between threads
+        self._client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._errors = (redis.RedisError,)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value or None if it is missing, expired or the server is unreachable.
+        """
+        try:
+            value = self._client.get(self._key(key))
+        except self._errors as e:
+            print(f"Redis cache read failed: {str(e)}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Stores a value; a failed write only costs a later cache miss.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            self._client.set(self._key(key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+        except self._errors as e:
+            print(f"Redis cache write failed: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        """Removes a value from the cache."""
+        try:
+            self._client.delete(self._key(key))
+        except self._errors as e:
+            print(f"Redis cache delete of {key} failed: {str(e)}")
+
+def create_cache(path: Optional[str], table: str, max_entries: int, ttl: Optional[float], redis_url: Optional[str] = None):
+    """
+    Creates a Redis cache when a URL is given, a SQLite cache shared across
+    workers when a path is given, otherwise an in-process cache.
+
+    Args:
+        path (str, optional): SQLite file of the shared cache
+        table (str): Table of the shared cache, or key namespace of the Redis cache
+        max_entries (int): Maximum number of entries (not enforced by Redis)
+        ttl (float, optional): Seconds before an entry expires
+        redis_url (str, optional): URL of the Redis server, e.g. redis://localhost:6379/0
+
+    Returns:
+        TTLCache, SQLiteCache or RedisCache: The cache
+    """
+    if redis_url:
+        return RedisCache(redis_url, namespace=table, ttl=ttl)
+    if path:
+        return SQLiteCache(path, table=table, max_entries=max_entries, ttl=ttl)
+    return TTLCache(max_entries=max_entries, ttl=ttl)
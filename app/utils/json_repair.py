@@ -0,0 +1,284 @@
+"""
+Local repair of malformed JSON produced by LLMs.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+from typing import Any, List, Tuple
+
+# Directory where responses that could not be repaired locally are saved, for the repair benchmark
+JSON_REPAIR_CORPUS_DIR = os.getenv('JSON_REPAIR_CORPUS_DIR')
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+_HEX_DIGITS = set("0123456789abcdefABCDEF")
+_CLOSERS = {"{": "}", "[": "]"}
+# Characters that can start a value inside an array
+_VALUE_STARTS = set('"\'{[-0123456789tfn')
+_UNQUOTED_KEY_RE = re.compile(r"[A-Za-z_$][\w$-]*(?=\s*:)")
+
+def strip_code_fences(text: str) -> str:
+    """
+    Returns the content of the first markdown code block, or the text itself if there is none.
+
+    A block whose closing fence is missing (a truncated response) runs to the end of the text.
+    """
+    match = _FENCE_RE.search(text)
+    return match.group(1) if match else text
+
+def _skip_comment(text: str, start: int) -> int:
+    """
+    Returns the index after a // or /* */ comment starting at start, or start if there is none.
+    """
+    if text.startswith("//", start):
+        end = text.find("\n", start)
+        return len(text) if end < 0 else end
+    if text.startswith("/*", start):
+        end = text.find("*/", start + 2)
+        return len(text) if end < 0 else end + 2
+    return start
+
+def _next_significant(text: str, start: int) -> Tuple[int, bool]:
+    """
+    Returns the index of the next character that is not whitespace or a comment,
+    and whether a newline was skipped.
+    """
+    newline = False
+    i = start
+    while i < len(text):
+        if text[i].isspace():
+            newline = newline or text[i] == "\n"
+            i += 1
+            continue
+        end = _skip_comment(text, i)
+        if end == i:
+            break
+        newline = newline or text.startswith("//", i)
+        i = end
+    return i, newline
+
+def _closes_string(text: str, start: int, stack: List[str], is_key: bool) -> bool:
+    """
+    Decides whether a quote inside a string ends it or is an unescaped quote in the text.
+
+    The quote ends the string when what follows it can follow a string at this
+    position, e.g. a colon after a key or a comma and the next key after a value.
+    """
+    i, newline = _next_significant(text, start)
+    if i >= len(text):
+        return True
+    char = text[i]
+    if is_key:
+        return char == ":"
+    if char in "}]":
+        return True
+    if char in "\"'":
+        # A missing comma between two values on separate lines
+        return newline
+    if char != ",":
+        return not stack
+    j, _ = _next_significant(text, i + 1)
+    if j >= len(text):
+        return True
+    if stack and stack[-1] == "{":
+        return text[j] in "\"'}" or bool(_UNQUOTED_KEY_RE.match(text, j))
+    return text[j] in _VALUE_STARTS or text[j] == "]"
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+def _close(out: List[str], stack: List[str]) -> str:
+    out = list(out)
+    _strip_trailing_comma(out)
+    return "".join(out) + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+def repair_json(text: str) -> str:
+    """
+    Repairs common defects of JSON written by an LLM.
+
+    Handles:
+        - Markdown code fences and prose around the document
+        - // and /* */ comments
+        - Trailing commas in objects and arrays
+        - Single-quoted strings and unquoted keys
+        - Unescaped double quotes and raw control characters inside strings
+        - Invalid escape sequences
+        - Mismatched brackets: a closing bracket closes the containers opened
+          after its opening bracket, and one without an opening bracket is dropped
+        - A truncated tail: the open string and containers are closed, and an
+          incomplete last member is dropped
+
+    The repair is best effort; the result of a document that cannot be
+    repaired may still be invalid JSON.
+
+    Args:
+        text (str): The malformed JSON text
+
+    Returns:
+        str: The repaired JSON text
+    """
+    text = strip_code_fences(text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return text.strip()
+    text = text[min(starts):]
+
+    out = []
+    stack = []
+    in_string = False
+    quote = '"'
+    is_key = False
+    expect_key = False
+    # Output length and open containers after the last complete member, used to cut a truncated tail
+    safe_point = (0, [])
+    i = 0
+    n = len(text)
+
+    while i < n:
+        char = text[i]
+
+        if in_string:
+            if char == "\\":
+                if i + 1 >= n:
+                    # Dangling backslash at the end of a truncated response
+                    i += 1
+                    continue
+                escaped = text[i + 1]
+                if escaped == "u" and all(c in _HEX_DIGITS for c in text[i + 2:i + 6]) and i + 6 <= n:
+                    out.append(text[i:i + 6])
+                    i += 6
+                elif escaped in '"\\/bfnrt':
+                    out.append(char + escaped)
+                    i += 2
+                elif escaped == "'":
+                    # Escaped single quote, valid only in single-quoted strings
+                    out.append(escaped)
+                    i += 2
+                else:
+                    # Invalid escape, keep the backslash as a literal character
+                    out.append("\\\\")
+                    i += 1
+                continue
+            if char == quote:
+                if _closes_string(text, i + 1, stack, is_key):
+                    out.append('"')
+                    in_string = False
+                else:
+                    out.append('\\"' if quote == '"' else quote)
+            elif char == '"':
+                # Double quote inside a single-quoted string
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            elif char == "\r":
+                out.append("\\r")
+            elif char == "\t":
+                out.append("\\t")
+            elif ord(char) < 0x20:
+                out.append(f"\\u{ord(char):04x}")
+            else:
+                out.append(char)
+            i += 1
+            continue
+
+        comment_end = _skip_comment(text, i)
+        if comment_end > i:
+            i = comment_end
+            continue
+
+        if char in "\"'":
+            in_string = True
+            quote = char
+            is_key = expect_key
+            expect_key = False
+            out.append('"')
+        elif expect_key and _UNQUOTED_KEY_RE.match(text, i):
+            key = _UNQUOTED_KEY_RE.match(text, i).group(0)
+            out.append(f'"{key}"')
+            expect_key = False
+            i += len(key)
+            continue
+        elif char in "{[":
+            stack.append(char)
+            expect_key = char == "{"
+            out.append(char)
+            safe_point = (len(out), list(stack))
+        elif char in "}]":
+            opener = "{" if char == "}" else "["
+            if opener not in stack:
+                # Closing bracket without an opening one
+                i += 1
+                continue
+            _strip_trailing_comma(out)
+            # Close the containers left open inside this one
+            while stack[-1] != opener:
+                out.append(_CLOSERS[stack.pop()])
+            stack.pop()
+            out.append(char)
+            expect_key = False
+            if not stack:
+                # Ignore anything after the document
+                break
+        elif char == ",":
+            _strip_trailing_comma(out)
+            if out and out[-1] not in "{[":
+                safe_point = (len(out), list(stack))
+                out.append(char)
+            expect_key = bool(stack) and stack[-1] == "{"
+        else:
+            out.append(char)
+        i += 1
+
+    if not stack and not in_string:
+        return "".join(out).strip()
+
+    # Truncated document: close the open string and containers
+    if in_string:
+        out.append('"')
+    repaired = _close(out, stack)
+    try:
+        json.loads(repaired)
+        return repaired
+    except ValueError:
+        # The last member is incomplete (e.g. a key without value), drop it
+        length, open_containers = safe_point
+        return _close(out[:length], open_containers)
+
+def loads_tolerant(text: str) -> Any:
+    """
+    Parses JSON, repairing it locally when it is malformed.
+
+    Args:
+        text (str): The JSON text
+
+    Returns:
+        The parsed value
+
+    Raises:
+        json.JSONDecodeError: If the text cannot be repaired
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        repaired = repair_json(text)
+    return json.loads(repaired)
+
+def record_failure(text: str) -> None:
+    """
+    Saves a response that could not be repaired to JSON_REPAIR_CORPUS_DIR, if set.
+
+    The saved files extend the corpus of benchmarks/json_repair.
+    """
+    if not JSON_REPAIR_CORPUS_DIR or not text:
+        return
+    try:
+        os.makedirs(JSON_REPAIR_CORPUS_DIR, exist_ok=True)
+        name = f"{int(time.time())}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}.txt"
+        with open(os.path.join(JSON_REPAIR_CORPUS_DIR, name), "w", encoding="utf-8") as f:
+            f.write(text)
+    except OSError as e:
+        print(f"Error saving malformed JSON: {str(e)}")
@@ -0,0 +1,124 @@
+"""
+Incremental parsing of JSON documents received in chunks.
+"""
+from typing import Any, List
+from app.utils.json_repair import loads_tolerant
+
+class JsonArrayStream:
+    """
+    Extracts the elements of one array from a JSON object while it is being received.
+
+    Feed the document chunk by chunk; every element of the array under the given
+    key is returned as soon as its closing bracket arrives, without waiting for
+    the rest of the document. Each character is scanned once and only the open
+    element is kept in the scan buffer, so the cost of feeding grows linearly
+    with the size of the document.
+
+    Example:
+        stream = JsonArrayStream("day_topics")
+        for chunk in chunks:
+            for day in stream.feed(chunk):
+                ...
+        plan = loads_tolerant(stream.text)
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._chunks = []
+        # Unfinished part of the document still needed for slicing, starting at
+        # absolute position _offset; positions below are absolute
+        self._buffer = ""
+        self._offset = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._last_string = None
+        self._awaiting_array = False
+        self._array_depth = None
+        self._element_start = None
+        self.done = False
+
+    @property
+    def text(self) -> str:
+        """The document received so far."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Adds a chunk of the document.
+
+        Args:
+            chunk (str): The next part of the document
+
+        Returns:
+            list: Array elements completed by this chunk, parsed; malformed elements
+                  are repaired locally and skipped if they cannot be repaired
+        """
+        self._chunks.append(chunk)
+        self._buffer += chunk
+        text = self._buffer
+        offset = self._offset
+        completed = []
+
+        for pos in range(self._pos, offset + len(text)):
+            char = text[pos - offset]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start - offset:pos - offset]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos + 1
+            elif char == ":":
+                # The array must directly follow the key
+                self._awaiting_array = self._array_depth is None and not self.done and self._last_string == self.key
+            elif char in "[{":
+                if self._awaiting_array and char == "[":
+                    self._array_depth = self._depth + 1
+                elif self._array_depth is not None and self._depth == self._array_depth and self._element_start is None:
+                    self._element_start = pos
+                self._awaiting_array = False
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._array_depth is not None:
+                    if self._depth == self._array_depth and self._element_start is not None:
+                        element = self._parse(text[self._element_start - offset:pos - offset + 1])
+                        if element is not None:
+                            completed.append(element)
+                        self._element_start = None
+                    elif self._depth < self._array_depth:
+                        # End of the array
+                        self._array_depth = None
+                        self.done = True
+            elif not char.isspace():
+                self._awaiting_array = False
+
+        self._pos = offset + len(text)
+        # Drop what no open element or string refers to any more
+        keep_from = self._pos
+        if self._element_start is not None:
+            keep_from = self._element_start
+        elif self._in_string:
+            keep_from = self._string_start
+        self._buffer = text[keep_from - offset:]
+        self._offset = keep_from
+        return completed
+
+    def _parse(self, element_text: str) -> Any:
+        try:
+            return loads_tolerant(element_text)
+        except ValueError as e:
+            print(f"Skipping malformed array element: {str(e)}")
+            return None
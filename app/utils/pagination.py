@@ -0,0 +1,129 @@
+"""
+Keyset pagination, field projection and filtering of list endpoints.
+"""
+import os
+import json
+import base64
+import binascii
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Page size used when a request does not give a limit, and the largest one allowed
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '200'))
+
+# Response header carrying the cursor of the next page; absent on the last page
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+# Column pages are ordered and keyed by; unique, so no row is skipped or repeated between pages
+CURSOR_COLUMN = 'id'
+
+class PaginationError(ValueError):
+    """Raised for invalid list parameters; the message is safe to return to the client."""
+
+@dataclass
+class ListParams:
+    limit: int
+    columns: str
+    after: Optional[Any] = None
+
+def encode_cursor(value: Any) -> str:
+    """
+    Encodes the key of the last row of a page as an opaque cursor.
+    """
+    payload = json.dumps({CURSOR_COLUMN: value}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Any:
+    """
+    Returns the key encoded in a cursor.
+
+    Raises:
+        PaginationError: If the cursor was not produced by encode_cursor
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return json.loads(payload)[CURSOR_COLUMN]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise PaginationError("Invalid cursor")
+
+def parse_list_params(args: Mapping[str, str], allowed_fields: Iterable[str]) -> ListParams:
+    """
+    Reads limit, cursor and fields from the query string of a list request.
+
+    Args:
+        args: Query string arguments, e.g. flask.request.args
+        allowed_fields: Light columns the client may ask for with fields=,
+            all of which are selected when fields is not given
+
+    Returns:
+        ListParams: Page size, select clause and the key to continue after
+
+    Raises:
+        PaginationError: If limit is not an integer between 1 and MAX_PAGE_SIZE,
+            the cursor is invalid or fields names an unknown column
+    """
+    limit = args.get('limit')
+    if limit is None or limit == '':
+        limit = DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PaginationError("limit must be an integer")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise PaginationError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    allowed_fields = list(allowed_fields)
+    # Heavy columns are left out of the whitelist, so they are never listed
+    requested = allowed_fields
+    fields = args.get('fields')
+    if fields:
+        allowed = set(allowed_fields)
+        requested = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in requested if field not in allowed]
+        if unknown:
+            raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    # The cursor is built from the key column, so it is always selected
+    columns = ','.join(dict.fromkeys([CURSOR_COLUMN, *requested]))
+
+    cursor = args.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+    return ListParams(limit=limit, columns=columns, after=after)
+
+def apply_filters(query, args: Mapping[str, str], filters: Dict[str, Tuple[str, str]]):
+    """
+    Adds the filters present in the query string to a PostgREST query.
+
+    Args:
+        query: PostgREST filter builder
+        args: Query string arguments
+        filters: Maps a query string argument to (column, operator), e.g.
+            {"date_from": ("date", "gte")}; operators are filter methods of the builder
+
+    Returns:
+        The query with the filters applied
+    """
+    for name, (column, operator) in filters.items():
+        value = args.get(name)
+        if value not in (None, ''):
+            query = getattr(query, operator)(column, value)
+    return query
+
+def fetch_page(query, params: ListParams) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Runs a filtered PostgREST query for one page of rows, ordered by CURSOR_COLUMN.
+
+    One row more than the page size is fetched to tell whether another page follows.
+
+    Returns:
+        tuple: (rows, cursor of the next page or None on the last page)
+    """
+    if params.after is not None:
+        query = query.gt(CURSOR_COLUMN, params.after)
+    result = query.order(CURSOR_COLUMN).limit(params.limit + 1).execute()
+    rows = result.data or []
+    if len(rows) <= params.limit:
+        return rows, None
+    rows = rows[:params.limit]
+    return rows, encode_cursor(rows[-1][CURSOR_COLUMN])
@@ -0,0 +1,138 @@
+"""
+On-disk cache of text extracted from PDF materials.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from typing import Optional, Dict, Any
+
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', './data/pdf_cache')
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+class PdfTextCache:
+    """
+    Content-addressed store of extracted PDF text with LRU eviction.
+
+    Extracted text is stored under the hash of the PDF content. A separate entry
+    per URL remembers the ETag and content hash of the last download, so a
+    conditional request answered with 304 Not Modified is served from the cache
+    without downloading or parsing the file again.
+
+    File modification times track recency; when the cache grows beyond its size
+    bound the least recently used files are removed.
+    """
+
+    def __init__(self, directory: str = PDF_CACHE_DIR, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "text"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "urls"), exist_ok=True)
+        self._size = self._scan_size()
+
+    def _text_path(self, key: str) -> str:
+        return os.path.join(self.directory, "text", f"{key}.json")
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self.directory, "urls", f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Mark as recently used
+            os.utime(path, None)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path: str, entry: Dict[str, Any]) -> None:
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._size += os.path.getsize(path)
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def get_text(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached extraction for a content key, or None on a miss.
+        """
+        return self._read(self._text_path(key))
+
+    def put_text(self, key: str, text: str, **metadata) -> None:
+        """
+        Stores the text extracted from a file with the given content key.
+        """
+        self._write(self._text_path(key), {"text": text, **metadata})
+
+    def get_url_entry(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the ETag and content key of the last download of a URL, if its text is still cached.
+        """
+        entry = self._read(self._url_path(url))
+        if entry and os.path.exists(self._text_path(entry.get("key", ""))):
+            return entry
+        return None
+
+    def put_url_entry(self, url: str, etag: Optional[str], key: str) -> None:
+        """
+        Remembers the ETag and content key of a downloaded URL.
+        """
+        self._write(self._url_path(url), {"url": url, "etag": etag, "key": key})
+
+    def _list_files(self):
+        files = []
+        for sub in ("text", "urls"):
+            with os.scandir(os.path.join(self.directory, sub)) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._list_files())
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache fits its size bound.
+        """
+        with self._lock:
+            # Rescan, other processes may share the directory
+            files = sorted(self._list_files())
+            size = sum(size for _, size, _ in files)
+            # Leave some headroom so eviction does not run on every write
+            target = int(self.max_bytes * 0.9)
+            for _, file_size, path in files:
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                    size -= file_size
+                except OSError:
+                    pass
+            self._size = size
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_pdf_cache() -> PdfTextCache:
+    """Returns the process-wide PDF text cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PdfTextCache()
+        return _cache
@@ -4,7 +4,16 @@ Utility for processing PDF files.
 import requests
 import io
 import os
-from typing import Optional, List
+import time
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from requests.adapters import HTTPAdapter
+from typing import Optional, List, Iterator, Tuple, Union
+from app.utils.pdf_cache import get_pdf_cache
 
 # Try to import PyPDF2, which we'll add to requirements
 try:
@@ -13,12 +22,74 @@ try:
 except ImportError:
     PDF_SUPPORT = False
 
-def extract_text_from_pdf_url(pdf_url: str) -> Optional[str]:
+# Number of materials downloaded at the same time
+PDF_DOWNLOAD_WORKERS = int(os.getenv('PDF_DOWNLOAD_WORKERS', '8'))
+# Number of processes parsing PDFs; parsing is CPU-bound and would otherwise hold the GIL
+PDF_PARSE_PROCESSES = int(os.getenv('PDF_PARSE_PROCESSES', str(min(4, os.cpu_count() or 1))))
+PDF_CONNECT_TIMEOUT = float(os.getenv('PDF_CONNECT_TIMEOUT', '10'))
+PDF_READ_TIMEOUT = float(os.getenv('PDF_READ_TIMEOUT', '60'))
+# Limits of a single download: total size, total time, and size kept in memory before spooling to disk
+PDF_MAX_DOWNLOAD_BYTES = int(os.getenv('PDF_MAX_DOWNLOAD_BYTES', str(100 * 1024 * 1024)))
+PDF_DOWNLOAD_DEADLINE = float(os.getenv('PDF_DOWNLOAD_DEADLINE', '300'))
+PDF_SPOOL_MAX_MEMORY = int(os.getenv('PDF_SPOOL_MAX_MEMORY', str(4 * 1024 * 1024)))
+PDF_SPOOL_DIR = os.getenv('PDF_SPOOL_DIR') or None
+
+_session = None
+_parse_pool = None
+_pool_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the shared HTTP session used to download materials, with pooled keep-alive connections.
+    """
+    global _session
+    with _pool_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=PDF_DOWNLOAD_WORKERS, pool_maxsize=PDF_DOWNLOAD_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used to parse PDFs.
+    """
+    global _parse_pool
+    with _pool_lock:
+        if _parse_pool is None:
+            # Spawn so the workers do not inherit the threads and sockets of the server process
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=max(1, PDF_PARSE_PROCESSES),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+def _reset_pools():
+    global _session, _parse_pool, _pool_lock
+    _session = None
+    _parse_pool = None
+    _pool_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_pools)
+
+def _parse_in_pool(source: Union[bytes, str], max_chars: Optional[int] = None) -> Tuple[str, bool]:
+    global _parse_pool
+    try:
+        return get_parse_pool().submit(parse_pdf, source, max_chars).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool for the next file
+        with _pool_lock:
+            _parse_pool = None
+        raise
+
+def extract_text_from_pdf_url(pdf_url: str, max_chars: Optional[int] = None) -> Optional[str]:
     """
     Download a PDF from a URL and extract its text content.
     
     Args:
         pdf_url (str): URL to the PDF file
+        max_chars (int, optional): Stop extracting once this many characters were read
         
     Returns:
         str: Extracted text from the PDF or None if extraction failed
@@ -28,57 +99,224 @@ def extract_text_from_pdf_url(pdf_url: str) -> Optional[str]:
         return None
         
     try:
+        cache = get_pdf_cache()
+        
+        # Ask the server whether the file changed since the last download
+        cached = cache.get_url_entry(pdf_url)
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        
         # Download the PDF file
-        response = requests.get(pdf_url)
-        if response.status_code != 200:
-            print(f"Failed to download PDF from {pdf_url}: {response.status_code}")
-            return None
-            
-        # Read the PDF content
-        pdf_file = io.BytesIO(response.content)
-        reader = PyPDF2.PdfReader(pdf_file)
+        session = get_http_session()
+        timeout = (PDF_CONNECT_TIMEOUT, PDF_READ_TIMEOUT)
+        response = session.get(pdf_url, headers=headers, timeout=timeout, stream=True)
+        if response.status_code == 304 and cached:
+            response.close()
+            entry = cache.get_text(cached["key"])
+            if _covers_budget(entry, max_chars):
+                print(f"Using cached text for {pdf_url}")
+                return entry["text"][:max_chars]
+            # The text was evicted or extracted with a smaller budget, download it again
+            response = session.get(pdf_url, timeout=timeout, stream=True)
         
-        # Extract text from all pages
-        text = ""
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            text += page.extract_text() + "\n\n"
-            
-        return text
+        try:
+            if response.status_code != 200:
+                print(f"Failed to download PDF from {pdf_url}: {response.status_code}")
+                return None
+            source, key = download_to_spool(response)
+        finally:
+            response.close()
+        
+        try:
+            # The same file may have been extracted before under another URL
+            entry = cache.get_text(key)
+            if _covers_budget(entry, max_chars):
+                text = entry["text"]
+            else:
+                text, complete = _parse_in_pool(source, max_chars)
+                cache.put_text(key, text, complete=complete)
+            cache.put_url_entry(pdf_url, response.headers.get("ETag"), key)
+        finally:
+            if isinstance(source, str):
+                os.remove(source)
+        
+        return text[:max_chars]
     except Exception as e:
         print(f"Error extracting text from PDF {pdf_url}: {str(e)}")
         return None
 
-def process_exam_materials(materials: List[str], max_chars: int = 10000) -> str:
+def download_to_spool(response: requests.Response) -> Tuple[Union[bytes, str], str]:
+    """
+    Read a streamed download while enforcing the size and time limits.
+    
+    Small files stay in memory; once a file grows beyond PDF_SPOOL_MAX_MEMORY it
+    is spooled to a temporary file, which the caller must remove.
+    
+    Args:
+        response (requests.Response): A response opened with stream=True
+        
+    Returns:
+        tuple: The file content (bytes) or temporary file path (str), and the SHA-256 of the content
+        
+    Raises:
+        ValueError: If the file is larger than PDF_MAX_DOWNLOAD_BYTES
+        TimeoutError: If the download takes longer than PDF_DOWNLOAD_DEADLINE
+    """
+    declared_size = response.headers.get("Content-Length")
+    if declared_size and declared_size.isdigit() and int(declared_size) > PDF_MAX_DOWNLOAD_BYTES:
+        raise ValueError(f"File of {declared_size} bytes exceeds the {PDF_MAX_DOWNLOAD_BYTES} byte limit")
+    
+    deadline = time.monotonic() + PDF_DOWNLOAD_DEADLINE
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    spool_file = None
+    size = 0
+    try:
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size += len(chunk)
+            if size > PDF_MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"File exceeds the {PDF_MAX_DOWNLOAD_BYTES} byte limit")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Download took longer than {PDF_DOWNLOAD_DEADLINE} seconds")
+            
+            digest.update(chunk)
+            if spool_file is None and size > PDF_SPOOL_MAX_MEMORY:
+                spool_file = tempfile.NamedTemporaryFile(prefix="material-", suffix=".pdf", dir=PDF_SPOOL_DIR, delete=False)
+                spool_file.write(buffer.getbuffer())
+                buffer = None
+            (spool_file or buffer).write(chunk)
+    except Exception:
+        if spool_file is not None:
+            spool_file.close()
+            os.remove(spool_file.name)
+        raise
+    
+    if spool_file is not None:
+        spool_file.close()
+        return spool_file.name, digest.hexdigest()
+    return buffer.getvalue(), digest.hexdigest()
+
+def _covers_budget(entry: Optional[dict], max_chars: Optional[int]) -> bool:
+    # Entries without the flag were stored before extraction was budgeted, so they hold the full text
+    if entry is None:
+        return False
+    if entry.get("complete", True):
+        return True
+    return max_chars is not None and len(entry["text"]) >= max_chars
+
+def iter_pdf_pages(source: Union[bytes, str]) -> Iterator[str]:
+    """
+    Lazily yield the text of each page of a PDF file.
+    
+    Args:
+        source (bytes or str): The raw PDF file, or the path of a spooled file
+        
+    Yields:
+        str: The text of the next page
+    """
+    # A spooled file is read from disk as pages are needed instead of being loaded whole
+    with (open(source, "rb") if isinstance(source, str) else io.BytesIO(source)) as stream:
+        reader = PyPDF2.PdfReader(stream)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+
+def parse_pdf(source: Union[bytes, str], max_chars: Optional[int] = None) -> Tuple[str, bool]:
+    """
+    Extract the text content of a PDF file, stopping once the budget is met.
+    
+    Args:
+        source (bytes or str): The raw PDF file, or the path of a spooled file
+        max_chars (int, optional): Stop parsing pages once this many characters were extracted
+        
+    Returns:
+        tuple: The extracted text and whether every page was read
+    """
+    pages = []
+    length = 0
+    for page_text in iter_pdf_pages(source):
+        pages.append(page_text)
+        length += len(page_text) + 2
+        if max_chars is not None and length >= max_chars:
+            return "\n\n".join(pages), False
+        
+    return "\n\n".join(pages), True
+
+def share_budget(lengths: List[int], budget: int) -> List[int]:
+    """
+    Split a character budget fairly between documents.
+    
+    Every document gets an equal share; what a short document does not use is
+    redistributed to the longer ones.
+    
+    Args:
+        lengths (List[int]): Available characters of each document
+        budget (int): Total characters to allocate
+        
+    Returns:
+        List[int]: Characters allocated to each document, in the input order
+    """
+    allocations = [0] * len(lengths)
+    remaining = max(0, budget)
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    for position, index in enumerate(order):
+        share = remaining // (len(order) - position)
+        allocations[index] = min(lengths[index], share)
+        remaining -= allocations[index]
+    return allocations
+
+def process_exam_materials(materials: List[str], max_chars: int = 10000, per_document_chars: Optional[int] = None) -> str:
     """
     Process a list of exam material URLs, extracting text from PDFs.
     
+    Each PDF is only parsed until it can fill the budget, and the budget is
+    shared fairly between PDFs instead of going to the first one.
+    
     Args:
         materials (List[str]): List of URLs to exam materials
         max_chars (int): Maximum characters to return
+        per_document_chars (int, optional): Maximum characters taken from a single PDF
         
     Returns:
         str: Concatenated text from all materials, truncated to max_chars
     """
     if not materials:
         return ""
+    
+    # No single document can contribute more than the whole budget
+    document_budget = min(per_document_chars or max_chars, max_chars)
         
-    extracted_text = []
+    # Download and parse all PDFs concurrently; each file fails independently
+    pdf_urls = [material for material in materials if material.lower().endswith('.pdf')]
+    pdf_texts = {}
+    if pdf_urls:
+        with ThreadPoolExecutor(max_workers=min(PDF_DOWNLOAD_WORKERS, len(pdf_urls)), thread_name_prefix="pdf") as executor:
+            texts = executor.map(lambda url: extract_text_from_pdf_url(url, document_budget), pdf_urls)
+            pdf_texts = dict(zip(pdf_urls, texts))
     
+    # Keep the original order of the materials
+    items = []
     for material in materials:
         if material.lower().endswith('.pdf'):
-            text = extract_text_from_pdf_url(material)
+            text = pdf_texts.get(material)
             if text:
-                extracted_text.append(text)
+                items.append((True, text))
         else:
             # For non-PDF materials, just add the URL as a reference
-            extracted_text.append(f"Reference material: {material}")
+            items.append((False, f"Reference material: {material}"))
     
-    # Combine all extracted text
-    combined_text = "\n\n".join(extracted_text)
+    # References are kept whole; the PDFs share what is left of the budget
+    separators = 2 * max(0, len(items) - 1)
+    references_length = sum(len(text) for is_pdf, text in items if not is_pdf)
+    pdf_lengths = [len(text) for is_pdf, text in items if is_pdf]
+    allocations = iter(share_budget(pdf_lengths, max_chars - references_length - separators))
     
-    # Truncate if too long
-    if len(combined_text) > max_chars:
-        combined_text = combined_text[:max_chars] + "... (text truncated)"
-        
-    return combined_text 
\ No newline at end of file
+    extracted_text = []
+    for is_pdf, text in items:
+        if is_pdf:
+            allocation = next(allocations)
+            if allocation < len(text):
+                text = text[:allocation] + "... (text truncated)"
+        extracted_text.append(text)
+    
+    return "\n\n".join(extracted_text)
@@ -0,0 +1,80 @@
+"""
+Read-through cache of JSON responses of read endpoints, with ETags.
+
+Responses are cached as serialized bodies, so a hit is answered without
+touching Supabase or re-encoding JSON. Writes that change a cached resource
+must call invalidate with its key.
+"""
+import os
+import hashlib
+from typing import Any, Callable, Optional, Tuple
+from flask import current_app, request
+from app.utils.cache import create_cache
+
+# Set to 0 to always read from Supabase
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+# Shared backends, so an invalidation reaches every worker process. An empty
+# path falls back to an in-process LRU, which is only correct with one process.
+RESPONSE_CACHE_REDIS_URL = os.getenv('RESPONSE_CACHE_REDIS_URL')
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', './data/cache.db')
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+
+response_cache = create_cache(
+    RESPONSE_CACHE_PATH, "response_cache", RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+    redis_url=RESPONSE_CACHE_REDIS_URL
+) if RESPONSE_CACHE_ENABLED else None
+
+def plan_cache_key(exam_id: str) -> str:
+    """Key of the cached GET /plan/<exam_id> response."""
+    return f"plan:{exam_id}"
+
+def quiz_cache_key(quiz_id: str) -> str:
+    """Key of the cached GET /quiz/<quiz_id> response."""
+    return f"quiz:{quiz_id}"
+
+def invalidate(*keys: str) -> None:
+    """
+    Removes cached responses after the resources behind them changed.
+    """
+    if response_cache is None:
+        return
+    for key in keys:
+        response_cache.delete(key)
+
+def _etag(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]
+
+def cached_json_response(key: str, load: Callable[[], Tuple[Any, int]]):
+    """
+    Returns the JSON response of a read endpoint, from the cache when possible.
+
+    On a miss, load is called and its result cached if the status is 200.
+    Every 200 response carries an ETag, and a request whose If-None-Match
+    matches it gets an empty 304.
+
+    Args:
+        key (str): Cache key of the response, e.g. from plan_cache_key
+        load (callable): Returns (data, status) read from the database
+
+    Returns:
+        flask.Response: The response
+    """
+    entry: Optional[dict] = response_cache.get(key) if response_cache is not None else None
+    if entry is None:
+        data, status = load()
+        # Encoded like jsonify, so cached and fresh responses are byte-identical
+        response = current_app.json.response(data)
+        if status != 200:
+            response.status_code = status
+            return response
+        body = response.get_data(as_text=True)
+        entry = {"body": body, "etag": _etag(body)}
+        if response_cache is not None:
+            response_cache.set(key, entry)
+
+    response = current_app.response_class(entry["body"], status=200, mimetype=current_app.json.mimetype)
+    response.set_etag(entry["etag"])
+    # Clients may keep the response but must revalidate it, which costs a 304 at most
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
@@ -0,0 +1,37 @@
+"""
+ASGI entry point: serves the LLM-bound endpoints natively async and every other
+endpoint through the Flask app.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5003
+
+The async endpoints wait for the LLM on the event loop instead of holding a
+thread each, so one process can keep hundreds of generations in flight. The
+Flask blueprints keep serving everything else unchanged, on a thread pool.
+"""
+import os
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount, Route
+from app import create_app
+from app.routes import async_routes
+from app.utils.pagination import NEXT_CURSOR_HEADER
+
+# Threads serving the Flask endpoints
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '10'))
+
+def create_asgi_app():
+    flask_app = create_app()
+    return Starlette(
+        routes=[
+            Route('/api/plan/generate', async_routes.generate_plan, methods=['POST']),
+            Route('/api/plan/generate/stream', async_routes.generate_plan_stream, methods=['POST']),
+            Route('/api/quiz/generate', async_routes.generate_quiz, methods=['POST']),
+            Mount('/', app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)),
+        ],
+        # Same CORS policy as flask_cors' defaults
+        middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'], expose_headers=[NEXT_CURSOR_HEADER])]
+    )
+
+app = create_asgi_app()
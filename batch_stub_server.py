@@ -0,0 +1,200 @@
+"""
+Local stand-in for the OpenAI files, batches and chat completions endpoints.
+
+Lets the batch quiz backfill run end to end without an API key or cost:
+
+    python batch_stub_server.py --port 8089 --delay 10
+    OPENAI_BASE_URL=http://localhost:8089/v1 QUIZ_BACKFILL_MODE=batch python app.py
+
+Batches complete --delay seconds after they are created. Quiz prompts are
+answered with placeholder questions matching the requested counts and answer
+letters; any other prompt gets an empty JSON object. Synchronous chat
+completions take --chat-delay seconds, to stand in for the LLM's latency in
+load tests (see benchmarks/serving_bench.py).
+"""
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_files = {}
+_batches = {}
+_lock = threading.RLock()
+_delay = 5.0
+_chat_delay = 0.0
+
+_COUNTS_RE = re.compile(r"\((\d+) easy, (\d+) medium, (\d+) hard\)")
+_LETTERS_RE = re.compile(r'"([A-D])" for (\d+)')
+
+def fake_completion(body):
+    """
+    Builds a chat completion response for a request body.
+    """
+    user_prompt = next((m["content"] for m in body.get("messages", []) if m.get("role") == "user"), "")
+    content = {}
+    counts = _COUNTS_RE.search(user_prompt)
+    if counts:
+        letters = []
+        for letter, count in _LETTERS_RE.findall(user_prompt):
+            letters.extend([letter] * int(count))
+        questions = []
+        for difficulty, count in zip(("easy", "medium", "hard"), map(int, counts.groups())):
+            for _ in range(count):
+                index = len(questions)
+                questions.append({
+                    "passage": "",
+                    "question_text": f"Placeholder {difficulty} question {uuid.uuid4().hex[:8]}",
+                    "options": [{"option": option, "text": f"Option {option}"} for option in "ABCD"],
+                    "correct_answer": letters[index] if index < len(letters) else "ABCD"[index % 4],
+                    "explanation": "Generated by the batch stub server.",
+                    "difficulty": difficulty
+                })
+        content = {"questions": questions}
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(content)},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": len(user_prompt) // 4, "completion_tokens": 100, "total_tokens": len(user_prompt) // 4 + 100}
+    }
+
+def add_file(content, filename, purpose):
+    file_id = f"file-{uuid.uuid4().hex}"
+    with _lock:
+        _files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "content": content
+        }
+    return file_id
+
+def batch_view(batch):
+    """
+    Returns the batch object, producing the output file once the batch is due.
+    """
+    with _lock:
+        if batch["status"] == "in_progress" and time.time() >= batch["created_at"] + _delay:
+            lines = []
+            for line in _files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                lines.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": fake_completion(request["body"])},
+                    "error": None
+                }))
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+            batch["request_counts"] = {"total": len(lines), "completed": len(lines), "failed": 0}
+            batch["output_file_id"] = add_file("\n".join(lines).encode("utf-8"), "batch_output.jsonl", "batch_output")
+    return batch
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        body = self._read_body()
+
+        if self.path == "/v1/files":
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+            )
+            fields = {}
+            filename = "upload.jsonl"
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                if part.get_filename():
+                    filename = part.get_filename()
+                fields[name] = part.get_payload(decode=True)
+            file_id = add_file(fields.get("file", b""), filename, (fields.get("purpose") or b"batch").decode("utf-8"))
+            file_object = {key: value for key, value in _files[file_id].items() if key != "content"}
+            return self._send_json(200, file_object)
+
+        if self.path == "/v1/batches":
+            request = json.loads(body)
+            if request.get("input_file_id") not in _files:
+                return self._send_json(404, {"error": {"message": "Input file not found"}})
+            batch_id = f"batch_{uuid.uuid4().hex}"
+            batch = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request.get("endpoint"),
+                "input_file_id": request["input_file_id"],
+                "completion_window": request.get("completion_window", "24h"),
+                "status": "in_progress",
+                "output_file_id": None,
+                "error_file_id": None,
+                "created_at": int(time.time()),
+                "request_counts": {"total": 0, "completed": 0, "failed": 0}
+            }
+            with _lock:
+                _batches[batch_id] = batch
+            return self._send_json(200, batch)
+
+        if self.path == "/v1/chat/completions":
+            time.sleep(_chat_delay)
+            return self._send_json(200, fake_completion(json.loads(body)))
+
+        self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+        if match:
+            batch = _batches.get(match.group(1))
+            if batch is None:
+                return self._send_json(404, {"error": {"message": "Batch not found"}})
+            return self._send_json(200, batch_view(batch))
+
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+        if match:
+            file = _files.get(match.group(1))
+            if file is None:
+                return self._send_json(404, {"error": {"message": "File not found"}})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(file["content"])))
+            self.end_headers()
+            self.wfile.write(file["content"])
+            return
+
+        self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI batch endpoints")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=5.0, help="Seconds until a batch completes")
+    parser.add_argument("--chat-delay", type=float, default=0.0, help="Seconds each chat completion takes")
+    args = parser.parse_args()
+    _delay = args.delay
+    _chat_delay = args.chat_delay
+
+    print(f"Batch stub server listening on http://localhost:{args.port}/v1")
+    ThreadingHTTPServer(("", args.port), StubHandler).serve_forever()
@@ -0,0 +1,97 @@
+"""
+Benchmark of the local JSON repair against a corpus of malformed LLM outputs.
+
+Usage:
+    python benchmarks/json_repair/run.py [corpus directory ...]
+
+corpus.jsonl holds one case per line with the malformed "text", the "defects"
+it contains and the "expected" parsed value. Directories given as arguments,
+such as the JSON_REPAIR_CORPUS_DIR where quiz generation saves responses it
+could not repair, add one case per .txt file without an expected value.
+
+A case counts as repaired when loads_tolerant parses it (and matches the
+expected value, if any); every other case would need the LLM repair call.
+"""
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.json_repair import loads_tolerant
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "corpus.jsonl")
+
+def load_cases(directories):
+    """
+    Loads the bundled corpus and the .txt files of the given directories.
+    """
+    cases = []
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                cases.append(json.loads(line))
+
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".txt"):
+                with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                    cases.append({"name": name, "defects": ["captured"], "text": f.read()})
+    return cases
+
+def run_case(case):
+    """
+    Returns (outcome, seconds) of repairing one case.
+    """
+    try:
+        json.loads(case["text"])
+        return "valid", 0.0
+    except ValueError:
+        pass
+
+    start = time.perf_counter()
+    try:
+        value = loads_tolerant(case["text"])
+    except ValueError:
+        return "failed", time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+
+    if "expected" in case and value != case["expected"]:
+        return "wrong", elapsed
+    return "repaired", elapsed
+
+def main(directories):
+    cases = load_cases(directories)
+    totals = {"valid": 0, "repaired": 0, "wrong": 0, "failed": 0}
+    by_defect = {}
+    timings = []
+
+    for case in cases:
+        outcome, elapsed = run_case(case)
+        totals[outcome] += 1
+        if outcome != "valid":
+            timings.append(elapsed)
+        for defect in case.get("defects") or ["none"]:
+            counts = by_defect.setdefault(defect, {"repaired": 0, "total": 0})
+            counts["total"] += 1
+            counts["repaired"] += outcome in ("valid", "repaired")
+        if outcome in ("wrong", "failed"):
+            print(f"{outcome.upper()}: {case['name']}")
+
+    malformed = len(cases) - totals["valid"]
+    print(f"\nCases: {len(cases)} ({malformed} malformed)")
+    print(f"Repaired locally: {totals['repaired']}/{malformed}")
+    print(f"Repaired with a different value: {totals['wrong']}")
+    print(f"Needing the LLM repair call: {totals['failed']}")
+    if timings:
+        print(f"Repair time: mean {1000 * sum(timings) / len(timings):.3f} ms, max {1000 * max(timings):.3f} ms")
+
+    print("\nBy defect:")
+    for defect, counts in sorted(by_defect.items()):
+        print(f"  {defect:<20} {counts['repaired']}/{counts['total']}")
+
+    return 0 if totals["wrong"] == 0 and totals["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,107 @@
+"""
+Load benchmark of the API server: sends concurrent requests to one endpoint
+and reports throughput and latency.
+
+Usage:
+    python benchmarks/serving_bench.py --url https://localhost:5003/api/quiz/generate \\
+        --body '{"exam_id": "<test exam>", "num_questions": 5}' --concurrency 50 --requests 200 --insecure
+
+To compare serving profiles without paying for LLM calls, point the server at
+the local stand-in, which answers chat completions after a fixed delay:
+
+    python batch_stub_server.py --port 8089 --chat-delay 5
+    OPENAI_BASE_URL=http://localhost:8089/v1 python app.py
+    OPENAI_BASE_URL=http://localhost:8089/v1 gunicorn -c gunicorn.conf.py wsgi:app
+
+and run the same benchmark against each. With the LLM latency fixed, the
+throughput shows how many generations the server keeps in flight at once.
+"""
+import ssl
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+def send(url, method, body, timeout, context):
+    """
+    Sends one request and returns (status, seconds); status is None on a connection error.
+    """
+    request = urllib.request.Request(url, data=body, method=method, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout, context=context) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = None
+    return status, time.perf_counter() - start
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(url, method, body, concurrency, total, timeout, context):
+    """
+    Sends total requests with at most concurrency in flight.
+
+    Returns:
+        dict: Wall time, status counts and latencies of successful requests
+    """
+    statuses = Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def task(_):
+        status, seconds = send(url, method, body, timeout, context)
+        with lock:
+            statuses[status or "error"] += 1
+            if status is not None and status < 400:
+                latencies.append(seconds)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(task, range(total)))
+    return {"seconds": time.perf_counter() - start, "statuses": statuses, "latencies": latencies}
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark of the API server")
+    parser.add_argument("--url", required=True, help="Endpoint to call")
+    parser.add_argument("--method", default="POST")
+    parser.add_argument("--body", default=None, help="JSON body, or @path to a file with it")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight at the same time")
+    parser.add_argument("--requests", type=int, default=100, help="Total number of requests")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds before a request is given up")
+    parser.add_argument("--insecure", action="store_true", help="Accept self-signed certificates")
+    args = parser.parse_args()
+
+    body = None
+    if args.body:
+        if args.body.startswith("@"):
+            with open(args.body[1:], "r", encoding="utf-8") as f:
+                body = f.read()
+        else:
+            body = args.body
+        body = json.dumps(json.loads(body)).encode("utf-8")
+
+    context = ssl._create_unverified_context() if args.insecure else None
+    result = run(args.url, args.method.upper(), body, args.concurrency, args.requests, args.timeout, context)
+
+    latencies = result["latencies"]
+    print(f"{args.method.upper()} {args.url}")
+    print(f"Concurrency {args.concurrency}, {args.requests} requests in {result['seconds']:.1f}s")
+    print(f"Throughput: {args.requests / result['seconds']:.2f} requests/s")
+    print("Statuses: " + ", ".join(f"{status}: {count}" for status, count in sorted(result["statuses"].items(), key=str)))
+    if latencies:
+        print(f"Latency of successful requests (s): p50 {percentile(latencies, 0.5):.2f}, "
+              f"p95 {percentile(latencies, 0.95):.2f}, p99 {percentile(latencies, 0.99):.2f}, max {max(latencies):.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Gunicorn settings of the production server, see wsgi.py.
+
+Requests spend most of their time waiting for Perplexity and the LLM, so each
+worker process serves many requests on threads (gthread) and the number of
+processes only needs to follow the CPU count.
+"""
+import os
+import multiprocessing
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5003')
+
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', str(max(2, multiprocessing.cpu_count()))))
+# Concurrent requests per worker; a plan generation holds its thread for minutes
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+# Import the app once in the master and fork it into the workers
+preload_app = True
+
+# Recycle workers now and then to bound memory growth; the jitter keeps them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# gthread workers keep sending heartbeats while requests run, so this only catches hung workers
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# Time a stopping worker gets to finish its requests and background jobs
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '300'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# TLS is best terminated by a reverse proxy; the certificates are only used when they are configured
+certfile = os.getenv('SSL_CERT_PATH') or None
+keyfile = os.getenv('SSL_KEY_PATH') or None
+
+accesslog = '-'
+errorlog = '-'
+
+# Seconds a stopping worker waits for its running background jobs, within graceful_timeout
+JOB_DRAIN_TIMEOUT = float(os.getenv('JOB_DRAIN_TIMEOUT', str(max(0, graceful_timeout - 30))))
+
+def post_fork(server, worker):
+    # Threads do not survive a fork, so each worker starts its own job worker
+    if os.getenv('JOB_WORKER_EMBEDDED', '1') == '1':
+        from app.services.job_worker import start_embedded_worker
+        worker.job_worker = start_embedded_worker()
+
+def worker_exit(server, worker):
+    job_worker = getattr(worker, 'job_worker', None)
+    if job_worker is None:
+        return
+    server.log.info("Worker %s draining background jobs", worker.pid)
+    if not job_worker.drain(JOB_DRAIN_TIMEOUT):
+        server.log.warning("Worker %s exiting with background jobs still running; they will be retried", worker.pid)
@@ -0,0 +1,59 @@
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from app.models import db
+
+class FakeQuery:
+    def __init__(self, calls, fail):
+        self.calls = calls
+        self.fail = fail
+        self.rows = None
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    upsert = insert
+
+    def execute(self):
+        self.calls.append(list(self.rows))
+        error = self.fail(self.rows)
+        if error:
+            raise error
+        return type("Response", (), {"data": list(self.rows)})()
+
+@pytest.fixture
+def calls():
+    return []
+
+def use_fake(monkeypatch, calls, fail):
+    monkeypatch.setattr(db, "table", lambda name: FakeQuery(calls, fail))
+
+def test_bisects_on_data_errors(monkeypatch, calls):
+    bad = {"id": 3}
+    constraint = APIError({"code": "23505", "message": "duplicate key"})
+    use_fake(monkeypatch, calls, lambda rows: constraint if bad in rows else None)
+
+    result = db.bulk_insert("questions", [{"id": i} for i in range(8)])
+
+    assert [f["row"] for f in result.failed] == [bad]
+    assert result.written_count == 7
+    assert result.round_trips == len(calls) > 1
+
+def test_does_not_retry_after_a_timeout(monkeypatch, calls):
+    use_fake(monkeypatch, calls, lambda rows: httpx.ReadTimeout("timed out"))
+
+    result = db.bulk_insert("questions", [{"id": i} for i in range(8)], chunk_size=4)
+
+    assert len(result.failed) == 8
+    assert result.round_trips == 2
+
+def test_does_not_bisect_on_server_or_auth_errors(monkeypatch, calls):
+    denied = APIError({"code": "42501", "message": "permission denied"})
+    use_fake(monkeypatch, calls, lambda rows: denied)
+
+    result = db.bulk_insert("questions", [{"id": i} for i in range(8)])
+
+    assert len(result.failed) == 8
+    assert result.round_trips == 1
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from app.utils.cache import SQLiteCache
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_sqlite_cache_reconnects_in_forked_child(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    cache.set("key", {"value": 1})
+    parent_conn = cache._connect()
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        ok = cache._connect() is not parent_conn and cache.get("key") == {"value": 1}
+        cache.set("child", True)
+        os.write(write, b"1" if ok else b"0")
+        os._exit(0)
+
+    os.close(write)
+    assert os.read(read, 1) == b"1"
+    os.waitpid(pid, 0)
+    assert cache._connect() is parent_conn
+    assert cache.get("child") is True
@@ -0,0 +1,14 @@
+from app.services.job_queue import JobQueue
+
+def test_worker_capacity_sums_live_workers(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    assert queue.worker_capacity() == 0
+
+    queue.register_worker("api-1", 2)
+    queue.register_worker("worker-1", 3)
+    queue.register_worker("worker-1", 4)
+    assert queue.worker_capacity() == 6
+
+    queue.unregister_worker("api-1")
+    assert queue.worker_capacity() == 4
+    assert queue.worker_capacity(max_age=-1) == 0
@@ -0,0 +1,41 @@
+import json
+import os
+
+import pytest
+
+from app.utils.json_repair import loads_tolerant, repair_json
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "json_repair", "corpus.jsonl")
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+@pytest.mark.parametrize("case", load_corpus(), ids=lambda case: case["name"])
+def test_corpus_is_repaired(case):
+    assert loads_tolerant(case["text"]) == case["expected"]
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('Here is the quiz:\n{"a": 1}\nAnything else?', {"a": 1}),
+    ('{"a": [1, 2,],}', {"a": [1, 2]}),
+    ('{"a": "say "hi" now", "b": 1}', {"a": 'say "hi" now', "b": 1}),
+    ('{"q": [1, 2', {"q": [1, 2]}),
+    ('{"a": "unterminated', {"a": "unterminated"}),
+    ('{"a": 1, // note\n "b": 2}', {"a": 1, "b": 2}),
+    ('/* header */ [1, 2,]', [1, 2]),
+    ("{'a': 'x'}", {"a": "x"}),
+    ('{a: 1, b_2: "y"}', {"a": 1, "b_2": "y"}),
+    ('{"a": [1, 2}', {"a": [1, 2]}),
+])
+def test_defects_are_repaired(text, expected):
+    assert loads_tolerant(text) == expected
+
+def test_valid_json_is_parsed_unchanged():
+    text = '{"a": "// not a comment", "b": [1, {"c": null}]}'
+    assert loads_tolerant(text) == json.loads(text)
+    assert json.loads(repair_json(text)) == json.loads(text)
+
+def test_unrepairable_text_raises():
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant("no json here")
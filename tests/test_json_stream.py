@@ -0,0 +1,39 @@
+import json
+
+from app.utils.json_stream import JsonArrayStream
+
+PLAN = {
+    "overview": 'Mentions "day_topics": [ in a string',
+    "day_topics": [{"day_num": i, "topics_for_the_day": 'Topic ]}" ' + str(i)} for i in range(1, 6)],
+    "notes": [{"day_num": 99}],
+}
+
+def feed_in_chunks(text, size):
+    stream = JsonArrayStream("day_topics")
+    elements = []
+    for start in range(0, len(text), size):
+        elements.extend(stream.feed(text[start:start + size]))
+    return stream, elements
+
+def test_elements_are_returned_for_any_chunking():
+    text = json.dumps(PLAN)
+    for size in (1, 2, 7, 64, len(text)):
+        stream, elements = feed_in_chunks(text, size)
+        assert elements == PLAN["day_topics"]
+        assert stream.done
+        assert stream.text == text
+
+def test_element_is_returned_as_soon_as_it_closes():
+    stream = JsonArrayStream("day_topics")
+    assert stream.feed('{"day_topics": [{"day_num": 1}') == [{"day_num": 1}]
+    assert stream.feed(', {"day_num": 2') == []
+    assert stream.feed('}]}') == [{"day_num": 2}]
+
+def test_malformed_element_is_repaired():
+    stream = JsonArrayStream("day_topics")
+    assert stream.feed('{"day_topics": [{"day_num": 1,}, {"day_num": 2,}]}') == [{"day_num": 1}, {"day_num": 2}]
+
+def test_other_keys_are_ignored():
+    stream, elements = feed_in_chunks(json.dumps({"other": [{"a": 1}], "day_topics": []}), 3)
+    assert elements == []
+    assert stream.done
@@ -0,0 +1,76 @@
+import pytest
+
+from app.utils.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ListParams, PaginationError,
+    decode_cursor, encode_cursor, fetch_page, parse_list_params
+)
+
+class FakeQuery:
+    """Records the PostgREST calls of fetch_page and serves rows ordered by id."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.after = None
+        self.count = None
+
+    def gt(self, column, value):
+        self.after = value
+        return self
+
+    def order(self, column):
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def execute(self):
+        rows = sorted(self.rows, key=lambda row: row["id"])
+        if self.after is not None:
+            rows = [row for row in rows if row["id"] > self.after]
+        return type("Result", (), {"data": rows[:self.count]})()
+
+@pytest.mark.parametrize("value", ["3f2a", 42, "ümlaut/+="])
+def test_cursor_round_trip(value):
+    cursor = encode_cursor(value)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == value
+
+@pytest.mark.parametrize("cursor", ["not base64!", "e30", "bm9wZQ"])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(PaginationError):
+        decode_cursor(cursor)
+
+def test_defaults_select_the_listed_columns():
+    params = parse_list_params({}, ("title", "id", "exam_date"))
+    assert params == ListParams(limit=DEFAULT_PAGE_SIZE, columns="id,title,exam_date", after=None)
+
+@pytest.mark.parametrize("limit", ["0", str(MAX_PAGE_SIZE + 1), "ten"])
+def test_invalid_limit_is_rejected(limit):
+    with pytest.raises(PaginationError):
+        parse_list_params({"limit": limit}, ("id",))
+
+def test_fields_always_include_the_cursor_column():
+    params = parse_list_params({"fields": "title, title,exam_date"}, ("id", "title", "exam_date"))
+    assert params.columns == "id,title,exam_date"
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(PaginationError):
+        parse_list_params({"fields": "title,secret"}, ("id", "title"))
+
+def test_pages_cover_every_row_once():
+    rows = [{"id": f"{i:03d}"} for i in range(7)]
+    seen = []
+    cursor = None
+    while True:
+        args = {"limit": "3", **({"cursor": cursor} if cursor else {})}
+        page, cursor = fetch_page(FakeQuery(rows), parse_list_params(args, ("id",)))
+        seen.extend(row["id"] for row in page)
+        if cursor is None:
+            break
+    assert seen == [row["id"] for row in rows]
+
+def test_last_full_page_has_no_cursor():
+    page, cursor = fetch_page(FakeQuery([{"id": "a"}, {"id": "b"}]), ListParams(limit=2, columns="*"))
+    assert len(page) == 2
+    assert cursor is None
@@ -0,0 +1,19 @@
+import pytest
+
+from app import create_app
+from app.services.quiz_generation_service import QUIZ_MAX_QUESTIONS, parse_num_questions
+
+@pytest.mark.parametrize("value, expected", [(10, 10), ("10", 10), (" 7 ", 7), (10.0, 10)])
+def test_valid_counts(value, expected):
+    assert parse_num_questions(value) == expected
+
+@pytest.mark.parametrize("value", [0, -1, QUIZ_MAX_QUESTIONS + 1, "ten", None, True, 2.5])
+def test_invalid_counts(value):
+    with pytest.raises(ValueError):
+        parse_num_questions(value)
+
+def test_generate_rejects_bad_count_before_any_work():
+    client = create_app(start_job_worker=False).test_client()
+    response = client.post('/api/quiz/generate', json={"exam_id": "e1", "num_questions": "many"})
+    assert response.status_code == 400
+    assert "num_questions" in response.get_json()["error"]
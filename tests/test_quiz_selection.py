@@ -0,0 +1,69 @@
+import copy
+
+from app.services.quiz_generation_service import (
+    ANSWER_LETTERS, balance_answers, fill_difficulty, plan_shards, select_questions
+)
+
+def make_question(text, correct="A", difficulty="easy", explanation="Because."):
+    return {
+        "question_text": text,
+        "options": [{"option": letter, "text": f"{text} {letter}"} for letter in ANSWER_LETTERS],
+        "correct_answer": correct,
+        "explanation": explanation,
+        "difficulty": difficulty,
+    }
+
+def correct_text(question):
+    return next(option["text"] for option in question["options"] if option["option"] == question["correct_answer"])
+
+def test_select_drops_duplicates_and_caps_difficulties():
+    questions = [
+        make_question("Q1"), make_question(" q1 "), make_question("Q2"),
+        make_question("Q3"), make_question("Q4", difficulty="Hard"),
+    ]
+    selected = select_questions(questions, {"easy": 2, "hard": 1})
+    assert [question["question_text"] for question in selected] == ["Q1", "Q2", "Q4"]
+
+def test_select_drops_difficulties_not_asked_for():
+    assert select_questions([make_question("Q1", difficulty="medium")], {"easy": 1}) == []
+
+def test_fill_difficulty_uses_the_requested_difficulty():
+    questions = [make_question("Q1", difficulty=None), make_question("Q2", difficulty="")]
+    fill_difficulty(questions, {"medium": 2})
+    assert len(select_questions(questions, {"medium": 2})) == 2
+
+def test_fill_difficulty_fills_the_largest_gap_first():
+    questions = [make_question("Q1", difficulty="hard"), make_question("Q2", difficulty="unknown"), make_question("Q3", difficulty=None)]
+    fill_difficulty(questions, {"easy": 1, "hard": 2})
+    assert sorted(question["difficulty"] for question in questions) == ["easy", "hard", "hard"]
+
+def test_balance_spreads_correct_answers_and_keeps_them_correct():
+    questions = [make_question(f"Q{i}", correct="A") for i in range(8)]
+    expected = [correct_text(question) for question in questions]
+    balance_answers(questions)
+    letters = [question["correct_answer"] for question in questions]
+    assert {letter: letters.count(letter) for letter in ANSWER_LETTERS} == {letter: 2 for letter in ANSWER_LETTERS}
+    assert [correct_text(question) for question in questions] == expected
+
+def test_balance_leaves_explanations_naming_a_letter():
+    questions = [make_question(f"Q{i}", correct="A", explanation="A is correct because it is first.") for i in range(4)]
+    original = copy.deepcopy(questions)
+    balance_answers(questions)
+    assert questions == original
+
+def test_balance_skips_questions_without_lettered_options():
+    question = {"question_text": "Q", "options": ["A) x", "B) y"], "correct_answer": "A"}
+    original = copy.deepcopy(question)
+    balance_answers([question])
+    assert question == original
+
+def test_shards_cover_the_distribution():
+    shards = plan_shards({"easy": 20, "medium": 20, "hard": 40}, shard_size=20, max_shards=8)
+    assert len(shards) == 4
+    totals = {}
+    for shard in shards:
+        assert sum(shard["distribution"].values()) <= 20
+        assert sum(shard["answer_letters"].values()) == sum(shard["distribution"].values())
+        for difficulty, count in shard["distribution"].items():
+            totals[difficulty] = totals.get(difficulty, 0) + count
+    assert totals == {"easy": 20, "medium": 20, "hard": 40}
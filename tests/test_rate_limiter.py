@@ -0,0 +1,81 @@
+import pytest
+
+from app.services import rate_limiter
+from app.services.rate_limiter import CircuitBreaker, CircuitOpenError, call_with_retry
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse(status_code, headers)
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    rate_limiter._reset_state()
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda seconds: None)
+    yield
+    rate_limiter._reset_state()
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_breaker_opens_after_threshold_and_rejects_calls():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    open_breaker(breaker)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_half_open_trial_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0)
+    open_breaker(breaker)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_half_open_trial_rate_limited_recovers():
+    breaker = rate_limiter.get_breaker("openai", "test-model")
+    breaker.reset_timeout = 0
+    open_breaker(breaker)
+
+    calls = []
+    def func():
+        calls.append(breaker.state)
+        if len(calls) == 1:
+            raise FakeAPIError(429, {"retry-after": "0"})
+        return "ok"
+
+    assert call_with_retry("openai", "test-model", func, max_attempts=3) == "ok"
+    # The trial got a 429 and its own retry was still let through
+    assert calls == [CircuitBreaker.HALF_OPEN, CircuitBreaker.CLOSED]
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+def test_non_retryable_error_is_raised_at_once():
+    calls = []
+    def func():
+        calls.append(1)
+        raise FakeAPIError(400)
+
+    with pytest.raises(FakeAPIError):
+        call_with_retry("openai", "test-model", func, max_attempts=3)
+    assert len(calls) == 1
+    assert rate_limiter.get_breaker("openai", "test-model").state == CircuitBreaker.CLOSED
+
+def test_server_errors_are_retried_until_success():
+    calls = []
+    def func():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeAPIError(503)
+        return "ok"
+
+    assert call_with_retry("openai", "test-model", func, max_attempts=5) == "ok"
+    assert len(calls) == 3
@@ -0,0 +1,9 @@
+from dotenv import load_dotenv
+
+# Load environment variables before the services read their configuration
+load_dotenv()
+
+from app.services.job_worker import run_worker_processes
+
+if __name__ == '__main__':
+    run_worker_processes()
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is created without a job worker; gunicorn.conf.py starts one in each
+gunicorn worker process after the fork, so no threads are started in the
+preloading master process.
+"""
+from app import create_app
+
+app = create_app(start_job_worker=False)